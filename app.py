@@ -1,126 +1,215 @@
+import argparse
 import cv2
-import torch
 import time
-from datetime import datetime
-from ultralytics import YOLO
-from facenet_pytorch import InceptionResnetV1
 
+from model_registry import get_facenet, get_yolo
+from preprocessing import embed_faces
+from face_tracker import FaceTracker
+from face_quality import score_faces
+from pipeline import AttendancePipeline, format_stats
+from motion_gate import MotionGate, boxes_outside
+from detection import AdaptiveDetectionController, detector_stats, get_detector
+from session_checkin import SessionCheckin, STATUS_OK, STATUS_WRONG_CLASS
+from schedule_service import ScheduleService
 from scripts.recognize import recognize
-# Import đầy đủ các hàm service
-from attendance_service import (
-    da_diem_danh, 
-    ghi_diem_danh, 
-    get_current_active_session, 
-    is_student_enrolled
-)
+
+# ================== CONFIG ==================
+CONF_THRESHOLD = 0.5
+SESSION_CHECK_INTERVAL = 5
+STATS_INTERVAL = 5
+IDLE_INTERVAL = 0.5     # giây giữa hai frame khi không có buổi học
+
+parser = argparse.ArgumentParser(description="Smart Attendance kiosk")
+parser.add_argument("--source", default="0", help="Camera index, RTSP URL hoặc file video")
+parser.add_argument("--headless", action="store_true", help="Không mở cửa sổ imshow")
+parser.add_argument("--target-ms", type=float, default=80.0, help="Latency detection mục tiêu mỗi frame")
+args = parser.parse_args()
 
 # ================== LOAD MODELS ==================
-yolo = YOLO("yolov8n-face.pt")
-facenet = InceptionResnetV1(pretrained="vggface2").eval()
+yolo = get_yolo("yolov8n-face.pt")
+facenet = get_facenet()
+detector = get_detector("kiosk", yolo)
 
-# ================== CAMERA ==================
-cap = cv2.VideoCapture(0)
+# Trạng thái buổi học hiện tại (chỉ dùng trong sink thread)
+# Lịch học trong bộ nhớ: tra buổi học hiện tại không cần query DB mỗi lần refresh
+schedule = ScheduleService()
+schedule.start()
+checkin = SessionCheckin(refresh_interval=SESSION_CHECK_INTERVAL, schedule=schedule)
 
-# ================== CONFIG ==================
-CONF_THRESHOLD = 0.5
+# Tracker: tái sử dụng identity theo track thay vì embed mọi frame
+tracker = FaceTracker(retry_frames=10)
 
-# Biến lưu trạng thái buổi học hiện tại
-current_session = None
-last_check_time = 0
-checked_students = set()
+# Motion gate: bỏ qua YOLO khi cảnh không đổi
+motion_gate = MotionGate()
+last_boxes = []
 
-print("=== START SMART ATTENDANCE ===")
+# Controller: tự giảm / tăng imgsz và frame stride để giữ latency mục tiêu
+detect_controller = AdaptiveDetectionController(target_ms=args.target_ms)
+facenet_calls = 0
+quality_skips = {}      # crop bị bỏ qua trước FaceNet, theo lý do
+facenet_rate = 0.0
+rate_window_start = time.time()
+
+# ================== STAGE: DETECT ==================
+def run_yolo(image, offset=(0, 0)):
+    # imgsz do controller chọn, latency được ghi nhận để điều chỉnh
+    ox, oy = offset
+    boxes = detect_controller.timed(detector.detect, image)
+    return [(x1 + ox, y1 + oy, x2 + ox, y2 + oy) for x1, y1, x2, y2 in boxes]
+
+def detect_stage(packet):
+    global last_boxes
+
+    # Idle mode: không có buổi học -> bỏ detection, giảm tốc độ xử lý
+    if checkin.current_session is None:
+        motion_gate.reset()
+        last_boxes = []
+        if pipeline.realtime:
+            time.sleep(IDLE_INTERVAL)
+        return packet
+
+    # Frame stride (controller tăng khi CPU quá tải) -> dùng lại box cũ
+    if not detect_controller.should_detect(packet.frame_id):
+        packet.boxes = list(last_boxes)
+        return packet
+
+    # Motion gate: cảnh tĩnh -> dùng lại box cũ, thay đổi cục bộ -> chỉ detect ROI
+    mode, roi = motion_gate.check(packet.frame)
+
+    if mode == "skip":
+        packet.boxes = list(last_boxes)
+    elif mode == "roi":
+        x1, y1, x2, y2 = roi
+        packet.boxes = boxes_outside(last_boxes, roi) + run_yolo(packet.frame[y1:y2, x1:x2], (x1, y1))
+    else:
+        packet.boxes = run_yolo(packet.frame)
+
+    last_boxes = packet.boxes
+    return packet
+
+# ================== STAGE: EMBED + MATCH ==================
+def embed_stage(packet):
+    global facenet_calls
+
+    # Chấm chất lượng crop; score dùng làm quality của track (crop đẹp hơn -> embed lại)
+    frame = packet.frame
+    crops = [frame[b[1]:b[3], b[0]:b[2]] for b in packet.boxes]
+    qualities = score_faces(crops)
+
+    # Gán track ID, chỉ embed track mới / chưa nhận diện lâu / crop đẹp hơn và đạt ngưỡng
+    packet.tracks = tracker.update(packet.boxes, [q.score for q in qualities])
+    pending = []
+    for track, crop, quality in zip(packet.tracks, crops, qualities):
+        if not tracker.needs_embedding(track):
+            continue
+        if quality.ok:
+            pending.append((track, crop))
+        else:
+            quality_skips[quality.reason] = quality_skips.get(quality.reason, 0) + 1
 
-while True:
-    ret, frame = cap.read()
-    if not ret: break
-
-    # --- LOGIC 1: TỰ ĐỘNG CHECK BUỔI HỌC (MỖI 5 GIÂY) ---
-    if time.time() - last_check_time > 5:
-        session_info = get_current_active_session()
-        
-        # Nếu phát hiện chuyển đổi phiên (có lớp mới hoặc hết lớp cũ)
-        if session_info != current_session:
-            current_session = session_info
-            checked_students.clear() # Reset danh sách đã điểm danh
-            
-            if current_session:
-                print(f"--> ĐANG HỌC: {current_session['MaLHP']} (ID: {current_session['MaBuoi']})")
+    if pending:
+        faces = [crop for _, crop in pending]
+        pending = [track for track, _ in pending]
+        embeddings = embed_faces(facenet, faces)
+        facenet_calls += len(pending)
+
+        for track, emb in zip(pending, embeddings):
+            name, score = recognize(emb.reshape(1, -1))
+            if score >= CONF_THRESHOLD and name != "Unknown":
+                tracker.mark_embedded(track, name, score)
             else:
-                print("--> HIỆN TẠI KHÔNG CÓ LỊCH HỌC")
-        
-        last_check_time = time.time()
+                tracker.mark_embedded(track, None, score)
+
+    return packet
+
+# ================== STAGE: CHECK-IN SINK ==================
+def checkin_stage(packet):
+    global facenet_calls, facenet_rate, rate_window_start
 
-    # --- LOGIC 2: HIỂN THỊ THÔNG TIN LÊN MÀN HÌNH ---
+    checkin.refresh()
+    current_session = checkin.current_session
+    frame = packet.frame
+
+    # --- HIỂN THỊ THÔNG TIN LÊN MÀN HÌNH ---
     if not current_session:
-        cv2.putText(frame, "KHONG CO LICH HOC", (50, 50), 
+        cv2.putText(frame, "KHONG CO LICH HOC", (50, 50),
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        cv2.imshow("Smart Attendance AI", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'): break
-        continue
-    else:
-        info = f"Lop: {current_session['MaLHP']} | ID: {current_session['MaBuoi']}"
-        cv2.putText(frame, info, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
-
-    # --- LOGIC 3: NHẬN DIỆN ---
-    results = yolo(frame, conf=0.5, verbose=False)
-
-    if len(results) > 0:
-        for box in results[0].boxes.xyxy:
-            x1, y1, x2, y2 = map(int, box)
-            
-            face_img = frame[y1:y2, x1:x2]
-            if face_img.size == 0: continue
-            
-            # Preprocess cho FaceNet
-            try:
-                face_rez = cv2.resize(face_img, (160, 160))
-                face_t = torch.tensor(face_rez).permute(2, 0, 1).unsqueeze(0).float() / 255.0
-                
-                with torch.no_grad():
-                    emb = facenet(face_t).cpu().numpy()
-                
-                # Gọi hàm nhận diện của bạn
-                name, score = recognize(emb)
-                
-                if score >= CONF_THRESHOLD and name != "Unknown":
-                    ma_sv = name
-                    
-                    # 1. Check xem SV có thuộc lớp này không?
-                    if is_student_enrolled(ma_sv, current_session['MaLHP']):
-                        
-                        # 2. Check đã điểm danh chưa?
-                        is_checked = False
-                        if ma_sv in checked_students:
-                            is_checked = True
-                        elif da_diem_danh(ma_sv, current_session['MaBuoi']):
-                            checked_students.add(ma_sv)
-                            is_checked = True
-                        
-                        if not is_checked:
-                            # Thực hiện điểm danh
-                            ghi_diem_danh(ma_sv, current_session['MaBuoi'], current_session['GioBatDau'])
-                            checked_students.add(ma_sv)
-                            print(f"[SUCCESS] Điểm danh: {ma_sv}")
-                        
-                        # Vẽ khung XANH (Hợp lệ)
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        cv2.putText(frame, f"{ma_sv} (OK)", (x1, y1-10), 
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-                    else:
-                        # Vẽ khung VÀNG (Sai lớp)
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 255), 2)
-                        cv2.putText(frame, f"{ma_sv} (Wrong Class)", (x1, y1-10), 
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-                else:
-                    # Vẽ khung ĐỎ (Unknown)
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-
-            except Exception as e:
-                pass
-
-    cv2.imshow("Smart Attendance AI", frame)
-    if cv2.waitKey(1) & 0xFF == ord('q'): break
-
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+        return packet
+
+    info = f"Lop: {current_session['MaLHP']} | ID: {current_session['MaBuoi']}"
+    cv2.putText(frame, info, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+
+    # Check lớp + điểm danh (cache theo track)
+    try:
+        packet.events = checkin.process(packet.tracks)
+    except Exception as e:
+        print(f"⚠️ Checkin error: {e}")
+    for ma_sv in packet.events:
+        print(f"[SUCCESS] Điểm danh: {ma_sv}")
+
+    for track in packet.tracks:
+        x1, y1, x2, y2 = track.box
+        if track.status == STATUS_OK:
+            # Vẽ khung XANH (Hợp lệ)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, f"{track.identity} (OK)", (x1, y1-10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+        elif track.status == STATUS_WRONG_CLASS:
+            # Vẽ khung VÀNG (Sai lớp)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 255), 2)
+            cv2.putText(frame, f"{track.identity} (Wrong Class)", (x1, y1-10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
+        else:
+            # Vẽ khung ĐỎ (Unknown)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+
+    # FaceNet calls / giây (cập nhật mỗi 5 giây)
+    if time.time() - rate_window_start > 5:
+        facenet_rate = facenet_calls / (time.time() - rate_window_start)
+        facenet_calls = 0
+        rate_window_start = time.time()
+    cv2.putText(frame, f"FaceNet/s: {facenet_rate:.1f} | Tracks: {len(tracker.tracks)}",
+                (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+
+    return packet
+
+# ================== MAIN LOOP (DISPLAY) ==================
+pipeline = AttendancePipeline(args.source, detect_stage, embed_stage, checkin_stage)
+
+print("=== START SMART ATTENDANCE ===")
+pipeline.start()
+
+last_stats_time = time.time()
+last_shown = None
+
+try:
+    while pipeline.running:
+        if not args.headless:
+            packet = pipeline.latest
+            if packet is not None and packet is not last_shown:
+                cv2.imshow("Smart Attendance AI", packet.frame)
+                last_shown = packet
+            if cv2.waitKey(15) & 0xFF == ord('q'): break
+        else:
+            time.sleep(0.1)
+
+        if time.time() - last_stats_time > STATS_INTERVAL:
+            print(format_stats(pipeline.stats()))
+            print(f"  motion   {motion_gate.stats}")
+            print(f"  control  {detect_controller.stats()}")
+            print(f"  detector {detector_stats()}")
+            print(f"  quality  skipped {quality_skips}")
+            last_stats_time = time.time()
+except KeyboardInterrupt:
+    pass
+finally:
+    pipeline.stop()
+    pipeline.join(timeout=2)
+    print("=== PIPELINE STATS ===")
+    print(format_stats(pipeline.stats()))
+    print(f"  motion   {motion_gate.stats}")
+    print(f"  control  {detect_controller.stats()}")
+    print(f"  detector {detector_stats()}")
+    print(f"  quality  skipped {quality_skips}")
+
+cv2.destroyAllWindows()
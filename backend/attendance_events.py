@@ -0,0 +1,106 @@
+"""
+Pub/sub trong process cho sự kiện điểm danh theo buổi học (feed SSE)
+
+Mỗi buổi học giữ lịch sử gần nhất (ring buffer) để client nối lại bằng
+Last-Event-ID chỉ nhận phần còn thiếu. Event ID có dạng "<epoch>-<seq>":
+epoch đổi mỗi lần khởi động server, nên ID cũ / quá xa -> client nhận lại snapshot.
+
+publish() an toàn khi gọi từ thread bất kỳ (endpoint sync, threadpool, background task).
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+class SessionEvents:
+    def __init__(self, history):
+        self.seq = 0
+        self.history = deque(maxlen=history)    # (seq, event_type, data)
+        self.subscribers = set()                 # (loop, asyncio.Queue)
+
+
+class AttendanceEventBus:
+    def __init__(self, history=500, queue_size=1000):
+        self.epoch = str(int(time.time()))
+        self.history = history
+        self.queue_size = queue_size
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0, "overflow": 0}
+
+    def _session(self, ma_buoi):
+        if ma_buoi not in self._sessions:
+            self._sessions[ma_buoi] = SessionEvents(self.history)
+        return self._sessions[ma_buoi]
+
+    def event_id(self, seq):
+        return f"{self.epoch}-{seq}"
+
+    def last_event_id(self, ma_buoi):
+        with self._lock:
+            return self.event_id(self._session(ma_buoi).seq)
+
+    def publish(self, ma_buoi, event_type, data):
+        with self._lock:
+            session = self._session(ma_buoi)
+            session.seq += 1
+            event = (session.seq, event_type, data)
+            session.history.append(event)
+            subscribers = list(session.subscribers)
+            self.stats["published"] += 1
+
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, event)
+
+    def _deliver(self, queue, event):
+        try:
+            queue.put_nowait(event)
+            self.stats["delivered"] += 1
+        except asyncio.QueueFull:
+            # Client quá chậm: bỏ event, client nối lại bằng Last-Event-ID
+            self.stats["overflow"] += 1
+
+    def subscribe(self, ma_buoi, last_event_id=None):
+        """Đăng ký nhận event (gọi trong event loop).
+
+        Trả về (queue, replay, seq): replay là list event sau last_event_id,
+        hoặc None nếu không thể nối tiếp (cần gửi snapshot); seq là số thứ tự
+        event mới nhất tại thời điểm đăng ký.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            session = self._session(ma_buoi)
+            session.subscribers.add((loop, queue))
+            replay = self._replay(session, last_event_id)
+            return queue, replay, session.seq
+
+    def _replay(self, session, last_event_id):
+        if not last_event_id:
+            return None
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+
+        seq = int(seq)
+        if seq == session.seq:
+            return []
+        if seq > session.seq or not session.history or session.history[0][0] > seq + 1:
+            return None
+        return [e for e in session.history if e[0] > seq]
+
+    def unsubscribe(self, ma_buoi, queue):
+        with self._lock:
+            session = self._sessions.get(ma_buoi)
+            if session:
+                session.subscribers = {s for s in session.subscribers if s[1] is not queue}
+
+    def metrics(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "sessions": len(self._sessions),
+                "subscribers": sum(len(s.subscribers) for s in self._sessions.values()),
+            }
@@ -0,0 +1,205 @@
+"""
+Gallery nén: PCA + product quantization (PQ), tìm kiếm bằng asymmetric distance (ADC)
+
+    - Embedding (đã chuẩn hoá L2) được chiếu PCA xuống `dim` chiều rồi chia thành
+      `subspaces` đoạn; mỗi đoạn lưu bằng index (1 byte khi bits=8) của centroid gần nhất
+    - Query không bị lượng tử hoá: mỗi lần tìm dựng bảng tích vô hướng (subspaces x 2^bits)
+      rồi cộng theo code -> quét N identity chỉ tốn N x subspaces phép tra bảng
+    - Shortlist theo điểm xấp xỉ được chấm lại bằng vector đầy đủ (full.npy, đọc qua
+      memory-map nên chỉ các dòng trong shortlist được đọc từ đĩa)
+
+Kiosk chỉ cần gallery.npz (code + codebook + PCA) nếu chấp nhận điểm xấp xỉ.
+"""
+
+import os
+
+import numpy as np
+
+DEFAULT_DIM = 128
+DEFAULT_SUBSPACES = 16
+DEFAULT_BITS = 8
+DEFAULT_SHORTLIST = 32
+GALLERY_FILE = "gallery.npz"
+FULL_FILE = "full.npy"
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=-1, keepdims=True), 1e-12)
+
+def gallery_rows(face_db):
+    """face_db (MaSV -> (1, 512) hoặc (n, 512)) -> (names lặp theo từng vector, ma trận đã chuẩn hoá)"""
+    names, rows = [], []
+    for name, emb in face_db.items():
+        emb = np.asarray(emb, dtype=np.float32).reshape(-1, 512)
+        names += [name] * len(emb)
+        rows.append(emb)
+    if not rows:
+        return names, np.zeros((0, 512), dtype=np.float32)
+    return names, _normalize(np.vstack(rows))
+
+def _write_atomic(path, write):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+def _kmeans(x, k, iters=20, seed=0):
+    """k-means (L2) đơn giản bằng numpy, trả về centroids (k, d)"""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        dist = (x ** 2).sum(1)[:, None] - 2 * x @ centroids.T + (centroids ** 2).sum(1)[None, :]
+        assign = dist.argmin(1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Cụm rỗng: lấy lại một điểm ngẫu nhiên
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), int(empty.sum()))]
+    return centroids
+
+
+class CompressedGallery:
+    def __init__(self, names, mean, components, codebooks, codes, full=None, source_version=None):
+        self.names = list(names)
+        self.mean = mean                    # (512,)
+        self.components = components        # (dim, 512)
+        self.codebooks = codebooks          # (subspaces, K, dim / subspaces)
+        self.codes = codes                  # (N, subspaces) uint8 / uint16
+        self.full = full                    # (N, 512) float32, thường là memmap
+        self.source_version = source_version
+
+    @property
+    def subspaces(self):
+        return self.codebooks.shape[0]
+
+    # ---------- build ----------
+
+    @classmethod
+    def train(cls, names, matrix, dim=DEFAULT_DIM, subspaces=DEFAULT_SUBSPACES, bits=DEFAULT_BITS):
+        """Học PCA + codebook từ chính gallery (matrix đã chuẩn hoá L2)"""
+        if dim % subspaces:
+            raise ValueError(f"dim ({dim}) phải chia hết cho subspaces ({subspaces})")
+        if len(matrix) < 2:
+            raise ValueError("Cần ít nhất 2 vector để train PCA / PQ")
+
+        mean = matrix.mean(axis=0)
+        _, _, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+        components = np.zeros((dim, matrix.shape[1]), dtype=np.float32)
+        components[:min(dim, len(vt))] = vt[:dim]       # gallery nhỏ hơn dim: chiều thừa = 0
+
+        projected = (matrix - mean) @ components.T
+        k = min(2 ** bits, len(matrix))
+        dsub = dim // subspaces
+        codebooks = np.stack([
+            _kmeans(projected[:, m * dsub:(m + 1) * dsub], k, seed=m) for m in range(subspaces)
+        ]).astype(np.float32)
+
+        gallery = cls(names, mean.astype(np.float32), components, codebooks, None)
+        gallery.codes = gallery.encode(matrix)
+        gallery.full = matrix
+        return gallery
+
+    def encode(self, matrix):
+        """Vector đã chuẩn hoá -> code PQ (N, subspaces)"""
+        projected = (matrix - self.mean) @ self.components.T
+        dsub = self.codebooks.shape[2]
+        dtype = np.uint8 if self.codebooks.shape[1] <= 256 else np.uint16
+        codes = np.empty((len(matrix), self.subspaces), dtype=dtype)
+        for m in range(self.subspaces):
+            sub = projected[:, m * dsub:(m + 1) * dsub]
+            c = self.codebooks[m]
+            dist = (sub ** 2).sum(1)[:, None] - 2 * sub @ c.T + (c ** 2).sum(1)[None, :]
+            codes[:, m] = dist.argmin(1)
+        return codes
+
+    def with_vectors(self, names, matrix, source_version=None):
+        """Gallery mới (identity thêm / bớt) dùng lại PCA + codebook, không train lại"""
+        return CompressedGallery(names, self.mean, self.components, self.codebooks,
+                                 self.encode(matrix), matrix, source_version)
+
+    # ---------- lưu / nạp ----------
+
+    def save(self, directory):
+        """Ghi file tạm rồi rename: worker khác đang memory-map full.npy cũ không bị ghi đè"""
+        os.makedirs(directory, exist_ok=True)
+        if self.full is not None:
+            full = np.ascontiguousarray(self.full, dtype=np.float32)
+            _write_atomic(os.path.join(directory, FULL_FILE), lambda f: np.save(f, full))
+        _write_atomic(os.path.join(directory, GALLERY_FILE), lambda f: np.savez(
+            f, names=np.array(self.names), mean=self.mean, components=self.components,
+            codebooks=self.codebooks, codes=self.codes,
+            source_version=np.array(self.source_version if self.source_version is not None else np.nan)
+        ))
+
+    @classmethod
+    def load(cls, directory, full=True):
+        data = np.load(os.path.join(directory, GALLERY_FILE))
+        full_path = os.path.join(directory, FULL_FILE)
+        vectors = np.load(full_path, mmap_mode="r") if full and os.path.exists(full_path) else None
+        if vectors is not None and len(vectors) != len(data["codes"]):
+            vectors = None      # đọc đúng lúc đang ghi lại, tạm chỉ dùng điểm xấp xỉ
+        version = float(data["source_version"])
+        return cls(data["names"].tolist(), data["mean"], data["components"], data["codebooks"],
+                   data["codes"], vectors, None if np.isnan(version) else version)
+
+    # ---------- tìm kiếm ----------
+
+    def approximate_scores(self, embedding):
+        """Cosine xấp xỉ (ADC) của query với toàn bộ gallery, (N,)"""
+        q = _normalize(embedding).reshape(-1)
+        qp = (self.components @ q).reshape(self.subspaces, -1)
+        table = np.einsum("mkd,md->mk", self.codebooks, qp)            # (subspaces, K)
+        scores = table[np.arange(self.subspaces)[None, :], self.codes].sum(axis=1)
+        return scores + float(q @ self.mean)
+
+    def search(self, embedding, k=5, shortlist=DEFAULT_SHORTLIST, rerank=True):
+        """Top-k [(identity, score)] (mỗi identity một lần), chấm lại bằng vector đầy đủ nếu có"""
+        if not self.names:
+            return []
+        scores = self.approximate_scores(embedding)
+        n = min(max(shortlist, k), len(scores))
+        candidates = np.argpartition(-scores, n - 1)[:n]
+
+        if rerank and self.full is not None:
+            q = _normalize(embedding).reshape(-1)
+            candidates = np.sort(candidates)                # đọc memmap theo thứ tự trên đĩa
+            scores = np.asarray(self.full[candidates]) @ q
+        else:
+            scores = scores[candidates]
+
+        results, seen = [], set()
+        for i in np.argsort(-scores):
+            name = self.names[candidates[i]]
+            if name in seen:
+                continue
+            seen.add(name)
+            results.append((name, float(scores[i])))
+            if len(results) >= k:
+                break
+        return results
+
+    def match(self, embedding, threshold):
+        """(identity hoặc None, score) - cùng kiểu với session_roster.match_gallery"""
+        best = self.search(embedding, k=1)
+        if not best:
+            return None, 0.0
+        name, score = best[0]
+        return (name if score >= threshold else None), score
+
+    def footprint(self):
+        """Số byte từng phần so với gallery float32 đầy đủ"""
+        n = len(self.names)
+        in_memory = self.codes.nbytes + self.codebooks.nbytes + self.components.nbytes + self.mean.nbytes
+        return {
+            "vectors": n,
+            "codes_bytes": int(self.codes.nbytes),
+            "codebooks_bytes": int(self.codebooks.nbytes),
+            "pca_bytes": int(self.components.nbytes + self.mean.nbytes),
+            "in_memory_bytes": int(in_memory),
+            "full_on_disk_bytes": int(n * 512 * 4),
+            "flat_float32_bytes": int(n * 512 * 4),
+            "bytes_per_vector": round(self.codes.nbytes / n, 1) if n else 0,
+        }
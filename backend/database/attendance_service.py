@@ -1,5 +1,10 @@
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 from database.db import get_connection
+from database.student_repo import student_row_to_dict
+
+# Cửa sổ điểm danh quanh giờ bắt đầu buổi học
+SESSION_EARLY_MINUTES = 15
+SESSION_DURATION_MINUTES = 90
 
 
 # =========================
@@ -56,31 +61,241 @@ def da_diem_danh(ma_sv, ma_buoi):
 
 
 # =========================
-# GHI ĐIỂM DANH
+# BUỔI HỌC ĐANG DIỄN RA (CHO KIOSK)
 # =========================
-def ghi_diem_danh(ma_sv, ma_buoi):
+def _session_row_to_dict(row):
+    return {
+        "MaBuoi": row[0],
+        "MaLHP": row[1],
+        "GioBatDau": row[2]
+    }
+
+
+def get_current_active_session():
     conn = get_connection()
     cursor = conn.cursor()
 
-    # Lấy giờ bắt đầu buổi học
+    now = datetime.now()
+    tu_gio = max(now - timedelta(minutes=SESSION_DURATION_MINUTES),
+                 datetime.combine(now.date(), time.min)).time()
+    den_gio = min(now + timedelta(minutes=SESSION_EARLY_MINUTES),
+                  datetime.combine(now.date(), time.max)).time()
+
     cursor.execute("""
-        SELECT GioBatDau
+        SELECT TOP 1 MaBuoi, MaLHP, GioBatDau
+        FROM BuoiHoc
+        WHERE NgayHoc = CAST(GETDATE() AS DATE)
+          AND GioBatDau BETWEEN ? AND ?
+        ORDER BY GioBatDau DESC
+    """, (tu_gio, den_gio))
+
+    row = cursor.fetchone()
+    conn.close()
+    return _session_row_to_dict(row) if row else None
+
+
+def get_session(ma_buoi):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT MaBuoi, MaLHP, GioBatDau
         FROM BuoiHoc
         WHERE MaBuoi = ?
     """, (ma_buoi,))
 
     row = cursor.fetchone()
-    if not row:
+    conn.close()
+    return _session_row_to_dict(row) if row else None
+
+
+# =========================
+# KIỂM TRA SINH VIÊN THUỘC LỚP HỌC PHẦN
+# =========================
+def is_student_enrolled(ma_sv, ma_lhp):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT COUNT(*)
+        FROM DangKyHoc
+        WHERE MaSV = ? AND MaLHP = ?
+    """, (ma_sv, ma_lhp))
+
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count > 0
+
+
+# =========================
+# GHI ĐIỂM DANH
+# =========================
+def ghi_diem_danh(ma_sv, ma_buoi, gio_bat_dau=None):
+    # Lấy giờ bắt đầu buổi học (nếu caller chưa có sẵn)
+    if gio_bat_dau is None:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT GioBatDau
+            FROM BuoiHoc
+            WHERE MaBuoi = ?
+        """, (ma_buoi,))
+
+        row = cursor.fetchone()
+        if not row:
+            conn.close()
+            return {
+                "success": False,
+                "message": "Không tìm thấy buổi học"
+            }
+
+        gio_bat_dau = row[0]
         conn.close()
-        return {
-            "success": False,
-            "message": "Không tìm thấy buổi học"
-        }
 
-    gio_bat_dau: time = row[0]
-    gio_hien_tai = datetime.now().time()
+    # Mọi đường ghi điểm danh dùng chung guard UPDLOCK, HOLDLOCK, nếu không guard không chặn được trùng
+    return ghi_diem_danh_neu_chua_co(ma_sv, ma_buoi, gio_bat_dau)
+
+
+# =========================
+# DANH SÁCH SINH VIÊN ĐĂNG KÝ LỚP HỌC PHẦN
+# =========================
+def get_class_roster(ma_lhp):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT MaSV
+        FROM DangKyHoc
+        WHERE MaLHP = ?
+    """, (ma_lhp,))
+
+    roster = {r[0] for r in cursor.fetchall()}
+    conn.close()
+    return roster
+
+
+# =========================
+# SINH VIÊN ĐÃ ĐIỂM DANH TRONG BUỔI
+# =========================
+def get_checked_in_students(ma_buoi):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT MaSV
+        FROM DiemDanh
+        WHERE MaBuoi = ?
+    """, (ma_buoi,))
+
+    checked = {r[0] for r in cursor.fetchall()}
+    conn.close()
+    return checked
+
+
+# =========================
+# GHI ĐIỂM DANH THEO LÔ, BỎ QUA SINH VIÊN ĐÃ ĐIỂM DANH
+# =========================
+INSERT_CHUNK_ROWS = 400     # 5 tham số / dòng, SQL Server giới hạn 2100 tham số / câu lệnh
+
+def _ghi_diem_danh_chua_co(cursor, rows):
+    """rows: list (ma_sv, ma_buoi, thoi_gian_quet, trang_thai, nguon_quet).
+
+    INSERT ... WHERE NOT EXISTS như ghi_diem_danh_neu_chua_co, theo lô VALUES: không ghi
+    trùng khi chạy song song với kiosk / recognize-checkin (DiemDanh không có unique
+    (MaSV, MaBuoi)). Trả về set MaSV thực sự được ghi (OUTPUT), chưa commit.
+    """
+    inserted = set()
+    for i in range(0, len(rows), INSERT_CHUNK_ROWS):
+        chunk = rows[i:i + INSERT_CHUNK_ROWS]
+        values = ", ".join(["(?, ?, ?, ?, ?)"] * len(chunk))
+        cursor.execute(f"""
+            INSERT INTO DiemDanh (
+                MaSV,
+                MaBuoi,
+                ThoiGianQuet,
+                TrangThai,
+                NguonQuet
+            )
+            OUTPUT inserted.MaSV
+            SELECT v.MaSV, v.MaBuoi, v.ThoiGianQuet, v.TrangThai, v.NguonQuet
+            FROM (VALUES {values}) AS v (MaSV, MaBuoi, ThoiGianQuet, TrangThai, NguonQuet)
+            WHERE NOT EXISTS (
+                SELECT 1 FROM DiemDanh dd WITH (UPDLOCK, HOLDLOCK)
+                WHERE dd.MaSV = v.MaSV AND dd.MaBuoi = v.MaBuoi
+            )
+        """, [value for row in chunk for value in row])
+        inserted.update(r[0] for r in cursor.fetchall())
+    return inserted
+
+def ghi_diem_danh_batch(ma_buoi, records, nguon_quet="Webcam"):
+    """records: list (ma_sv, thoi_gian_quet, trang_thai).
+
+    Bỏ qua sinh viên đã điểm danh, ghi phần còn lại trong một transaction.
+    Trả về list MaSV đã được ghi.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        rows = [(ma_sv, ma_buoi, thoi_gian, trang_thai, nguon_quet) for ma_sv, thoi_gian, trang_thai in records]
+        inserted = _ghi_diem_danh_chua_co(cursor, rows)
+        conn.commit()
+        return [r[0] for r in rows if r[0] in inserted]
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# =========================
+# NGỮ CẢNH BUỔI HỌC: THÔNG TIN BUỔI + SINH VIÊN ĐĂNG KÝ + ĐÃ ĐIỂM DANH
+# =========================
+def get_session_context(ma_buoi):
+    """Một kết nối cho cả ba truy vấn; None nếu không có buổi học"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            SELECT MaBuoi, MaLHP, GioBatDau
+            FROM BuoiHoc
+            WHERE MaBuoi = ?
+        """, (ma_buoi,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        session = _session_row_to_dict(row)
 
-    trang_thai = "Đúng giờ" if gio_hien_tai <= gio_bat_dau else "Trễ"
+        cursor.execute("""
+            SELECT sv.MaSV, sv.HoTen, sv.NgaySinh, sv.GioiTinh, sv.Lop, sv.Khoa, sv.Email, sv.TrangThai
+            FROM DangKyHoc dk
+            JOIN SinhVien sv ON dk.MaSV = sv.MaSV
+            WHERE dk.MaLHP = ?
+        """, (session["MaLHP"],))
+        students = {r[0]: student_row_to_dict(r) for r in cursor.fetchall()}
+
+        cursor.execute("""
+            SELECT MaSV
+            FROM DiemDanh
+            WHERE MaBuoi = ?
+        """, (ma_buoi,))
+        checked = {r[0] for r in cursor.fetchall()}
+
+        return {"session": session, "students": students, "checked": checked}
+    finally:
+        conn.close()
+
+
+# =========================
+# GHI ĐIỂM DANH NẾU CHƯA CÓ (MỘT CÂU LỆNH)
+# =========================
+def ghi_diem_danh_neu_chua_co(ma_sv, ma_buoi, gio_bat_dau, nguon_quet="Webcam"):
+    """Kiểm tra trùng và ghi trong cùng một INSERT ... WHERE NOT EXISTS"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    trang_thai = "Đúng giờ" if datetime.now().time() <= gio_bat_dau else "Trễ"
 
     cursor.execute("""
         INSERT INTO DiemDanh (
@@ -90,18 +305,158 @@ def ghi_diem_danh(ma_sv, ma_buoi):
             TrangThai,
             NguonQuet
         )
-        VALUES (?, ?, GETDATE(), ?, ?)
-    """, (
-        ma_sv,
-        ma_buoi,
-        trang_thai,
-        "Webcam"
-    ))
+        SELECT ?, ?, GETDATE(), ?, ?
+        WHERE NOT EXISTS (
+            SELECT 1 FROM DiemDanh WITH (UPDLOCK, HOLDLOCK) WHERE MaSV = ? AND MaBuoi = ?
+        )
+    """, (ma_sv, ma_buoi, trang_thai, nguon_quet, ma_sv, ma_buoi))
 
+    inserted = cursor.rowcount > 0
     conn.commit()
     conn.close()
 
+    if not inserted:
+        return {
+            "success": False,
+            "message": "Sinh viên đã điểm danh rồi"
+        }
     return {
         "success": True,
         "trang_thai": trang_thai
     }
+
+
+# =========================
+# ĐIỂM DANH HÀNG LOẠT (GIẢNG VIÊN / ẢNH LỚP)
+# =========================
+def diem_danh_hang_loat(ma_buoi, items, nguon_quet):
+    """items: list (ma_sv, trang_thai hoặc None, thoi_gian_quet hoặc None).
+
+    Một truy vấn lấy danh sách lớp + đã điểm danh, ghi các dòng mới trong một
+    transaction bằng _ghi_diem_danh_chua_co (dòng bị lượt quét khác ghi trước
+    -> already_checked_in). Trả về None nếu không có buổi học, ngược lại
+    list kết quả theo thứ tự items: (ma_sv, status, trang_thai) với status là
+    checked_in / already_checked_in / not_enrolled / duplicate.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            SELECT MaLHP, GioBatDau
+            FROM BuoiHoc
+            WHERE MaBuoi = ?
+        """, (ma_buoi,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        ma_lhp, gio_bat_dau = row
+
+        cursor.execute("""
+            SELECT dk.MaSV, dd.MaDiemDanh
+            FROM DangKyHoc dk
+            LEFT JOIN DiemDanh dd ON dd.MaSV = dk.MaSV AND dd.MaBuoi = ?
+            WHERE dk.MaLHP = ?
+        """, (ma_buoi, ma_lhp))
+        roster = set()
+        da_co = set()
+        for ma_sv, ma_diem_danh in cursor.fetchall():
+            roster.add(ma_sv)
+            if ma_diem_danh is not None:
+                da_co.add(ma_sv)
+
+        now = datetime.now()
+        results = []
+        rows = []
+        seen = set()
+        for ma_sv, trang_thai, thoi_gian in items:
+            if ma_sv in seen:
+                results.append((ma_sv, "duplicate", None))
+                continue
+            seen.add(ma_sv)
+
+            if ma_sv not in roster:
+                results.append((ma_sv, "not_enrolled", None))
+            elif ma_sv in da_co:
+                results.append((ma_sv, "already_checked_in", None))
+            else:
+                thoi_gian = thoi_gian or now
+                if trang_thai is None:
+                    trang_thai = "Đúng giờ" if thoi_gian.time() <= gio_bat_dau else "Trễ"
+                rows.append((ma_sv, ma_buoi, thoi_gian, trang_thai, nguon_quet))
+                results.append((ma_sv, "checked_in", trang_thai))
+
+        if rows:
+            inserted = _ghi_diem_danh_chua_co(cursor, rows)
+            conn.commit()
+            results = [
+                (ma_sv, "already_checked_in", None) if status == "checked_in" and ma_sv not in inserted
+                else (ma_sv, status, trang_thai)
+                for ma_sv, status, trang_thai in results
+            ]
+
+        return results
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# =========================
+# LỊCH HỌC THEO NGÀY (CHO SCHEDULE SERVICE)
+# =========================
+def get_sessions_on(ngay_hoc):
+    """Buổi học của một ngày, sắp theo giờ bắt đầu"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT
+            bh.MaBuoi, bh.MaLHP, bh.NgayHoc, bh.GioBatDau,
+            lhp.GiangVien, mh.TenMon
+        FROM BuoiHoc bh
+        JOIN LopHocPhan lhp ON bh.MaLHP = lhp.MaLHP
+        JOIN MonHoc mh ON lhp.MaMon = mh.MaMon
+        WHERE bh.NgayHoc = ?
+        ORDER BY bh.GioBatDau
+    """, (ngay_hoc,))
+
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+def get_schedule_version(ngay_hoc):
+    """Dấu phiên bản rẻ của lịch một ngày: đổi khi thêm / sửa / xoá buổi học"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        SELECT COUNT(*), MAX(MaBuoi), CHECKSUM_AGG(CHECKSUM(MaBuoi, MaLHP, GioBatDau))
+        FROM BuoiHoc
+        WHERE NgayHoc = ?
+    """, (ngay_hoc,))
+
+    version = tuple(cursor.fetchone())
+    conn.close()
+    return version
+
+
+# =========================
+# TẠO BUỔI HỌC
+# =========================
+def tao_buoi_hoc(ma_lhp, ngay_hoc, gio_bat_dau):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        INSERT INTO BuoiHoc (MaLHP, NgayHoc, GioBatDau)
+        OUTPUT INSERTED.MaBuoi
+        VALUES (?, ?, ?)
+    """, (ma_lhp, ngay_hoc, gio_bat_dau))
+
+    ma_buoi = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    return ma_buoi
@@ -1,3 +1,5 @@
+import pyodbc
+
 from database.db_connection import get_connection
 
 def get_student(ma_sv):
@@ -21,3 +23,133 @@ def get_student(ma_sv):
             "Email": row[3]
         }
     return None
+
+
+STUDENT_COLUMNS = "MaSV, HoTen, NgaySinh, GioiTinh, Lop, Khoa, Email, TrangThai"
+
+def student_row_to_dict(row):
+    """Hàng (STUDENT_COLUMNS) -> dict student_info như API trả về"""
+    return {
+        "ma_sv": row[0],
+        "ho_ten": row[1],
+        "ngay_sinh": row[2].isoformat() if row[2] else None,
+        "gioi_tinh": row[3],
+        "lop": row[4],
+        "khoa": row[5],
+        "email": row[6],
+        "trang_thai": row[7]
+    }
+
+def get_students(ma_svs=None, limit=None):
+    """Hồ sơ nhiều sinh viên trong một truy vấn (ma_svs=None: tất cả, tối đa limit)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        top = f"TOP {int(limit)} " if limit else ""
+        if ma_svs is None:
+            cursor.execute(f"SELECT {top}{STUDENT_COLUMNS} FROM SinhVien ORDER BY MaSV")
+            return [student_row_to_dict(r) for r in cursor.fetchall()]
+
+        # IN theo từng lô (SQL Server giới hạn 2100 tham số mỗi câu lệnh)
+        ma_svs = list(ma_svs)
+        students = []
+        for i in range(0, len(ma_svs), 1000):
+            chunk = ma_svs[i:i + 1000]
+            cursor.execute(
+                f"SELECT {STUDENT_COLUMNS} FROM SinhVien WHERE MaSV IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            students += [student_row_to_dict(r) for r in cursor.fetchall()]
+        return students
+    finally:
+        conn.close()
+
+
+def get_class_ids():
+    """Tập MaLHP hiện có"""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT MaLHP FROM LopHocPhan")
+    ids = {r[0] for r in cursor.fetchall()}
+    conn.close()
+    return ids
+
+def _executemany_or_each(conn, cursor, query, rows, keys, errors):
+    """executemany cả lô trong một transaction; lỗi -> rollback rồi chạy từng dòng
+    để biết dòng nào hỏng. Trả về list key đã ghi, lỗi ghi vào errors[key]."""
+    if not rows:
+        return []
+    try:
+        cursor.fast_executemany = True
+        cursor.executemany(query, rows)
+        conn.commit()
+        return list(keys)
+    except pyodbc.Error:
+        conn.rollback()
+
+    cursor.fast_executemany = False
+    done = []
+    for row, key in zip(rows, keys):
+        try:
+            cursor.execute(query, row)
+            done.append(key)
+        except pyodbc.Error as e:
+            errors[key] = str(e.args[-1]) if e.args else str(e)
+    conn.commit()
+    return done
+
+def import_students_chunk(students, enrollments):
+    """Ghi một lô import trên một kết nối.
+
+    students: list (MaSV, HoTen, NgaySinh, GioiTinh, Lop, Khoa, Email, TrangThai),
+    enrollments: list (MaSV, MaLHP). Sinh viên đã có giữ nguyên hồ sơ, cặp đăng ký
+    đã có được bỏ qua. Trả về dict created / existing (set MaSV), enrolled /
+    already_enrolled (set cặp) và errors (MaSV hoặc cặp -> thông báo lỗi).
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        ma_svs = list({s[0] for s in students} | {e[0] for e in enrollments})
+        existing = set()
+        pairs = set()
+        for i in range(0, len(ma_svs), 1000):
+            chunk = ma_svs[i:i + 1000]
+            marks = ", ".join("?" * len(chunk))
+            cursor.execute(f"SELECT MaSV FROM SinhVien WHERE MaSV IN ({marks})", chunk)
+            existing.update(r[0] for r in cursor.fetchall())
+            cursor.execute(f"SELECT MaSV, MaLHP FROM DangKyHoc WHERE MaSV IN ({marks})", chunk)
+            pairs.update((r[0], r[1]) for r in cursor.fetchall())
+
+        errors = {}
+        new_students = [s for s in students if s[0] not in existing]
+        created = set(_executemany_or_each(conn, cursor, f"""
+            INSERT INTO SinhVien ({STUDENT_COLUMNS})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, new_students, [s[0] for s in new_students], errors))
+
+        known = existing | created
+        new_pairs = []
+        for pair in enrollments:
+            if pair in pairs:
+                continue
+            if pair[0] not in known:
+                errors.setdefault(pair, "Sinh viên chưa tồn tại")
+                continue
+            new_pairs.append(pair)
+        enrolled = set(_executemany_or_each(conn, cursor, """
+            INSERT INTO DangKyHoc (MaSV, MaLHP)
+            VALUES (?, ?)
+        """, new_pairs, new_pairs, errors))
+
+        return {
+            "created": created,
+            "existing": existing & {s[0] for s in students},
+            "enrolled": enrolled,
+            "already_enrolled": pairs & set(enrollments),
+            "errors": errors
+        }
+    finally:
+        conn.close()
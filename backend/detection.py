@@ -0,0 +1,352 @@
+"""
+Face detection dùng chung + điều khiển độ phân giải detection theo latency
+
+YOLO chạy ở `imgsz` giảm (mặc định DETECT_IMGSZ, env var cùng tên); ultralytics
+letterbox ảnh về imgsz và trả box theo toạ độ ảnh gốc, nên crop vẫn lấy ở
+độ phân giải đầy đủ.
+
+Detector theo tầng: tầng rẻ (Haar cascade của OpenCV) chạy trước, YOLO chỉ chạy
+khi tầng đầu không chắc chắn. Chính sách chọn theo entry point (DETECTOR_POLICIES,
+ghi đè bằng env DETECTOR_POLICY_<ENTRY>, vd DETECTOR_POLICY_KIOSK=tiered):
+    yolo     chỉ YOLO
+    cascade  chỉ cascade
+    tiered   cascade trước, YOLO khi không chắc
+
+Ngưỡng confidence YOLO cũng theo entry point (DETECT_CONF, ghi đè bằng env
+DETECT_CONF_<ENTRY>): enroll / nhận diện giữ mặc định 0.25 của ultralytics,
+kiosk / video 0.5 như trước.
+"""
+
+import os
+import threading
+import time
+import cv2
+import numpy as np
+
+DETECT_IMGSZ = int(os.environ.get("DETECT_IMGSZ", "416"))
+DEFAULT_CONF = 0.25     # mặc định của ultralytics
+DETECT_CONF = {
+    "enrollment": 0.25,
+    "recognition": 0.25,
+    "kiosk": 0.5,
+    "video": 0.5,
+}
+
+def get_conf(entry_point):
+    return float(os.environ.get(f"DETECT_CONF_{entry_point.upper()}", DETECT_CONF.get(entry_point, DEFAULT_CONF)))
+
+def _result_boxes(result):
+    boxes = []
+    for box in result.boxes.xyxy:
+        x1, y1, x2, y2 = map(int, box)
+        if x2 > x1 and y2 > y1:
+            boxes.append((x1, y1, x2, y2))
+    return boxes
+
+def detect_faces(model, image, imgsz=DETECT_IMGSZ, conf=DEFAULT_CONF):
+    """Trả về list box (x1, y1, x2, y2) kiểu int ở toạ độ ảnh gốc, theo thứ tự confidence"""
+    results = model(image, imgsz=imgsz, conf=conf, verbose=False)
+    return _result_boxes(results[0]) if len(results) > 0 else []
+
+def detect_faces_batch(model, images, imgsz=DETECT_IMGSZ, conf=DEFAULT_CONF):
+    """Một lần gọi YOLO cho cả lô ảnh, trả về list box cho từng ảnh"""
+    if not images:
+        return []
+    return [_result_boxes(r) for r in model(images, imgsz=imgsz, conf=conf, verbose=False)]
+
+# ==================== DETECTORS ====================
+
+class DetectorStats:
+    def __init__(self):
+        self.calls = 0
+        self.accepted = 0
+        self.total_ms = 0.0
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "accepted": self.accepted,
+            "hit_rate": round(self.accepted / self.calls, 3) if self.calls else 0.0,
+            "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else 0.0,
+        }
+
+
+class YoloFaceDetector:
+    name = "yolo"
+
+    def __init__(self, model, imgsz=DETECT_IMGSZ, conf=DEFAULT_CONF):
+        self.model = model
+        self.imgsz = imgsz
+        self.conf = conf
+
+    def detect(self, image, imgsz=None):
+        return detect_faces(self.model, image, imgsz or self.imgsz, self.conf)
+
+    def detect_batch(self, images, imgsz=None):
+        return detect_faces_batch(self.model, images, imgsz or self.imgsz, self.conf)
+
+
+class CascadeFaceDetector:
+    """Haar/LBP cascade trên ảnh xám thu nhỏ, trả kèm độ tin cậy (levelWeights)"""
+    name = "cascade"
+
+    def __init__(self, cascade_path=None, max_side=320, min_face=40, min_confidence=2.0):
+        cascade_path = cascade_path or os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+        self.cascade_path = cascade_path
+        self.max_side = max_side
+        self.min_face = min_face                # pixel ở ảnh gốc
+        self.min_confidence = min_confidence
+        self._local = threading.local()         # CascadeClassifier không thread-safe
+
+    @property
+    def classifier(self):
+        if not hasattr(self._local, "classifier"):
+            self._local.classifier = cv2.CascadeClassifier(self.cascade_path)
+        return self._local.classifier
+
+    def detect_with_confidence(self, image):
+        h, w = image.shape[:2]
+        scale = min(1.0, self.max_side / float(max(h, w)))
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        if scale < 1.0:
+            gray = cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        gray = cv2.equalizeHist(gray)
+
+        min_size = max(12, int(self.min_face * scale))
+        rects, _, weights = self.classifier.detectMultiScale3(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_size, min_size), outputRejectLevels=True
+        )
+
+        faces = []
+        for (x, y, fw, fh), weight in zip(rects, np.asarray(weights).reshape(-1)):
+            box = (int(x / scale), int(y / scale), int((x + fw) / scale), int((y + fh) / scale))
+            faces.append((box, float(weight)))
+        faces.sort(key=lambda f: f[1], reverse=True)
+        return faces
+
+    def detect(self, image, imgsz=None):
+        return [box for box, _ in self.detect_with_confidence(image)]
+
+
+class TieredFaceDetector:
+    """Cascade trước, YOLO chỉ khi cascade không chắc chắn.
+
+    Cascade được coi là chắc chắn khi tìm được 1..max_faces mặt và mọi mặt có
+    confidence >= min_confidence. expect_single=True (upload enroll / nhận diện)
+    thì chỉ chấp nhận đúng một mặt.
+    """
+    name = "tiered"
+
+    def __init__(self, cascade, yolo, expect_single=False, max_faces=4):
+        self.cascade = cascade
+        self.yolo = yolo
+        self.expect_single = expect_single
+        self.max_faces = 1 if expect_single else max_faces
+        self.stats = {"cascade": DetectorStats(), "yolo": DetectorStats()}
+
+    def _cascade_sure(self, faces):
+        if not 1 <= len(faces) <= self.max_faces:
+            return False
+        return all(conf >= self.cascade.min_confidence for _, conf in faces)
+
+    def detect(self, image, imgsz=None):
+        start = time.perf_counter()
+        faces = self.cascade.detect_with_confidence(image)
+        sure = self._cascade_sure(faces)
+        self._record("cascade", start, sure)
+        if sure:
+            return [box for box, _ in faces]
+
+        start = time.perf_counter()
+        boxes = self.yolo.detect(image, imgsz)
+        self._record("yolo", start, bool(boxes))
+        return boxes
+
+    def detect_batch(self, images, imgsz=None):
+        return [self.detect(image, imgsz) for image in images]
+
+    def _record(self, tier, start, accepted):
+        s = self.stats[tier]
+        s.calls += 1
+        s.total_ms += (time.perf_counter() - start) * 1000
+        if accepted:
+            s.accepted += 1
+
+
+class MeasuredDetector:
+    """Bọc detector một tầng để có cùng kiểu thống kê với TieredFaceDetector"""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.name = detector.name
+        self.stats = {detector.name: DetectorStats()}
+
+    def detect(self, image, imgsz=None):
+        start = time.perf_counter()
+        boxes = self.detector.detect(image, imgsz)
+        s = self.stats[self.name]
+        s.calls += 1
+        s.total_ms += (time.perf_counter() - start) * 1000
+        if boxes:
+            s.accepted += 1
+        return boxes
+
+    def detect_batch(self, images, imgsz=None):
+        """Detector có batch (YOLO) thì gọi một lần; stats tính theo từng ảnh"""
+        if not hasattr(self.detector, "detect_batch"):
+            return [self.detect(image, imgsz) for image in images]
+        start = time.perf_counter()
+        results = self.detector.detect_batch(images, imgsz)
+        s = self.stats[self.name]
+        s.calls += len(images)
+        s.total_ms += (time.perf_counter() - start) * 1000
+        s.accepted += sum(1 for boxes in results if boxes)
+        return results
+
+# ==================== POLICY PER ENTRY POINT ====================
+
+DETECTOR_POLICIES = {
+    "enrollment": "tiered",     # upload ảnh training: một mặt chính diện
+    "recognition": "tiered",    # /api/recognize
+    "kiosk": "yolo",            # app.py, nhiều mặt, có motion gate + tracker
+    "video": "yolo",            # video bài giảng offline, batch nhiều frame
+}
+
+_detectors = {}
+
+def get_policy(entry_point):
+    return os.environ.get(f"DETECTOR_POLICY_{entry_point.upper()}", DETECTOR_POLICIES.get(entry_point, "yolo"))
+
+def get_detector(entry_point, yolo_model=None):
+    """Detector theo chính sách của entry point (cache theo entry point)"""
+    if entry_point in _detectors:
+        return _detectors[entry_point]
+
+    policy = get_policy(entry_point)
+    if yolo_model is None and policy != "cascade":
+        from model_registry import get_yolo
+        yolo_model = get_yolo()
+
+    single = entry_point in ("enrollment", "recognition")
+    conf = get_conf(entry_point)
+    if policy == "cascade":
+        detector = MeasuredDetector(CascadeFaceDetector())
+    elif policy == "tiered":
+        detector = TieredFaceDetector(CascadeFaceDetector(), YoloFaceDetector(yolo_model, conf=conf), expect_single=single)
+    elif policy == "yolo":
+        detector = MeasuredDetector(YoloFaceDetector(yolo_model, conf=conf))
+    else:
+        raise ValueError(f"Unknown detector policy '{policy}' for {entry_point}")
+
+    detector.policy = policy
+    detector.conf = conf
+    _detectors[entry_point] = detector
+    return detector
+
+def detector_stats():
+    """Hit rate + latency từng tầng cho mọi entry point đã dùng"""
+    return {
+        entry: {"policy": d.policy, "conf": d.conf, "tiers": {tier: s.to_dict() for tier, s in d.stats.items()}}
+        for entry, d in _detectors.items()
+    }
+
+def expand_box(box, shape, margin):
+    """Nới box thêm margin (pixel) và cắt theo kích thước ảnh"""
+    h, w = shape[:2]
+    x1, y1, x2, y2 = box
+    return max(0, x1 - margin), max(0, y1 - margin), min(w, x2 + margin), min(h, y2 + margin)
+
+
+class AdaptiveDetectionController:
+    """Giữ latency detection quanh `target_ms` bằng cách đổi imgsz và frame stride.
+
+    Quá chậm: giảm imgsz trước, tới mức nhỏ nhất thì tăng stride.
+    Dư thời gian: giảm stride trước, rồi tăng imgsz.
+    Mỗi lần thay đổi được ghi vào `changes` và đếm trong stats().
+    """
+
+    def __init__(self, target_ms=80.0, sizes=(640, 512, 416, 320, 256), initial_size=DETECT_IMGSZ,
+                 max_stride=4, smoothing=0.2, cooldown_frames=15, headroom=0.6, max_history=50):
+        self.target_ms = target_ms
+        self.sizes = sorted(sizes, reverse=True)
+        self.level = min(range(len(self.sizes)), key=lambda i: abs(self.sizes[i] - initial_size))
+        self.stride = 1
+        self.max_stride = max_stride
+        self.smoothing = smoothing
+        self.cooldown_frames = cooldown_frames
+        self.headroom = headroom
+        self.max_history = max_history
+        self.ewma_ms = None
+        self.frames = 0
+        self.detections = 0
+        self.changes = []
+        self.change_count = 0
+        self._since_change = 0
+
+    @property
+    def imgsz(self):
+        return self.sizes[self.level]
+
+    def should_detect(self, frame_id):
+        """Với stride > 1 chỉ detect mỗi `stride` frame, frame còn lại dùng lại box cũ"""
+        self.frames += 1
+        return frame_id % self.stride == 0
+
+    def record(self, latency_ms):
+        self.detections += 1
+        if self.ewma_ms is None:
+            self.ewma_ms = latency_ms
+        else:
+            self.ewma_ms += self.smoothing * (latency_ms - self.ewma_ms)
+
+        self._since_change += 1
+        if self._since_change < self.cooldown_frames:
+            return
+
+        if self.ewma_ms > self.target_ms * 1.1:
+            if self.level < len(self.sizes) - 1:
+                self._change("imgsz", self.level + 1, self.stride)
+            elif self.stride < self.max_stride:
+                self._change("stride", self.level, self.stride + 1)
+        elif self.ewma_ms < self.target_ms * self.headroom:
+            if self.stride > 1:
+                self._change("stride", self.level, self.stride - 1)
+            elif self.level > 0:
+                self._change("imgsz", self.level - 1, self.stride)
+
+    def _change(self, reason, level, stride):
+        change = {
+            "time": time.time(),
+            "reason": reason,
+            "ewma_ms": round(self.ewma_ms, 2),
+            "imgsz": [self.imgsz, self.sizes[level]],
+            "stride": [self.stride, stride],
+        }
+        print(f"[detect-controller] {reason}: imgsz {change['imgsz'][0]}->{change['imgsz'][1]}, "
+              f"stride {change['stride'][0]}->{change['stride'][1]} (ewma {change['ewma_ms']}ms)")
+
+        self.level, self.stride = level, stride
+        self.change_count += 1
+        self.changes = (self.changes + [change])[-self.max_history:]
+        self._since_change = 0
+        # Reset EWMA để đo lại ở cấu hình mới
+        self.ewma_ms = None
+
+    def timed(self, fn, *args, **kwargs):
+        """Gọi fn(..., imgsz=self.imgsz) và ghi nhận latency"""
+        start = time.perf_counter()
+        result = fn(*args, imgsz=self.imgsz, **kwargs)
+        self.record((time.perf_counter() - start) * 1000)
+        return result
+
+    def stats(self):
+        return {
+            "imgsz": self.imgsz,
+            "stride": self.stride,
+            "target_ms": self.target_ms,
+            "ewma_ms": round(self.ewma_ms, 2) if self.ewma_ms is not None else None,
+            "frames": self.frames,
+            "detections": self.detections,
+            "changes": self.change_count,
+            "last_change": self.changes[-1] if self.changes else None,
+        }
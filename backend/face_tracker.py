@@ -0,0 +1,144 @@
+"""
+Face tracker nhẹ (IoU + centroid) để tái sử dụng embedding giữa các frame
+
+Mỗi detection được gán một track_id ổn định. FaceNet chỉ cần chạy khi:
+    - track mới xuất hiện
+    - track chưa nhận diện được và đã chờ đủ `retry_frames` frame
+    - crop hiện tại tốt hơn rõ rệt so với crop đã dùng để embed
+Kết quả nhận diện được cache trên track.
+"""
+
+import numpy as np
+
+class Track:
+    def __init__(self, track_id, box, quality):
+        self.track_id = track_id
+        self.box = box
+        self.quality = quality
+        self.embedded_quality = 0.0
+        self.identity = None
+        self.score = 0.0
+        self.status = None          # trạng thái điểm danh đã cache (ok / wrong_class / unknown)
+        self.hits = 1
+        self.missed = 0
+        self.frames_since_embed = 0
+
+    @property
+    def resolved(self):
+        return self.identity is not None
+
+
+def box_area(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+def iou_matrix(a, b):
+    """IoU giữa mọi cặp box (M, 4) x (N, 4) -> (M, N)"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = box_area(a)[:, None] + box_area(b)[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold=0.3, centroid_ratio=0.5, max_missed=15,
+                 retry_frames=10, quality_gain=1.5):
+        self.iou_threshold = iou_threshold
+        self.centroid_ratio = centroid_ratio    # khoảng cách tâm tối đa / cạnh box
+        self.max_missed = max_missed
+        self.retry_frames = retry_frames
+        self.quality_gain = quality_gain
+        self.tracks = []
+        self._next_id = 1
+        self.stats = {"frames": 0, "detections": 0, "embeddings": 0, "tracks_created": 0}
+
+    def reset(self):
+        self.tracks = []
+
+    def update(self, boxes, qualities=None):
+        """Gán detection của frame hiện tại vào track, trả về list track theo thứ tự boxes"""
+        boxes = [tuple(map(int, b)) for b in boxes]
+        if qualities is None:
+            qualities = box_area(boxes).tolist() if boxes else []
+
+        self.stats["frames"] += 1
+        self.stats["detections"] += len(boxes)
+
+        assigned = [None] * len(boxes)
+        free_tracks = set(range(len(self.tracks)))
+
+        if boxes and self.tracks:
+            track_boxes = [t.box for t in self.tracks]
+            ious = iou_matrix(track_boxes, boxes)
+
+            # Greedy matching theo IoU giảm dần
+            for ti, di in zip(*np.unravel_index(np.argsort(-ious, axis=None), ious.shape)):
+                if ious[ti, di] < self.iou_threshold:
+                    break
+                if ti in free_tracks and assigned[di] is None:
+                    assigned[di] = ti
+                    free_tracks.discard(ti)
+
+            # Fallback centroid cho mặt di chuyển nhanh (IoU thấp)
+            for di, box in enumerate(boxes):
+                if assigned[di] is not None:
+                    continue
+                cx, cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+                size = max(box[2] - box[0], box[3] - box[1], 1)
+                best, best_dist = None, self.centroid_ratio * size
+                for ti in free_tracks:
+                    tb = self.tracks[ti].box
+                    dist = np.hypot((tb[0] + tb[2]) / 2 - cx, (tb[1] + tb[3]) / 2 - cy)
+                    if dist < best_dist:
+                        best, best_dist = ti, dist
+                if best is not None:
+                    assigned[di] = best
+                    free_tracks.discard(best)
+
+        result = []
+        for di, box in enumerate(boxes):
+            if assigned[di] is None:
+                track = Track(self._next_id, box, qualities[di])
+                self._next_id += 1
+                self.tracks.append(track)
+                self.stats["tracks_created"] += 1
+            else:
+                track = self.tracks[assigned[di]]
+                track.box = box
+                track.quality = qualities[di]
+                track.hits += 1
+                track.missed = 0
+                track.frames_since_embed += 1
+            result.append(track)
+
+        for ti in free_tracks:
+            self.tracks[ti].missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+
+        return result
+
+    def needs_embedding(self, track):
+        if track.embedded_quality == 0.0:
+            return True
+        if not track.resolved and track.frames_since_embed >= self.retry_frames:
+            return True
+        return track.quality >= track.embedded_quality * self.quality_gain
+
+    def mark_embedded(self, track, identity=None, score=0.0):
+        """Lưu kết quả nhận diện cho track sau khi đã chạy FaceNet"""
+        self.stats["embeddings"] += 1
+        track.embedded_quality = track.quality
+        track.frames_since_embed = 0
+        if identity is not None:
+            track.identity = identity
+            track.score = score
+            track.status = None
+        elif not track.resolved:
+            track.score = score
@@ -0,0 +1,87 @@
+"""
+Trả file tĩnh (ảnh training, thumbnail) có cache phía client
+
+FileResponse của Starlette bản đang dùng không xử lý request có điều kiện và
+Range: helper này trả 304 khi If-None-Match / If-Modified-Since khớp, 206 cho
+một khoảng bytes=..., còn lại dùng FileResponse với ETag / Last-Modified.
+"""
+
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi.responses import FileResponse, Response
+
+# Trình duyệt luôn hỏi lại, server trả 304 nếu ảnh không đổi
+CACHE_CONTROL = "private, no-cache"
+
+def parse_range(header, size):
+    """(start, end) cho 'bytes=a-b' / 'bytes=a-' / 'bytes=-n'; None nếu header không dùng được
+    (nhiều khoảng, sai cú pháp) -> trả cả file; ValueError (416) nếu khoảng nằm ngoài file,
+    kể cả bytes=-0 và mọi khoảng trên file rỗng."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start, _, end = spec.strip().partition("-")
+    try:
+        if start == "":
+            length = int(end)
+        else:
+            start = int(start)
+            end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start == "":
+        # bytes=-0 hoặc file rỗng: không có byte nào để trả
+        if length <= 0 or size == 0:
+            raise ValueError("range not satisfiable")
+        return max(0, size - length), size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def cached_file_response(request, path, media_type=None):
+    st = os.stat(path)
+    media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if _not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, st.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{st.st_size}"})
+
+        if byte_range is not None:
+            start, end = byte_range
+            with open(path, "rb") as f:
+                f.seek(start)
+                content = f.read(end - start + 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+            return Response(content, status_code=206, headers=headers, media_type=media_type)
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
@@ -0,0 +1,361 @@
+"""
+Inference sidecar: một process giữ YOLO + FaceNet cho mọi client trên máy
+(API main.py, kiosk app.py, training, worker video), gom request thành batch
+
+    python scripts/run_inference_service.py
+    INFERENCE_SERVICE=/tmp/smart_attendance_inference.sock uvicorn main:app
+    INFERENCE_SERVICE=/tmp/smart_attendance_inference.sock python app.py
+
+Khi INFERENCE_SERVICE được đặt, model_registry.get_yolo() / get_facenet() trả về proxy
+cùng giao diện với model thật (yolo(images, imgsz=, conf=) -> results[i].boxes.xyxy,
+facenet(batch) -> tensor), nên detection.py, preprocessing.py... không cần biết model ở đâu.
+
+Giao thức: multiprocessing.connection qua Unix socket ("host:port" -> TCP localhost),
+mỗi request là một message (op, meta, ảnh uint8). Message được unpickle nên kết nối phải
+qua authkey: INFERENCE_AUTHKEY, hoặc key ngẫu nhiên server ghi vào INFERENCE_KEY_FILE
+(quyền 600) lúc khởi động và client đọc lại mỗi lần kết nối.
+
+Lập lịch: một thread inference duy nhất cho cả máy. Mỗi vòng lấy các request đang chờ
+(đợi thêm tối đa max_wait_ms để gom), request "interactive" (kiosk, nhận diện) đi trước
+"bulk" (training, gửi từng lô MAX_BATCH mặt nên không chặn kiosk lâu), detect được gộp
+theo (weights, imgsz, conf), embed gộp thành một batch FaceNet.
+"""
+
+import itertools
+import os
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import cv2
+import numpy as np
+import torch
+
+from preprocessing import DEFAULT_MAX_BATCH, FACE_SIZE
+
+DEFAULT_ADDRESS = "/tmp/smart_attendance_inference.sock" if hasattr(os, "fork") else "127.0.0.1:8765"
+KEY_FILE = os.environ.get("INFERENCE_KEY_FILE", os.path.join(os.path.expanduser("~"), ".smart_attendance_inference.key"))
+PRIORITIES = ("interactive", "bulk")
+OPS = ("detect", "embed")
+
+def load_authkey(create=False):
+    """INFERENCE_AUTHKEY nếu có, ngược lại key trong KEY_FILE (server tạo nếu chưa có)"""
+    key = os.environ.get("INFERENCE_AUTHKEY")
+    if key:
+        return key.encode()
+
+    if create and not os.path.exists(KEY_FILE):
+        tmp = KEY_FILE + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+        os.replace(tmp, KEY_FILE)
+    if create:
+        os.chmod(KEY_FILE, 0o600)
+
+    try:
+        with open(KEY_FILE, encoding="ascii") as f:
+            return f.read().strip().encode()
+    except FileNotFoundError:
+        raise RuntimeError(f"Chưa có INFERENCE_AUTHKEY hoặc {KEY_FILE}, hãy chạy scripts/run_inference_service.py trước")
+
+def parse_address(address):
+    """'host:port' -> (host, port) cho TCP, còn lại là đường dẫn Unix socket"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+# ==================== SERVER ====================
+
+def validate_request(op, meta, data):
+    """Lỗi (str) nếu request không hợp lệ, None nếu hợp lệ - kiểm tra trước khi vào hàng đợi
+    để một request sai không làm chết thread inference"""
+    if op not in OPS:
+        return f"op không hợp lệ: {op!r}"
+    if not isinstance(meta, dict) or meta.get("priority", "interactive") not in PRIORITIES:
+        return "meta / priority không hợp lệ"
+    if not isinstance(data, list) or not data:
+        return "data phải là list ảnh khác rỗng"
+    if not all(isinstance(x, np.ndarray) and x.dtype == np.uint8 and x.ndim == 3 and x.shape[2] == 3 for x in data):
+        return "ảnh phải là mảng uint8 (H, W, 3)"
+
+    if op == "embed":
+        if any(x.shape[:2] != (FACE_SIZE, FACE_SIZE) for x in data):
+            return f"crop phải là {FACE_SIZE}x{FACE_SIZE}"
+        if not isinstance(meta.get("bgr", True), bool):
+            return "bgr phải là bool"
+    else:
+        if not isinstance(meta.get("weights"), str):
+            return "thiếu weights"
+        imgsz, conf = meta.get("imgsz"), meta.get("conf", 0.25)
+        if imgsz is not None and (not isinstance(imgsz, int) or not 32 <= imgsz <= 4096):
+            return "imgsz không hợp lệ"
+        if not isinstance(conf, (int, float)) or not 0 <= conf <= 1:
+            return "conf không hợp lệ"
+    return None
+
+class _Request:
+    _seq = itertools.count()
+
+    def __init__(self, op, meta, data):
+        self.op = op
+        self.meta = meta
+        self.data = data
+        self.priority = PRIORITIES.index(meta.get("priority", "interactive"))
+        self.seq = next(self._seq)
+        self.queued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    @property
+    def key(self):
+        if self.op == "embed":
+            return ("embed", self.meta.get("bgr", True))
+        return ("detect", self.meta["weights"], self.meta.get("imgsz"), self.meta.get("conf"))
+
+
+class InferenceServer:
+    def __init__(self, address=DEFAULT_ADDRESS, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=5.0):
+        from model_registry import get_facenet
+
+        self.address = parse_address(address)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.facenet = get_facenet(remote=False)
+        self._pending = []
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self.clients = 0
+        self.stats = {"requests": 0, "batches": 0, "faces": 0, "frames": 0, "errors": 0,
+                      "wait_ms": 0.0, "infer_ms": 0.0}
+
+    def serve_forever(self):
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)     # socket cũ của lần chạy trước
+        listener = Listener(self.address, authkey=load_authkey(create=True))
+        threading.Thread(target=self._run, daemon=True, name="inference").start()
+        print(f"✅ Inference service listening on {self.address}")
+
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:      # sai authkey / client ngắt giữa chừng
+                print(f"⚠️ Rejected connection: {e}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with self._lock:
+            self.clients += 1
+        try:
+            while True:
+                message = conn.recv()
+                if not (isinstance(message, tuple) and len(message) == 3):
+                    conn.send(("error", "message phải là (op, meta, data)"))
+                    continue
+                op, meta, data = message
+                if op == "stats":
+                    conn.send(("ok", self.metrics()))
+                    continue
+                error = validate_request(op, meta, data)
+                if error:
+                    self.stats["errors"] += 1
+                    conn.send(("error", error))
+                    continue
+
+                request = _Request(op, meta, data)
+                with self._cond:
+                    self._pending.append(request)
+                    self._cond.notify()
+                request.done.wait()
+                conn.send(("error", request.error) if request.error else ("ok", request.result))
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self.clients -= 1
+            conn.close()
+
+    def _take(self):
+        """Request cho vòng kế tiếp: mọi request interactive, không có thì một lô bulk"""
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+        time.sleep(self.max_wait)       # gom thêm request của client khác
+
+        with self._cond:
+            self._pending.sort(key=lambda r: (r.priority, r.seq))
+            interactive = [r for r in self._pending if r.priority == 0]
+            if interactive:
+                taken = interactive
+            else:
+                taken, faces = [], 0
+                for r in self._pending:
+                    if taken and faces + len(r.data) > self.max_batch:
+                        break
+                    taken.append(r)
+                    faces += len(r.data)
+            self._pending = [r for r in self._pending if r not in taken]
+        return taken
+
+    def _run(self):
+        while True:
+            requests = self._take()
+            start = time.perf_counter()
+            groups = {}
+            for r in requests:
+                try:
+                    groups.setdefault(r.key, []).append(r)
+                except Exception as e:      # không để lỗi một request làm chết thread này
+                    self.stats["errors"] += 1
+                    r.error = str(e)
+
+            for key, group in groups.items():
+                try:
+                    if key[0] == "embed":
+                        self._embed(key, group)
+                    else:
+                        self._detect(key, group)
+                except Exception as e:
+                    self.stats["errors"] += len(group)
+                    for r in group:
+                        r.error = str(e)
+
+            now = time.perf_counter()
+            self.stats["requests"] += len(requests)
+            self.stats["batches"] += len(groups)
+            self.stats["wait_ms"] += sum(start - r.queued_at for r in requests) * 1000
+            self.stats["infer_ms"] += (now - start) * 1000
+            for r in requests:
+                r.done.set()
+
+    def _embed(self, key, group):
+        from preprocessing import embed_faces
+
+        faces = [face for r in group for face in r.data]
+        embeddings = embed_faces(self.facenet, faces, bgr=key[1], batch_size=self.max_batch)
+        self.stats["faces"] += len(faces)
+
+        offset = 0
+        for r in group:
+            r.result = embeddings[offset:offset + len(r.data)]
+            offset += len(r.data)
+
+    def _detect(self, key, group):
+        from model_registry import get_yolo
+
+        _, weights, imgsz, conf = key
+        images = [image for r in group for image in r.data]
+        kwargs = {"imgsz": imgsz} if imgsz else {}
+        results = get_yolo(weights, remote=False)(images, conf=conf, verbose=False, **kwargs)
+        boxes = [result.boxes.xyxy.cpu().numpy().astype(np.float32) for result in results]
+        self.stats["frames"] += len(images)
+
+        offset = 0
+        for r in group:
+            r.result = boxes[offset:offset + len(r.data)]
+            offset += len(r.data)
+
+    def metrics(self):
+        stats = dict(self.stats)
+        requests = max(stats["requests"], 1)
+        stats["avg_wait_ms"] = round(stats.pop("wait_ms") / requests, 2)
+        stats["avg_infer_ms"] = round(stats.pop("infer_ms") / max(stats["batches"], 1), 2)
+        stats["avg_requests_per_batch"] = round(stats["requests"] / max(stats["batches"], 1), 2)
+        with self._cond:
+            stats["pending"] = len(self._pending)
+        stats["clients"] = self.clients
+        stats["facenet"] = self.facenet.name
+        return stats
+
+# ==================== CLIENT ====================
+
+class InferenceClient:
+    """Một kết nối cho mỗi thread (Connection không dùng chung giữa các thread được)"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, priority="interactive"):
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority phải là một trong {PRIORITIES}")
+        self.address = parse_address(address)
+        self.priority = priority
+        self._local = threading.local()
+
+    def _connection(self):
+        if getattr(self._local, "conn", None) is None:
+            # Đọc key mỗi lần kết nối: sidecar khởi động lại có thể đã tạo key mới
+            self._local.conn = Client(self.address, authkey=load_authkey())
+        return self._local.conn
+
+    def call(self, op, data=None, **meta):
+        meta["priority"] = self.priority
+        try:
+            conn = self._connection()
+            conn.send((op, meta, data))
+            status, result = conn.recv()
+        except (EOFError, OSError) as e:
+            self._local.conn = None     # service restart -> lần gọi sau kết nối lại
+            raise ConnectionError(f"Inference service {self.address} không phản hồi: {e}")
+        if status == "error":
+            raise RuntimeError(f"Inference service: {result}")
+        return result
+
+    def detect(self, images, weights, imgsz=None, conf=0.25):
+        """List ảnh BGR -> list mảng box (N, 4) xyxy"""
+        return self.call("detect", [np.ascontiguousarray(img) for img in images],
+                         weights=weights, imgsz=imgsz, conf=conf)
+
+    def embed(self, pixels, bgr=True):
+        """Mảng (N, 160, 160, 3) uint8 -> embedding (N, 512)"""
+        return self.call("embed", list(pixels), bgr=bgr)
+
+    def stats(self):
+        return self.call("stats")
+
+# ==================== PROXY ====================
+# Cùng giao diện với model trong process để code gọi không phải đổi
+
+class _Boxes:
+    def __init__(self, xyxy):
+        self.xyxy = xyxy
+
+
+class _Result:
+    """Giống một phần tử kết quả ultralytics (chỉ boxes.xyxy)"""
+    def __init__(self, xyxy):
+        self.boxes = _Boxes(xyxy)
+
+
+class RemoteYolo:
+    def __init__(self, client, weights):
+        self.client = client
+        self.weights = weights
+
+    def __call__(self, source, imgsz=None, conf=0.25, verbose=False, **kwargs):
+        images = source if isinstance(source, (list, tuple)) else [source]
+        if not images:
+            return []
+        return [_Result(b) for b in self.client.detect(images, self.weights, imgsz, conf)]
+
+
+class RemoteFacenet:
+    name = "remote"
+
+    def __init__(self, client, max_batch=DEFAULT_MAX_BATCH):
+        self.client = client
+        self.max_batch = max_batch
+
+    def embed_crops(self, crops, bgr=True):
+        """Resize về 160x160 uint8 ngay ở client (gửi ít byte hơn tensor float), gửi từng lô"""
+        outputs = []
+        for i in range(0, len(crops), self.max_batch):
+            pixels = np.stack([cv2.resize(c, (FACE_SIZE, FACE_SIZE)) for c in crops[i:i + self.max_batch]])
+            outputs.append(self.client.embed(pixels, bgr))
+        return np.concatenate(outputs)
+
+    def __call__(self, batch):
+        # Tensor NCHW RGB / 255 (preprocess_faces) -> uint8 NHWC, đổi lại không mất mát
+        pixels = (batch.detach().cpu().numpy().transpose(0, 2, 3, 1) * 255).round().clip(0, 255).astype(np.uint8)
+        return torch.from_numpy(self.client.embed(pixels, bgr=False))
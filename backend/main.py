@@ -1,23 +1,45 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks, WebSocket, WebSocketDisconnect, Request, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime, date, time, timedelta
+from datetime import datetime, date, time
 import cv2
 import numpy as np
 import pickle
-import base64
+import json
+import asyncio
+import struct
 import os
-import io
+import uuid
+import tempfile
+import zipfile
+from collections import deque
+from contextlib import nullcontext
+from time import perf_counter
 import torch
-from facenet_pytorch import InceptionResnetV1
-from ultralytics import YOLO
-from sklearn.metrics.pairwise import cosine_similarity
 import pyodbc
 
 # Import training module
 from training_module import training_manager
+from model_registry import get_facenet, get_yolo, get_inference_client, configure_threads
+from preprocessing import embed_faces
+from detection import get_detector, detector_stats, expand_box
+from face_quality import score_faces, best_index
+from recognition_cache import RecognitionCache, face_hash
+from attendance_events import AttendanceEventBus
+from session_roster import SessionRosterCache, build_gallery, match_gallery
+from compressed_gallery import CompressedGallery, gallery_rows
+from shared_gallery import SharedGallery, SharedJobStore
+from student_cache import StudentProfileCache
+from schedule_service import ScheduleService
+from student_import import detect_format, import_students
+from video_attendance import process_lecture_video
+from video_enrollment import EnrollmentOptions, select_enrollment_faces
+from file_serving import cached_file_response
+from near_duplicates import ACTIONS as NEAR_DUPLICATE_ACTIONS
+from database.attendance_service import ghi_diem_danh_neu_chua_co, diem_danh_hang_loat, tao_buoi_hoc
 
 app = FastAPI(title="Smart Attendance AI API")
 
@@ -35,9 +57,14 @@ print("=" * 60)
 print("🤖 LOADING AI MODELS...")
 print("=" * 60)
 
+# Số worker cùng máy (uvicorn main:app --workers N thì đặt WORKERS=N): chia core cho torch
+SERVING_WORKERS = int(os.environ.get("WORKERS", os.environ.get("WEB_CONCURRENCY", "1")))
+if SERVING_WORKERS > 1 or "TORCH_NUM_THREADS" in os.environ:
+    print(f"✅ Torch threads / worker: {configure_threads(SERVING_WORKERS)}")
+
 # YOLO
 try:
-    yolo_model = YOLO("yolov8n.pt")
+    yolo_model = get_yolo()
     print("✅ YOLO loaded")
 except:
     yolo_model = None
@@ -45,8 +72,8 @@ except:
 
 # FaceNet
 try:
-    facenet_model = InceptionResnetV1(pretrained='vggface2').eval()
-    print("✅ FaceNet loaded")
+    facenet_model = get_facenet()
+    print(f"✅ FaceNet loaded ({facenet_model.name})")
 except:
     facenet_model = None
     exit(1)
@@ -62,8 +89,44 @@ def load_face_database():
 
 face_database = load_face_database()
 print(f"✅ Face DB: {len(face_database)} identities")
+
+# Nhiều worker: gallery nằm trong shared memory, worker train xong publish generation mới
+shared_gallery = SharedGallery() if SERVING_WORKERS > 1 else None
+shared_jobs = SharedJobStore(shared_gallery) if shared_gallery is not None else None
+
+# Hồ sơ sinh viên: nạp hàng loạt một lần, đường nhận diện không đọc SinhVien nữa
+student_profiles = StudentProfileCache()
+try:
+    print(f"✅ Student profiles: {student_profiles.preload()} cached")
+except Exception as e:
+    print(f"⚠️ Student profiles not preloaded: {e}")
 print("=" * 60)
 
+# Cache nhận diện: crop gần giống trong cùng buổi học không chạy lại FaceNet
+recognition_cache = RecognitionCache()
+
+# Feed SSE điểm danh theo buổi học (pub/sub trong process)
+attendance_events = AttendanceEventBus()
+SSE_HEARTBEAT_SECONDS = 15
+
+# Ngữ cảnh buổi học (lớp, hồ sơ sinh viên, đã điểm danh) cho /api/attendance/recognize-checkin
+session_rosters = SessionRosterCache(on_load=lambda context: student_profiles.put_many(context.students.values()))
+global_gallery = {"version": None, "names": None, "matrix": None}
+
+# Gallery toàn trường: flat (ma trận float32) hoặc pq (PCA + PQ, xem compressed_gallery.py,
+# build bằng scripts/compress_gallery.py)
+GALLERY_MODE = os.environ.get("GALLERY_MODE", "flat")
+COMPRESSED_GALLERY_DIR = "models/gallery_pq"
+compressed_gallery = {"version": None, "gallery": None}
+checkin_latency = {}
+
+# Lịch học trong bộ nhớ: tra buổi học theo ngày / đang diễn ra không cần join BuoiHoc mỗi request,
+# buổi sắp bắt đầu được nạp trước vào session_rosters
+schedule = ScheduleService(
+    on_prefetch=lambda s: session_rosters.get(s.ma_buoi, current_face_db(), face_db_version())
+)
+schedule.start()
+
 from database.db_connection import get_connection
 
 # ==================== MODELS ====================
@@ -78,112 +141,241 @@ class StudentInfo(BaseModel):
     email: Optional[str]
     trang_thai: Optional[str]
 
+class BatchCheckinItem(BaseModel):
+    ma_sv: str
+    trang_thai: Optional[str] = None          # None -> tính theo giờ bắt đầu buổi học
+    thoi_gian_quet: Optional[datetime] = None  # None -> thời điểm gọi API
+
+class BatchCheckinRequest(BaseModel):
+    ma_buoi: int
+    students: List[BatchCheckinItem]
+    nguon_quet: str = "Giảng viên"
+
+class SessionCreate(BaseModel):
+    ma_lhp: str
+    ngay_hoc: date
+    gio_bat_dau: time
+
 # ==================== AI FUNCTIONS ====================
 
 def detect_and_align_face(image):
-    """Detect face và align để tăng độ chính xác"""
+    """Detect face, chọn crop có chất lượng tốt nhất -> (face, FaceQuality)"""
     if yolo_model is None:
-        return image
+        return image, score_faces([image])[0]
     
     try:
-        results = yolo_model(image, verbose=False)
+        # Detector theo tầng (cascade -> YOLO khi không chắc), box theo toạ độ ảnh gốc
+        boxes = get_detector("recognition", yolo_model).detect(image)
         
-        if len(results[0].boxes) > 0:
-            box = results[0].boxes.xyxy[0].cpu().numpy()
-            x1, y1, x2, y2 = map(int, box)
+        if boxes:
+            crops = []
+            for box in boxes:
+                # Add margin
+                margin = int((box[2] - box[0]) * 0.2)
+                x1, y1, x2, y2 = expand_box(box, image.shape, margin)
+                crops.append(image[y1:y2, x1:x2])
             
-            # Add margin
-            h, w = image.shape[:2]
-            margin = int((x2 - x1) * 0.2)
-            x1 = max(0, x1 - margin)
-            y1 = max(0, y1 - margin)
-            x2 = min(w, x2 + margin)
-            y2 = min(h, y2 + margin)
-            
-            face = image[y1:y2, x1:x2]
-            return face
+            qualities = score_faces(crops)
+            best = best_index(qualities)
+            if best is None:
+                # Không crop nào đạt: trả crop điểm cao nhất kèm quality lỗi để báo lý do
+                best = max(range(len(crops)), key=lambda i: qualities[i].score)
+            return crops[best], qualities[best]
     except:
         pass
     
-    return image
+    return image, score_faces([image])[0]
 
-def extract_embedding_high_quality(image_bytes):
-    """Extract embedding với độ chính xác cao"""
+def extract_face_high_quality(image_bytes):
+    """Decode + detect + quality gate, trả về (face, error, quality)"""
     try:
         nparr = np.frombuffer(image_bytes, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         if img is None:
-            return None, "Invalid image"
+            return None, "Invalid image", None
         
         # Detect and crop face
-        face = detect_and_align_face(img)
-        
-        # Convert to RGB
-        face_rgb = cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
-        
-        # Resize to 160x160
-        face_resized = cv2.resize(face_rgb, (160, 160))
-        
-        # Normalize
-        face_tensor = torch.from_numpy(face_resized).permute(2, 0, 1).float()
-        face_tensor = face_tensor.unsqueeze(0) / 255.0
+        face, quality = detect_and_align_face(img)
         
-        # Extract
-        with torch.no_grad():
-            embedding = facenet_model(face_tensor).cpu().numpy()[0]
+        # Quality gate: mặt quá nhỏ / mờ / tối / quay nghiêng -> không embed
+        if not quality.ok:
+            return None, quality.message, quality
         
-        return embedding, None
+        return face, None, quality
         
     except Exception as e:
-        return None, str(e)
+        return None, str(e), None
 
-def recognize_with_high_accuracy(embedding, threshold=0.65):
-    """Nhận diện với độ chính xác cao"""
-    global face_database
+def recognize_face_cached(face, scope=None, matcher=None):
+    """Nhận diện crop, dùng lại kết quả nếu crop gần giống crop đã nhận diện trong scope.
+
+    matcher(embedding) -> tuple kết quả, mặc định recognize_with_high_accuracy
+    (identity, confidence, top_matches). Trả về tuple đó + (cached,).
+    """
+    key = face_hash(face)
+    cached = recognition_cache.get(scope, key)
+    if cached is not None:
+        return cached + (True,)
     
-    # Reload database to get latest
+    embedding = embed_faces(facenet_model, [face])[0]
+    result = (matcher or recognize_with_high_accuracy)(embedding)
+    recognition_cache.put(scope, key, result)
+    return result + (False,)
+
+def face_db_version():
+    """mtime của face_db.pkl, dùng để biết gallery đã cache có còn đúng không"""
+    db_path = "models/face_db.pkl"
+    return os.path.getmtime(db_path) if os.path.exists(db_path) else None
+
+def get_global_gallery():
+    """Gallery toàn bộ sinh viên (ma trận đã chuẩn hoá), build lại khi face_db đổi"""
+    global face_database
+    version = face_db_version()
+    if shared_gallery is not None:
+        return get_shared_gallery(version)
+    if global_gallery["version"] != version or global_gallery["names"] is None:
+        face_database = load_face_database()
+        names, matrix = build_gallery(face_database)
+        global_gallery.update(version=version, names=names, matrix=matrix)
+    return global_gallery["names"], global_gallery["matrix"]
+
+def get_shared_gallery(version):
+    """Gallery trong shared memory: đọc generation (một lần đọc bộ nhớ), map lại nếu đổi"""
+    global face_database
+    shared_gallery.sync(lambda: build_gallery(load_face_database()), version)
+    names, matrix, generation = shared_gallery.current()
+    if global_gallery["version"] != generation:
+        # Worker khác vừa train / xoá: face_database trỏ vào các dòng của ma trận dùng chung,
+        # kết quả nhận diện đã cache không còn đúng
+        face_database = {name: matrix[i:i + 1] for i, name in enumerate(names)}
+        global_gallery.update(version=generation, names=names, matrix=matrix)
+        recognition_cache.clear()
+    return names, matrix
+
+def current_face_db():
+    """face_database mới nhất (nạp lại nếu face_db.pkl / shared gallery đã đổi)"""
+    get_global_gallery()
+    return face_database
+
+def reload_face_database():
+    """Sau khi train / xoá: nạp lại face_db.pkl và báo cho các worker khác"""
+    global face_database
     face_database = load_face_database()
+    recognition_cache.clear()
+    if shared_gallery is not None:
+        shared_gallery.publish(*build_gallery(face_database), source_version=face_db_version())
+
+def get_compressed_gallery():
+    """Gallery PQ đã nạp, None nếu chưa build. face_db đổi -> mã hoá lại bằng
+    PCA + codebook sẵn có (không train lại) và ghi đè file trên đĩa."""
+    version = face_db_version()
+    if compressed_gallery["version"] == version:
+        return compressed_gallery["gallery"]
     
-    if not face_database or embedding is None:
-        return "Unknown", 0.0, []
+    if not os.path.exists(os.path.join(COMPRESSED_GALLERY_DIR, "gallery.npz")):
+        print(f"⚠️ GALLERY_MODE=pq nhưng chưa có {COMPRESSED_GALLERY_DIR}, dùng gallery flat")
+        compressed_gallery.update(version=version, gallery=None)
+        return None
     
-    scores = []
+    gallery = CompressedGallery.load(COMPRESSED_GALLERY_DIR)
+    if gallery.source_version != version:
+        with shared_gallery.locked() if shared_gallery is not None else nullcontext():
+            gallery = CompressedGallery.load(COMPRESSED_GALLERY_DIR)
+            if gallery.source_version != version:   # worker khác có thể vừa mã hoá lại
+                names, matrix = gallery_rows(load_face_database())
+                gallery.with_vectors(names, matrix, source_version=version).save(COMPRESSED_GALLERY_DIR)
+        gallery = CompressedGallery.load(COMPRESSED_GALLERY_DIR)
+    compressed_gallery.update(version=version, gallery=gallery)
+    recognition_cache.clear()      # có thể do worker khác vừa train
+    return gallery
+
+def search_global(embedding, k=5):
+    """Top-k [(identity, cosine)] trên toàn bộ gallery"""
+    if GALLERY_MODE == "pq":
+        gallery = get_compressed_gallery()
+        if gallery is not None:
+            return gallery.search(embedding, k)
     
-    for name, db_emb in face_database.items():
-        try:
-            score = cosine_similarity(
-                embedding.reshape(1, -1),
-                db_emb.reshape(1, -1)
-            )[0][0]
-            scores.append((name, score))
-        except:
-            continue
+    names, matrix = get_global_gallery()
+    if not names:
+        return []
+    emb = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    scores = matrix @ (emb / (np.linalg.norm(emb) + 1e-10))
+    top = np.argsort(-scores)[:k]
+    return [(names[i], float(scores[i])) for i in top]
+
+def recognize_with_high_accuracy(embedding, threshold=0.65):
+    """Nhận diện với độ chính xác cao"""
+    if embedding is None:
+        return "Unknown", 0.0, []
     
-    # Sort by score
-    scores.sort(key=lambda x: x[1], reverse=True)
+    # Gallery cache theo mtime của face_db.pkl (tự nạp lại sau khi training)
+    scores = search_global(embedding, k=5)
     
     if not scores or scores[0][1] < threshold:
-        return "Unknown", scores[0][1] if scores else 0.0, scores[:5]
+        return "Unknown", scores[0][1] if scores else 0.0, scores
     
-    return scores[0][0], scores[0][1], scores[:5]
+    return scores[0][0], scores[0][1], scores
 
 # ==================== ENDPOINTS ====================
 
 @app.get("/")
 async def root():
+    face_db = current_face_db()
     return {
         "message": "Smart Attendance AI API",
         "status": "running",
         "yolo_loaded": yolo_model is not None,
         "facenet_loaded": facenet_model is not None,
         "face_database": {
-            "loaded": len(face_database) > 0,
-            "count": len(face_database),
-            "identities": list(face_database.keys())
+            "loaded": len(face_db) > 0,
+            "count": len(face_db),
+            "identities": list(face_db.keys())
         }
     }
 
+@app.get("/api/metrics/detection")
+async def get_detection_metrics():
+    """Hit rate và latency từng tầng detector theo entry point"""
+    return detector_stats()
+
+@app.get("/api/metrics/gallery")
+async def gallery_metrics():
+    gallery = get_compressed_gallery() if GALLERY_MODE == "pq" else None
+    if gallery is None:
+        names, matrix = get_global_gallery()
+        result = {"mode": "flat", "vectors": len(names), "bytes": int(matrix.nbytes)}
+    else:
+        result = {"mode": "pq", **gallery.footprint()}
+    
+    result["worker"] = {"pid": os.getpid(), "workers": SERVING_WORKERS, "torch_threads": torch.get_num_threads()}
+    if shared_gallery is not None:
+        result["shared"] = shared_gallery.metrics()
+    return result
+
+@app.get("/api/metrics/inference")
+async def inference_metrics():
+    """Model chạy trong process hay qua inference sidecar (kèm thống kê batch của sidecar)"""
+    client = get_inference_client()
+    if client is None:
+        return {"mode": "local", "facenet": facenet_model.name}
+    return {"mode": "remote", "address": str(client.address), **await run_in_threadpool(client.stats)}
+
+@app.get("/api/metrics/thumbnails")
+async def thumbnail_metrics():
+    return training_manager.thumbnails.metrics()
+
+@app.get("/api/metrics/student-cache")
+async def get_student_cache_metrics():
+    """Hit rate của cache hồ sơ sinh viên"""
+    return student_profiles.metrics()
+
+@app.get("/api/metrics/recognition-cache")
+async def get_recognition_cache_metrics():
+    """Hit rate của cache nhận diện theo perceptual hash"""
+    return recognition_cache.metrics()
+
 # ==================== STUDENT APIs ====================
 
 @app.get("/api/students", response_model=List[StudentInfo])
@@ -207,21 +399,12 @@ async def get_all_students():
 
 @app.get("/api/students/{ma_sv}", response_model=StudentInfo)
 async def get_student(ma_sv: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM SinhVien WHERE MaSV = ?", (ma_sv,))
-    row = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    profile = student_profiles.get(ma_sv)
     
-    if not row:
+    if not profile:
         raise HTTPException(status_code=404, detail="Sinh viên không tồn tại")
     
-    return StudentInfo(
-        ma_sv=row[0], ho_ten=row[1], ngay_sinh=row[2],
-        gioi_tinh=row[3], lop=row[4], khoa=row[5],
-        email=row[6], trang_thai=row[7]
-    )
+    return StudentInfo(**profile)
 
 @app.post("/api/students")
 async def create_student(student: StudentInfo):
@@ -239,6 +422,7 @@ async def create_student(student: StudentInfo):
             student.email, student.trang_thai or 'Đang học'
         ))
         conn.commit()
+        student_profiles.invalidate(student.ma_sv)
         return {"success": True, "message": "Thêm sinh viên thành công"}
     except pyodbc.IntegrityError:
         raise HTTPException(status_code=400, detail="Mã sinh viên đã tồn tại")
@@ -246,25 +430,142 @@ async def create_student(student: StudentInfo):
         cursor.close()
         conn.close()
 
+@app.post("/api/students/import")
+async def import_students_file(file: UploadFile = File(...), format: Optional[str] = Form(None)):
+    """Import hàng loạt sinh viên + đăng ký lớp từ CSV / JSON / JSON Lines.
+
+    File được đọc theo lô, kiểm tra theo cột và ghi bằng fast_executemany;
+    dòng lỗi được trả về trong "errors", các dòng còn lại vẫn được ghi.
+    """
+    fmt = detect_format(file.filename, format)
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="Chỉ hỗ trợ file .csv, .json, .jsonl")
+
+    try:
+        result = await run_in_threadpool(import_students, file.file, fmt)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Không đọc được file: {e}")
+
+    # Hồ sơ mới + danh sách lớp thay đổi -> bỏ cache liên quan
+    for ma_sv in result.pop("created"):
+        student_profiles.invalidate(ma_sv)
+    if result["summary"]["enrollments_created"]:
+        session_rosters.invalidate()
+
+    return {"success": True, **result}
+
 # ==================== TRAINING APIs ====================
 
+def check_near_duplicate_action(near_duplicates: Optional[str]):
+    if near_duplicates is not None and near_duplicates not in NEAR_DUPLICATE_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"near_duplicates phải là một trong {', '.join(NEAR_DUPLICATE_ACTIONS)}")
+
+UPLOAD_MESSAGES = {
+    "saved": "Ảnh đã được lưu",
+    "duplicate": "Ảnh đã tồn tại",
+    "near_duplicate": "Ảnh gần giống ảnh đã có, không lưu",
+}
+
 @app.post("/api/training/upload-image/{ma_sv}")
-async def upload_training_image(ma_sv: str, file: UploadFile = File(...)):
-    """Upload ảnh training cho sinh viên"""
+async def upload_training_image(ma_sv: str, file: UploadFile = File(...), near_duplicates: Optional[str] = None):
+    """Upload ảnh training cho sinh viên.
+    
+    near_duplicates: flag (mặc định) / skip / off - xử lý ảnh gần trùng ảnh đã có
+    (pHash rồi embedding).
+    """
+    check_near_duplicate_action(near_duplicates)
     try:
         contents = await file.read()
-        filepath, error = training_manager.save_training_image(ma_sv, contents)
-        
-        if error:
-            raise HTTPException(status_code=400, detail=error)
-        
-        return {
-            "success": True,
-            "message": "Ảnh đã được lưu",
-            "filepath": filepath
-        }
+        status, result = await run_in_threadpool(
+            training_manager.store_training_image, ma_sv, contents, file.filename, near_duplicates
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if status == "invalid":
+        raise HTTPException(status_code=400, detail=result)
+    
+    return {
+        "success": True,
+        "status": status,
+        "message": UPLOAD_MESSAGES[status],
+        "duplicate": status == "duplicate",
+        "filepath": result
+    }
+
+# Job upload ZIP ảnh training chạy nền: job_id -> trạng thái / kết quả
+# (nhiều worker: ghi thêm vào shared_jobs để poll ở worker khác vẫn thấy)
+training_jobs = {}
+
+def update_training_job(job, **changes):
+    job.update(changes)
+    if shared_jobs is not None:
+        shared_jobs.save(job)
+
+def run_training_zip_job(job_id: str, path: str, ma_sv: Optional[str], train: bool,
+                         near_duplicates: Optional[str] = None):
+    job = training_jobs[job_id]
+    update_training_job(job, status="processing")
+    try:
+        result = training_manager.import_zip(
+            path, ma_sv, known_students=lambda ids: set(student_profiles.get_many(ids)),
+            near_duplicates=near_duplicates
+        )
+        new_files = result.pop("new_files")
+        update_training_job(job, result=result)
+        
+        if train and new_files:
+            update_training_job(job, status="training")
+            job["training"] = training_manager.train_students(new_files)
+            reload_face_database()
+        update_training_job(job, status="done")
+    except Exception as e:
+        update_training_job(job, status="failed", error=str(e))
+    finally:
+        os.remove(path)
+
+@app.post("/api/training/upload-zip")
+async def upload_training_zip(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    ma_sv: Optional[str] = Form(None),
+    train: bool = Form(False),
+    near_duplicates: Optional[str] = Form(None)
+):
+    """Upload ZIP ảnh training cho một hoặc nhiều sinh viên (<MaSV>/<ảnh>).
+    
+    ZIP được ghi xuống đĩa theo chunk rồi xử lý từng entry trong job nền;
+    train=true -> training tăng dần cho các sinh viên có ảnh mới.
+    """
+    check_near_duplicate_action(near_duplicates)
+    fd, path = tempfile.mkstemp(suffix=".zip")
+    with os.fdopen(fd, "wb") as f:
+        while True:
+            chunk = await file.read(1024 * 1024)
+            if not chunk:
+                break
+            f.write(chunk)
+    
+    if not zipfile.is_zipfile(path):
+        os.remove(path)
+        raise HTTPException(status_code=400, detail="File không phải ZIP hợp lệ")
+    
+    job_id = uuid.uuid4().hex
+    training_jobs[job_id] = {"job_id": job_id, "ma_sv": ma_sv, "train": train}
+    update_training_job(training_jobs[job_id], status="queued")
+    background_tasks.add_task(run_training_zip_job, job_id, path, ma_sv, train, near_duplicates)
+    
+    return training_jobs[job_id]
+
+@app.get("/api/training/upload-zip/jobs/{job_id}")
+async def get_training_zip_job(job_id: str):
+    """Trạng thái / kết quả job upload ZIP"""
+    job = training_jobs.get(job_id)
+    if job is None and shared_jobs is not None:
+        job = await run_in_threadpool(shared_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.get("/api/training/images/{ma_sv}")
 async def get_training_images(ma_sv: str):
@@ -277,14 +578,24 @@ async def get_training_images(ma_sv: str):
     }
 
 @app.get("/api/training/image/{ma_sv}/{filename}")
-async def get_training_image(ma_sv: str, filename: str):
-    """Lấy ảnh training"""
-    filepath = os.path.join("dataset_raw", ma_sv, filename)
+async def get_training_image(ma_sv: str, filename: str, request: Request):
+    """Lấy ảnh training (ETag / Last-Modified / Range)"""
+    filepath = training_manager.get_image_path(ma_sv, filename)
+    
+    if filepath is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    return cached_file_response(request, filepath)
+
+@app.get("/api/training/thumbnail/{ma_sv}/{filename}")
+async def get_training_thumbnail(ma_sv: str, filename: str, request: Request):
+    """Thumbnail cho lưới ảnh (tạo nền khi upload, chờ job nếu chưa xong)"""
+    filepath = await run_in_threadpool(training_manager.get_thumbnail_path, ma_sv, filename)
     
-    if not os.path.exists(filepath):
+    if filepath is None:
         raise HTTPException(status_code=404, detail="Image not found")
     
-    return FileResponse(filepath)
+    return cached_file_response(request, filepath, media_type="image/jpeg")
 
 @app.delete("/api/training/image/{ma_sv}/{filename}")
 async def delete_training_image(ma_sv: str, filename: str):
@@ -305,8 +616,57 @@ async def train_student_model(ma_sv: str):
         raise HTTPException(status_code=400, detail=result["message"])
     
     # Reload face database
-    global face_database
-    face_database = load_face_database()
+    reload_face_database()
+    
+    return result
+
+MAX_ENROLLMENT_VIDEO_BYTES = 50 * 1024 * 1024
+
+def enroll_from_video(ma_sv: str, path: str):
+    options = EnrollmentOptions()
+    selection = select_enrollment_faces(path, yolo_model, facenet_model, options)
+    stats = selection["stats"]
+    if len(selection["faces"]) < options.min_faces:
+        return {
+            "success": False,
+            "message": f"Chỉ lấy được {len(selection['faces'])} khuôn mặt đạt chất lượng, cần ít nhất {options.min_faces}",
+            "stats": stats
+        }
+    
+    result = training_manager.enroll_faces(ma_sv, selection["faces"], selection["contexts"])
+    result["stats"] = stats
+    result["qualities"] = [q.to_dict() for q in selection["qualities"]]
+    return result
+
+@app.post("/api/training/enroll-video/{ma_sv}")
+async def enroll_student_from_video(ma_sv: str, file: UploadFile = File(...)):
+    """Đăng ký khuôn mặt từ clip vài giây: chọn crop đa dạng góc mặt rồi training một lần"""
+    suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_ENROLLMENT_VIDEO_BYTES:
+                    raise HTTPException(status_code=413, detail="Video quá lớn (tối đa 50MB)")
+                f.write(chunk)
+        
+        try:
+            result = await run_in_threadpool(enroll_from_video, ma_sv, path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        os.remove(path)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+    
+    reload_face_database()
     
     return result
 
@@ -330,77 +690,275 @@ async def remove_student_training(ma_sv: str):
     training_manager.remove_from_database(ma_sv)
     
     # Reload
-    global face_database
-    face_database = load_face_database()
+    reload_face_database()
     
     return {"success": True, "message": "Đã xóa toàn bộ training data"}
 
 # ==================== RECOGNITION APIs ====================
 
-@app.post("/api/recognize")
-async def recognize_face_endpoint(file: UploadFile = File(...)):
-    """Nhận diện khuôn mặt - Độ chính xác cao"""
-    try:
-        contents = await file.read()
-        
-        # Extract embedding
-        embedding, error = extract_embedding_high_quality(contents)
-        
-        if error:
-            return {
-                "success": False,
-                "message": error,
-                "identity": None,
-                "confidence": 0
-            }
-        
-        # Recognize
-        identity, confidence, top_matches = recognize_with_high_accuracy(embedding)
-        
-        if identity == "Unknown":
-            return {
-                "success": False,
-                "message": "Không nhận diện được",
-                "identity": None,
-                "confidence": confidence,
-                "top_matches": [{"identity": m[0], "score": float(m[1])} for m in top_matches]
-            }
-        
-        # Get student info
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM SinhVien WHERE MaSV = ?", (identity,))
-        row = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        if row:
-            return {
-                "success": True,
-                "identity": identity,
-                "confidence": float(confidence),
-                "student_info": {
-                    "ma_sv": row[0],
-                    "ho_ten": row[1],
-                    "ngay_sinh": row[2].isoformat() if row[2] else None,
-                    "gioi_tinh": row[3],
-                    "lop": row[4],
-                    "khoa": row[5],
-                    "email": row[6]
-                },
-                "top_matches": [{"identity": m[0], "score": float(m[1])} for m in top_matches[:3]]
-            }
-        
+def recognize_image(contents, ma_buoi=None):
+    """Detect + nhận diện một ảnh JPEG/PNG, trả về dict kết quả (dùng chung HTTP và WebSocket)"""
+    # Detect + quality gate
+    face, error, quality = extract_face_high_quality(contents)
+    
+    if error:
         return {
             "success": False,
-            "message": "Nhận diện được nhưng không có trong database",
+            "message": error,
+            "reason": quality.reason if quality else "error",
+            "quality": quality.to_dict() if quality else None,
+            "identity": None,
+            "confidence": 0
+        }
+    
+    # Recognize (cache theo perceptual hash của crop)
+    identity, confidence, top_matches, cached = recognize_face_cached(face, ma_buoi)
+    
+    if identity == "Unknown":
+        return {
+            "success": False,
+            "message": "Không nhận diện được",
+            "identity": None,
+            "confidence": float(confidence),
+            "cached": cached,
+            "top_matches": [{"identity": m[0], "score": float(m[1])} for m in top_matches]
+        }
+    
+    # Get student info (cache hồ sơ, không đọc DB khi đã nạp)
+    student_info = student_profiles.get(identity)
+    
+    if student_info:
+        return {
+            "success": True,
             "identity": identity,
-            "confidence": float(confidence)
+            "confidence": float(confidence),
+            "student_info": student_info,
+            "top_matches": [{"identity": m[0], "score": float(m[1])} for m in top_matches[:3]],
+            "cached": cached
         }
+    
+    return {
+        "success": False,
+        "message": "Nhận diện được nhưng không có trong database",
+        "identity": identity,
+        "confidence": float(confidence)
+    }
+
+@app.post("/api/recognize")
+async def recognize_face_endpoint(file: UploadFile = File(...), ma_buoi: Optional[int] = Form(None)):
+    """Nhận diện khuôn mặt - Độ chính xác cao
+    
+    ma_buoi (tuỳ chọn) là scope của cache: frame gần giống trong cùng buổi học
+    dùng lại kết quả trước đó thay vì chạy lại FaceNet.
+    """
+    try:
+        contents = await file.read()
+        return recognize_image(contents, ma_buoi)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ==================== RECOGNIZE + CHECK-IN (MỘT BƯỚC) ====================
+
+CHECKIN_MATCH_THRESHOLD = 0.65
+
+def match_session(context, embedding):
+    """So khớp với sinh viên của lớp trước; không khớp thì tìm trong toàn bộ gallery
+    để phân biệt sai lớp / không nhận diện được. Trả về (identity, confidence, in_roster)."""
+    identity, score = match_gallery(context.names, context.gallery, embedding, CHECKIN_MATCH_THRESHOLD)
+    if identity is not None:
+        return identity, score, True
+    
+    best = search_global(embedding, k=1)
+    if best and best[0][1] >= CHECKIN_MATCH_THRESHOLD:
+        return best[0][0], best[0][1], False
+    return None, score, False
+
+def record_checkin_latency(timings):
+    for stage, ms in timings.items():
+        checkin_latency.setdefault(stage, deque(maxlen=1000)).append(ms)
+
+def recognize_and_checkin_image(contents, ma_buoi):
+    """Detect -> match theo lớp -> kiểm tra đăng ký / trùng -> ghi điểm danh"""
+    start = perf_counter()
+    timings = {}
+    
+    context = session_rosters.get(ma_buoi, current_face_db(), face_db_version())
+    if context is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy buổi học")
+    
+    face, error, quality = extract_face_high_quality(contents)
+    timings["detect_ms"] = (perf_counter() - start) * 1000
+    
+    response = {"success": False, "ma_buoi": ma_buoi, "identity": None, "confidence": 0}
+    if error:
+        response.update(
+            status="rejected",
+            message=error,
+            reason=quality.reason if quality else "error",
+            quality=quality.to_dict() if quality else None
+        )
+    else:
+        mark = perf_counter()
+        identity, confidence, in_roster, cached = recognize_face_cached(
+            face, ("checkin", ma_buoi), lambda emb: match_session(context, emb)
+        )
+        timings["match_ms"] = (perf_counter() - mark) * 1000
+        response.update(identity=identity, confidence=float(confidence), cached=cached)
+        
+        if identity is None:
+            response.update(status="unknown", message="Không nhận diện được")
+        elif not in_roster:
+            response.update(status="wrong_class", message="Sinh viên không thuộc lớp học phần này")
+        else:
+            response["student_info"] = context.students[identity]
+            mark = perf_counter()
+            if identity in context.checked:
+                result = {"success": False}
+            else:
+                result = ghi_diem_danh_neu_chua_co(identity, ma_buoi, context.session["GioBatDau"])
+                context.checked.add(identity)
+            timings["checkin_ms"] = (perf_counter() - mark) * 1000
+            
+            if result["success"]:
+                response.update(
+                    success=True,
+                    status="checked_in",
+                    trang_thai=result["trang_thai"],
+                    message=f"Điểm danh thành công - {result['trang_thai']}"
+                )
+            else:
+                response.update(status="already_checked_in", message="Sinh viên đã điểm danh rồi")
+    
+    timings["total_ms"] = (perf_counter() - start) * 1000
+    record_checkin_latency(timings)
+    response["latency_ms"] = {k: round(v, 2) for k, v in timings.items()}
+    return response
+
+@app.post("/api/attendance/recognize-checkin")
+async def recognize_and_checkin(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    ma_buoi: int = Form(...)
+):
+    """Nhận diện + điểm danh trong một request.
+
+    status: checked_in | already_checked_in | wrong_class | unknown | rejected.
+    Buổi học, danh sách lớp và hồ sơ sinh viên lấy từ cache (SessionRosterCache).
+    """
+    contents = await file.read()
+    response = await run_in_threadpool(recognize_and_checkin_image, contents, ma_buoi)
+    
+    # Feed SSE cập nhật sau khi đã trả kết quả cho kiosk
+    if response["success"]:
+        background_tasks.add_task(publish_checkins, ma_buoi, [response["identity"]])
+    return response
+
+@app.get("/api/metrics/checkin")
+async def get_checkin_metrics():
+    """Latency nhận diện -> xác nhận điểm danh theo từng bước (ms)"""
+    metrics = {}
+    for stage, samples in checkin_latency.items():
+        values = np.array(samples)
+        metrics[stage] = {
+            "count": len(values),
+            "avg": round(float(values.mean()), 2),
+            "p50": round(float(np.percentile(values, 50)), 2),
+            "p95": round(float(np.percentile(values, 95)), 2),
+            "max": round(float(values.max()), 2)
+        }
+    return {"latency_ms": metrics, "roster_cache": session_rosters.stats}
+
+# ==================== REALTIME RECOGNITION (WEBSOCKET) ====================
+
+# Frame nhị phân: header 8 byte big-endian (MaBuoi uint32, frame_id uint32) + ảnh JPEG.
+# MaBuoi = 0 nghĩa là chỉ nhận diện, không điểm danh.
+FRAME_HEADER = struct.Struct(">II")
+
+@app.websocket("/ws/camera")
+async def camera_websocket(websocket: WebSocket):
+    """Nhận diện realtime qua WebSocket.
+
+    Client gửi frame nhị phân (FRAME_HEADER + JPEG). Server chỉ giữ frame mới nhất:
+    frame đến khi đang nhận diện frame trước sẽ thay frame đang chờ (frame cũ bị bỏ).
+    Server đẩy về sự kiện JSON:
+        {"type": "recognition", "frame_id", "ma_buoi", ...kết quả như /api/recognize, "dropped"}
+        {"type": "checkin", "ma_sv", "ma_buoi", "success", "trang_thai", "message"}
+    Frame có MaBuoi đi qua recognize_and_checkin_image (khớp theo lớp + điểm danh một bước).
+    """
+    await websocket.accept()
+    
+    pending = {"frame": None}
+    frame_ready = asyncio.Event()
+    stats = {"received": 0, "processed": 0, "dropped": 0}
+    
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if not data or len(data) <= FRAME_HEADER.size:
+                continue
+            
+            ma_buoi, frame_id = FRAME_HEADER.unpack_from(data)
+            stats["received"] += 1
+            if pending["frame"] is not None:
+                stats["dropped"] += 1
+            pending["frame"] = (ma_buoi or None, frame_id, data[FRAME_HEADER.size:])
+            frame_ready.set()
+    
+    async def process_frames():
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            frame, pending["frame"] = pending["frame"], None
+            if frame is None:
+                continue
+            
+            ma_buoi, frame_id, jpeg = frame
+            try:
+                if ma_buoi:
+                    result = await run_in_threadpool(recognize_and_checkin_image, jpeg, ma_buoi)
+                else:
+                    result = await run_in_threadpool(recognize_image, jpeg)
+            except HTTPException as e:
+                result = {"success": False, "message": e.detail, "identity": None, "confidence": 0}
+            except Exception as e:
+                result = {"success": False, "message": str(e), "identity": None, "confidence": 0}
+            stats["processed"] += 1
+            
+            await websocket.send_json({
+                "type": "recognition",
+                "frame_id": frame_id,
+                "ma_buoi": ma_buoi,
+                **result,
+                "dropped": stats["dropped"]
+            })
+            
+            if result.get("status") in ("checked_in", "wrong_class"):
+                await websocket.send_json({
+                    "type": "checkin",
+                    "ma_sv": result["identity"],
+                    "ho_ten": result.get("student_info", {}).get("ho_ten"),
+                    "ma_buoi": ma_buoi,
+                    "success": result["success"],
+                    "trang_thai": result.get("trang_thai"),
+                    "message": result["message"]
+                })
+                if result["success"]:
+                    await run_in_threadpool(publish_checkins, ma_buoi, [result["identity"]])
+    
+    tasks = [asyncio.create_task(receive_frames()), asyncio.create_task(process_frames())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        print(f"[ws] camera closed: {stats}")
+
 # ==================== SESSION APIs ====================
 
 @app.get("/api/sessions/today")
@@ -467,51 +1025,37 @@ async def get_sessions_by_date(date: str = None):
     date format: YYYY-MM-DD (vd: 2026-01-25)
     Nếu không truyền date, lấy hôm nay
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    if date:
-        query = """
-            SELECT 
-                bh.MaBuoi, bh.MaLHP, bh.NgayHoc, bh.GioBatDau,
-                lhp.GiangVien, mh.TenMon
-            FROM BuoiHoc bh
-            JOIN LopHocPhan lhp ON bh.MaLHP = lhp.MaLHP
-            JOIN MonHoc mh ON lhp.MaMon = mh.MaMon
-            WHERE bh.NgayHoc = ?
-            ORDER BY bh.GioBatDau
-        """
-        cursor.execute(query, (date,))
-    else:
-        query = """
-            SELECT 
-                bh.MaBuoi, bh.MaLHP, bh.NgayHoc, bh.GioBatDau,
-                lhp.GiangVien, mh.TenMon
-            FROM BuoiHoc bh
-            JOIN LopHocPhan lhp ON bh.MaLHP = lhp.MaLHP
-            JOIN MonHoc mh ON lhp.MaMon = mh.MaMon
-            WHERE bh.NgayHoc = CAST(GETDATE() AS DATE)
-            ORDER BY bh.GioBatDau
-        """
-        cursor.execute(query)
-    
-    sessions = []
-    for row in cursor.fetchall():
-        ngay_hoc = row[2].isoformat() if row[2] else None
-        gio_bat_dau = row[3].strftime("%H:%M:%S") if row[3] else None
-        
-        sessions.append({
-            "ma_buoi": row[0],
-            "ma_lhp": row[1],
-            "ngay_hoc": ngay_hoc,
-            "gio_bat_dau": gio_bat_dau,
-            "giang_vien": row[4],
-            "ten_mon": row[5]
-        })
-    
-    cursor.close()
-    conn.close()
-    return sessions
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d").date() if date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date phải có dạng YYYY-MM-DD")
+
+    # Đọc từ timeline trong bộ nhớ (ScheduleService), DB chỉ bị hỏi khi lịch thay đổi
+    return [s.to_dict() for s in schedule.sessions_on(day)]
+
+
+@app.get("/api/sessions/active")
+async def get_active_session():
+    """Buổi học đang diễn ra (cùng cửa sổ thời gian với kiosk), null nếu không có"""
+    active = schedule.active_session()
+    return active.to_dict() if active else None
+
+
+@app.post("/api/sessions")
+async def create_session(session: SessionCreate):
+    try:
+        ma_buoi = tao_buoi_hoc(session.ma_lhp, session.ngay_hoc, session.gio_bat_dau)
+    except pyodbc.IntegrityError:
+        raise HTTPException(status_code=400, detail=f"Lớp học phần {session.ma_lhp} không tồn tại")
+
+    schedule.invalidate(session.ngay_hoc)
+    return {"success": True, "ma_buoi": ma_buoi}
+
+
+@app.get("/api/metrics/schedule")
+async def schedule_metrics():
+    return schedule.stats
+
 # ==================== ATTENDANCE APIs ====================
 
 @app.post("/api/attendance/checkin")
@@ -520,18 +1064,6 @@ async def checkin_attendance(ma_sv: str, ma_buoi: int):
     cursor = conn.cursor()
     
     try:
-        # Check đã điểm danh chưa
-        cursor.execute("""
-            SELECT COUNT(*) FROM DiemDanh 
-            WHERE MaSV = ? AND MaBuoi = ?
-        """, (ma_sv, ma_buoi))
-        
-        if cursor.fetchone()[0] > 0:
-            return {
-                "success": False,
-                "message": "Sinh viên đã điểm danh rồi"
-            }
-        
         # Lấy giờ bắt đầu
         cursor.execute("SELECT GioBatDau FROM BuoiHoc WHERE MaBuoi = ?", (ma_buoi,))
         result = cursor.fetchone()
@@ -539,27 +1071,13 @@ async def checkin_attendance(ma_sv: str, ma_buoi: int):
         if not result:
             raise HTTPException(status_code=404, detail="Không tìm thấy buổi học")
         
-        gio_bat_dau = result[0]
-        gio_hien_tai = datetime.now().time()
-        
-        # Xác định trạng thái
-        gio_bat_dau_dt = datetime.combine(datetime.today(), gio_bat_dau)
-        gio_cho_phep = (gio_bat_dau_dt + timedelta(minutes=15)).time()
+        # Check trùng + ghi điểm danh trong một INSERT có khoá (cùng guard với kiosk / batch)
+        result = await run_in_threadpool(ghi_diem_danh_neu_chua_co, ma_sv, ma_buoi, result[0])
+        if not result["success"]:
+            return result
         
-        if gio_hien_tai <= gio_bat_dau:
-            trang_thai = "Đúng giờ"
-        elif gio_hien_tai <= gio_cho_phep:
-            trang_thai = "Trễ"
-        else:
-            trang_thai = "Trễ"
-        
-        # Ghi điểm danh
-        cursor.execute("""
-            INSERT INTO DiemDanh (MaSV, MaBuoi, ThoiGianQuet, TrangThai, NguonQuet)
-            VALUES (?, ?, ?, ?, ?)
-        """, (ma_sv, ma_buoi, datetime.now(), trang_thai, "Webcam"))
-        
-        conn.commit()
+        trang_thai = result["trang_thai"]
+        publish_checkins(ma_buoi, [ma_sv], cursor)
         
         return {
             "success": True,
@@ -572,19 +1090,57 @@ async def checkin_attendance(ma_sv: str, ma_buoi: int):
         cursor.close()
         conn.close()
 
-@app.get("/api/attendance/session/{ma_buoi}")
-async def get_session_attendance(ma_buoi: int):
-    conn = get_connection()
-    cursor = conn.cursor()
+MAX_BATCH_CHECKIN = 2000
+
+@app.post("/api/attendance/checkin/batch")
+async def checkin_attendance_batch(request: BatchCheckinRequest, background_tasks: BackgroundTasks):
+    """Điểm danh nhiều sinh viên trong một buổi (giảng viên sửa điểm danh, ảnh cả lớp).
+
+    Một truy vấn kiểm tra danh sách lớp + đã điểm danh, một transaction executemany
+    cho các dòng mới; trả về kết quả từng sinh viên.
+    """
+    if len(request.students) > MAX_BATCH_CHECKIN:
+        raise HTTPException(status_code=400, detail=f"Tối đa {MAX_BATCH_CHECKIN} sinh viên mỗi lần")
     
-    cursor.execute("""
+    items = [(s.ma_sv, s.trang_thai, s.thoi_gian_quet) for s in request.students]
+    results = await run_in_threadpool(diem_danh_hang_loat, request.ma_buoi, items, request.nguon_quet)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy buổi học")
+    
+    inserted = [ma_sv for ma_sv, status, _ in results if status == "checked_in"]
+    if inserted:
+        session_rosters.invalidate(request.ma_buoi)
+        background_tasks.add_task(publish_checkins, request.ma_buoi, inserted)
+    
+    summary = {}
+    for _, status, _ in results:
+        summary[status] = summary.get(status, 0) + 1
+    
+    return {
+        "success": True,
+        "ma_buoi": request.ma_buoi,
+        "summary": summary,
+        "results": [
+            {"ma_sv": ma_sv, "status": status, "trang_thai": trang_thai}
+            for ma_sv, status, trang_thai in results
+        ]
+    }
+
+def query_session_attendance(cursor, ma_buoi, ma_svs=None):
+    """Danh sách điểm danh của buổi học (mới nhất trước), có thể lọc theo list MaSV"""
+    query = """
         SELECT dd.MaDiemDanh, sv.MaSV, sv.HoTen, sv.Lop,
                dd.ThoiGianQuet, dd.TrangThai, dd.NguonQuet
         FROM DiemDanh dd
         JOIN SinhVien sv ON dd.MaSV = sv.MaSV
         WHERE dd.MaBuoi = ?
-        ORDER BY dd.ThoiGianQuet DESC
-    """, (ma_buoi,))
+    """
+    params = [ma_buoi]
+    # Danh sách ngắn lọc bằng IN, danh sách dài lọc sau khi đọc cả buổi
+    if ma_svs is not None and len(ma_svs) <= 50:
+        query += " AND dd.MaSV IN (" + ", ".join("?" * len(ma_svs)) + ")"
+        params += list(ma_svs)
+    cursor.execute(query + " ORDER BY dd.ThoiGianQuet DESC", params)
     
     records = []
     for row in cursor.fetchall():
@@ -598,10 +1154,131 @@ async def get_session_attendance(ma_buoi: int):
             "nguon_quet": row[6]
         })
     
-    cursor.close()
-    conn.close()
+    if ma_svs is not None and len(ma_svs) > 50:
+        wanted = set(ma_svs)
+        records = [r for r in records if r["ma_sv"] in wanted]
     return records
 
+def load_session_attendance(ma_buoi, ma_svs=None):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        return query_session_attendance(cursor, ma_buoi, ma_svs)
+    finally:
+        cursor.close()
+        conn.close()
+
+def publish_checkins(ma_buoi, ma_svs, cursor=None):
+    """Đẩy bản ghi điểm danh vừa ghi lên feed SSE của buổi học"""
+    if not ma_svs:
+        return
+    if cursor is None:
+        records = load_session_attendance(ma_buoi, ma_svs)
+    else:
+        records = query_session_attendance(cursor, ma_buoi, ma_svs)
+    
+    # Query trả mới nhất trước -> publish theo thứ tự thời gian
+    for record in reversed(records):
+        attendance_events.publish(ma_buoi, "checkin", record)
+
+@app.get("/api/attendance/session/{ma_buoi}")
+async def get_session_attendance(ma_buoi: int):
+    return load_session_attendance(ma_buoi)
+
+def format_sse(event_type, data, event_id):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.get("/api/attendance/session/{ma_buoi}/stream")
+async def stream_session_attendance(ma_buoi: int, request: Request, last_event_id: Optional[str] = Header(None)):
+    """Feed SSE điểm danh của buổi học.
+
+    Kết nối mới (hoặc Last-Event-ID không nối tiếp được) nhận event `snapshot`
+    với toàn bộ danh sách, sau đó mỗi lần điểm danh là một event `checkin`
+    chứa một bản ghi. EventSource tự gửi Last-Event-ID khi nối lại, server
+    chỉ phát lại các event còn thiếu.
+    """
+    queue, replay, seq = attendance_events.subscribe(ma_buoi, last_event_id)
+    
+    async def event_stream():
+        try:
+            if replay is None:
+                records = await run_in_threadpool(load_session_attendance, ma_buoi)
+                yield format_sse("snapshot", records, attendance_events.event_id(seq))
+            else:
+                for event_seq, event_type, data in replay:
+                    yield format_sse(event_type, data, attendance_events.event_id(event_seq))
+            
+            while not await request.is_disconnected():
+                try:
+                    event_seq, event_type, data = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event_type, data, attendance_events.event_id(event_seq))
+        finally:
+            attendance_events.unsubscribe(ma_buoi, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/metrics/attendance-events")
+async def get_attendance_event_metrics():
+    """Số event đã phát / giao và số client SSE đang kết nối"""
+    return attendance_events.metrics()
+
+# ==================== VIDEO ATTENDANCE APIs ====================
+
+# Job xử lý video chạy nền: job_id -> trạng thái / kết quả
+video_jobs = {}
+
+def run_video_job(job_id: str, path: str, ma_buoi: int, video_start: Optional[datetime]):
+    video_jobs[job_id]["status"] = "processing"
+    try:
+        result = process_lecture_video(path, ma_buoi, video_start=video_start)
+        video_jobs[job_id].update(status="done", result=result)
+        if result["success"]:
+            publish_checkins(ma_buoi, result["inserted"])
+    except Exception as e:
+        video_jobs[job_id].update(status="failed", error=str(e))
+    finally:
+        os.remove(path)
+
+@app.post("/api/attendance/video/{ma_buoi}")
+async def upload_lecture_video(
+    ma_buoi: int,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    video_start: Optional[datetime] = Form(None)
+):
+    """Upload video bài giảng để điểm danh offline (NguonQuet = Video)"""
+    suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    
+    # Ghi file theo từng chunk, không đọc toàn bộ video vào RAM
+    with os.fdopen(fd, "wb") as f:
+        while True:
+            chunk = await file.read(1024 * 1024)
+            if not chunk:
+                break
+            f.write(chunk)
+    
+    job_id = uuid.uuid4().hex
+    video_jobs[job_id] = {"job_id": job_id, "ma_buoi": ma_buoi, "status": "queued"}
+    background_tasks.add_task(run_video_job, job_id, path, ma_buoi, video_start)
+    
+    return video_jobs[job_id]
+
+@app.get("/api/attendance/video/jobs/{job_id}")
+async def get_video_job(job_id: str):
+    """Trạng thái / kết quả job điểm danh từ video"""
+    job = video_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 # ==================== ANALYTICS APIs - REAL DATA ====================
 
 @app.get("/api/analytics/dashboard")
@@ -955,4 +1632,8 @@ if __name__ == "__main__":
     print("📍 Server: http://localhost:8000")
     print("📚 Docs: http://localhost:8000/docs")
     print("=" * 60)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if SERVING_WORKERS > 1:
+        # Mỗi worker import lại main (model + gallery trong shared memory)
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=SERVING_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
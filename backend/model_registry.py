@@ -0,0 +1,213 @@
+"""
+Model registry - load YOLO/FaceNet một lần cho mỗi process và chọn inference backend
+
+Backend FaceNet (biến môi trường FACENET_BACKEND):
+    eager        PyTorch fp32 như trước
+    torchscript  TorchScript đã freeze (models/facenet_torchscript.pt)
+    onnx         ONNX Runtime CPU (models/facenet.onnx)
+    int8         dynamic quantization int8 (quantize lúc load, không cần file)
+
+Artifact torchscript/onnx được tạo bằng: python scripts/export_models.py
+
+INFERENCE_SERVICE=<socket> -> get_yolo / get_facenet trả proxy tới sidecar
+(inference_service.py), model chỉ nằm trong process của sidecar.
+"""
+
+import os
+import numpy as np
+import torch
+from facenet_pytorch import InceptionResnetV1
+from ultralytics import YOLO
+
+MODELS_DIR = "models"
+FACENET_INPUT_SIZE = 160
+TORCHSCRIPT_PATH = os.path.join(MODELS_DIR, "facenet_torchscript.pt")
+ONNX_PATH = os.path.join(MODELS_DIR, "facenet.onnx")
+
+BACKENDS = ("eager", "torchscript", "onnx", "int8")
+DEFAULT_BACKEND = os.environ.get("FACENET_BACKEND", "eager")
+DEFAULT_YOLO_WEIGHTS = os.environ.get("YOLO_WEIGHTS", "yolov8n.pt")
+INFERENCE_SERVICE = os.environ.get("INFERENCE_SERVICE")
+
+# ==================== INFERENCE BACKENDS ====================
+# Mọi backend nhận tensor NCHW float32 và trả về tensor (N, 512),
+# nên code cũ dạng facenet_model(x).cpu().numpy() vẫn dùng được.
+
+class EagerBackend:
+    name = "eager"
+
+    def __init__(self, model):
+        self.model = model.eval()
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.model(batch)
+
+
+class TorchScriptBackend:
+    name = "torchscript"
+
+    def __init__(self, path=TORCHSCRIPT_PATH):
+        self.model = torch.jit.load(path, map_location="cpu").eval()
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.model(batch)
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, path=ONNX_PATH):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        inputs = batch.detach().cpu().numpy().astype(np.float32, copy=False)
+        outputs = self.session.run(None, {self.input_name: inputs})[0]
+        return torch.from_numpy(outputs)
+
+
+class QuantizedBackend(EagerBackend):
+    """Dynamic int8 quantization cho các lớp Linear (last_linear / logits)"""
+    name = "int8"
+
+    def __init__(self, model):
+        quantized = torch.ao.quantization.quantize_dynamic(
+            model.eval(), {torch.nn.Linear}, dtype=torch.qint8
+        )
+        super().__init__(quantized)
+
+# ==================== THREADS ====================
+
+def configure_threads(workers=1):
+    """Chia core cho các worker cùng máy: mỗi process dùng cores // workers thread
+    cho torch (và ONNX Runtime, đọc lại torch.get_num_threads()) + OpenCV.
+    TORCH_NUM_THREADS ghi đè. Phải gọi trước khi load model."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    threads = int(os.environ.get("TORCH_NUM_THREADS", max(1, cores // max(1, workers))))
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1 if workers > 1 else threads)
+    except RuntimeError:
+        pass    # đã có phép tính song song chạy trước, giữ nguyên
+    import cv2
+    cv2.setNumThreads(threads)
+    return threads
+
+# ==================== LOAD / EXPORT ====================
+
+_facenet_cache = {}
+_yolo_cache = {}
+_clients = {}
+
+def get_inference_client(priority="interactive"):
+    """Client tới inference sidecar (một cho mỗi priority), None nếu không cấu hình"""
+    if not INFERENCE_SERVICE:
+        return None
+    if priority not in _clients:
+        from inference_service import InferenceClient
+        _clients[priority] = InferenceClient(INFERENCE_SERVICE, priority)
+    return _clients[priority]
+
+def load_facenet_eager():
+    """InceptionResnetV1 pretrained vggface2 (fp32, eager)"""
+    return InceptionResnetV1(pretrained='vggface2').eval()
+
+def build_backend(backend):
+    """Tạo backend theo tên, ném lỗi nếu thiếu artifact"""
+    if backend == "eager":
+        return EagerBackend(load_facenet_eager())
+    if backend == "int8":
+        return QuantizedBackend(load_facenet_eager())
+    if backend == "torchscript":
+        if not os.path.exists(TORCHSCRIPT_PATH):
+            raise FileNotFoundError(f"{TORCHSCRIPT_PATH} not found, run scripts/export_models.py")
+        return TorchScriptBackend()
+    if backend == "onnx":
+        if not os.path.exists(ONNX_PATH):
+            raise FileNotFoundError(f"{ONNX_PATH} not found, run scripts/export_models.py")
+        return OnnxBackend()
+    raise ValueError(f"Unknown FaceNet backend: {backend} (available: {', '.join(BACKENDS)})")
+
+def get_facenet(backend=None, remote=True, priority="interactive"):
+    """Lấy FaceNet theo backend, mỗi backend chỉ load một lần / process.
+
+    Nếu backend được chọn không load được thì fallback về eager. Có INFERENCE_SERVICE
+    (và remote=True) thì trả proxy tới sidecar, backend do sidecar quyết định.
+    """
+    client = get_inference_client(priority) if remote else None
+    if client is not None:
+        from inference_service import RemoteFacenet
+        client.stats()      # sidecar chưa chạy -> lỗi ngay lúc khởi động
+        return RemoteFacenet(client)
+
+    backend = backend or DEFAULT_BACKEND
+
+    if backend not in _facenet_cache:
+        try:
+            _facenet_cache[backend] = build_backend(backend)
+        except Exception as e:
+            if backend == "eager":
+                raise
+            print(f"⚠️ FaceNet backend '{backend}' không load được ({e}), dùng eager")
+            _facenet_cache[backend] = get_facenet("eager", remote=False)
+
+    return _facenet_cache[backend]
+
+def get_yolo(weights=None, remote=True, priority="interactive"):
+    """Lấy YOLO theo file weights (.pt hoặc .onnx đã export), cache theo đường dẫn"""
+    weights = weights or DEFAULT_YOLO_WEIGHTS
+    client = get_inference_client(priority) if remote else None
+    if client is not None:
+        from inference_service import RemoteYolo
+        return RemoteYolo(client, weights)
+
+    if weights not in _yolo_cache:
+        _yolo_cache[weights] = YOLO(weights)
+
+    return _yolo_cache[weights]
+
+def export_torchscript(path=TORCHSCRIPT_PATH):
+    """Trace + freeze InceptionResnetV1 sang TorchScript"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    model = load_facenet_eager()
+    example = torch.rand(1, 3, FACENET_INPUT_SIZE, FACENET_INPUT_SIZE)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        frozen = torch.jit.freeze(traced)
+
+    frozen.save(path)
+    return path
+
+def export_onnx(path=ONNX_PATH, opset=17):
+    """Export InceptionResnetV1 sang ONNX với batch size động"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    model = load_facenet_eager()
+    example = torch.rand(1, 3, FACENET_INPUT_SIZE, FACENET_INPUT_SIZE)
+
+    torch.onnx.export(
+        model, example, path,
+        input_names=["input"],
+        output_names=["embedding"],
+        dynamic_axes={"input": {0: "batch"}, "embedding": {0: "batch"}},
+        opset_version=opset,
+    )
+    return path
+
+def export_yolo_onnx(weights=None):
+    """Export YOLO sang ONNX (ultralytics), trả về đường dẫn file .onnx"""
+    model = YOLO(weights or DEFAULT_YOLO_WEIGHTS)
+    return model.export(format="onnx")
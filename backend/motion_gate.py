@@ -0,0 +1,82 @@
+"""
+Motion gate rẻ tiền trước YOLO
+
+So sánh frame thu nhỏ (grayscale, blur) với background cập nhật dần:
+    - không có thay đổi   -> bỏ qua detection, dùng lại box của lần trước
+    - thay đổi cục bộ     -> chỉ detect trong vùng thay đổi (ROI, có padding)
+    - thay đổi lớn / keyframe định kỳ -> detect toàn frame
+"""
+
+import cv2
+import numpy as np
+
+class MotionGate:
+    def __init__(self, width=160, pixel_threshold=25, min_changed_ratio=0.002,
+                 full_frame_ratio=0.35, padding=0.15, keyframe_interval=50, learning_rate=0.1):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_ratio = min_changed_ratio      # dưới ngưỡng này coi như cảnh tĩnh
+        self.full_frame_ratio = full_frame_ratio        # ROI lớn hơn tỉ lệ này thì detect cả frame
+        self.padding = padding
+        self.keyframe_interval = keyframe_interval
+        self.learning_rate = learning_rate
+        self._background = None
+        self._since_keyframe = 0
+        self.stats = {"frames": 0, "skipped": 0, "roi": 0, "full": 0}
+
+    def reset(self):
+        self._background = None
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        scale = self.width / float(w)
+        small = cv2.resize(frame, (self.width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0).astype(np.float32), scale
+
+    def check(self, frame):
+        """Trả về (mode, roi): mode là 'skip', 'roi' hoặc 'full'; roi = (x1, y1, x2, y2) ở độ phân giải gốc"""
+        self.stats["frames"] += 1
+        small, scale = self._small(frame)
+
+        if self._background is None:
+            self._background = small
+            self._since_keyframe = 0
+            self.stats["full"] += 1
+            return "full", None
+
+        diff = cv2.absdiff(small, self._background)
+        cv2.accumulateWeighted(small, self._background, self.learning_rate)
+        mask = (diff > self.pixel_threshold).astype(np.uint8)
+
+        self._since_keyframe += 1
+        if self._since_keyframe >= self.keyframe_interval:
+            self._since_keyframe = 0
+            self.stats["full"] += 1
+            return "full", None
+
+        changed = int(mask.sum())
+        if changed < self.min_changed_ratio * mask.size:
+            self.stats["skipped"] += 1
+            return "skip", None
+
+        x, y, w, h = cv2.boundingRect(mask)
+        if w * h > self.full_frame_ratio * mask.size:
+            self.stats["full"] += 1
+            return "full", None
+
+        # Map ROI về độ phân giải gốc + padding
+        fh, fw = frame.shape[:2]
+        pad_x, pad_y = int(w * self.padding) + 2, int(h * self.padding) + 2
+        x1 = max(0, int((x - pad_x) / scale))
+        y1 = max(0, int((y - pad_y) / scale))
+        x2 = min(fw, int((x + w + pad_x) / scale))
+        y2 = min(fh, int((y + h + pad_y) / scale))
+
+        self.stats["roi"] += 1
+        return "roi", (x1, y1, x2, y2)
+
+def boxes_outside(boxes, roi):
+    """Các box không giao với roi (giữ lại box cũ ở vùng không thay đổi)"""
+    rx1, ry1, rx2, ry2 = roi
+    return [b for b in boxes if b[2] <= rx1 or b[0] >= rx2 or b[3] <= ry1 or b[1] >= ry2]
@@ -0,0 +1,238 @@
+"""
+Ingest nhiều camera với một detector / embedder dùng chung
+
+Mỗi camera (device index, RTSP URL hoặc file video) có một capture thread
+riêng ghi vào buffer latest-frame-wins. Một inference thread gom frame mới
+nhất của tất cả camera thành một batch YOLO, rồi gom mọi khuôn mặt cần embed
+thành một batch FaceNet, nên N camera chỉ tốn một bản model và ít hơn nhiều
+so với N lần chi phí một camera. Check-in chạy ở sink thread riêng.
+"""
+
+import json
+import queue
+import threading
+import time
+
+from face_tracker import FaceTracker
+from pipeline import CaptureStage, EndOfStream, StageQueue, StageStats, is_file_source
+from preprocessing import embed_faces
+from session_checkin import SessionCheckin
+
+class CameraConfig:
+    def __init__(self, camera_id, source, room=None, ma_buoi=None):
+        self.camera_id = str(camera_id)
+        self.source = str(source)
+        self.room = room
+        self.ma_buoi = ma_buoi
+
+def load_camera_config(path):
+    """Đọc cấu hình camera từ file JSON:
+    [{"id": "A101-door", "source": "rtsp://...", "room": "A101", "ma_buoi": 12}, ...]
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+
+    return [
+        CameraConfig(item.get("id", i), item["source"], item.get("room"), item.get("ma_buoi"))
+        for i, item in enumerate(items)
+    ]
+
+
+class CameraState:
+    """Capture thread, tracker, trạng thái điểm danh và thống kê của một camera"""
+
+    def __init__(self, config, stop_event, schedule=None):
+        self.config = config
+        self.frames = StageQueue(maxsize=1, drop_oldest=not is_file_source(config.source))
+        self.capture = CaptureStage(config.source, self.frames, stop_event, config.camera_id)
+        self.tracker = FaceTracker()
+        self.checkin = SessionCheckin(ma_buoi=config.ma_buoi, label=config.room or config.camera_id,
+                                      schedule=schedule)
+        self.finished = False
+        self.processed = 0
+        self.faces = 0
+        self.checkins = 0
+        self.last_lag_ms = 0.0
+        self.total_lag_ms = 0.0
+
+    def stats(self, elapsed):
+        capture = self.capture.stats
+        return {
+            "source": self.config.source,
+            "room": self.config.room,
+            "ma_buoi": self.checkin.current_session["MaBuoi"] if self.checkin.current_session else None,
+            "capture_fps": round(capture.count / elapsed, 2),
+            "processed_fps": round(self.processed / elapsed, 2),
+            "lag_ms": round(self.last_lag_ms, 1),
+            "avg_lag_ms": round(self.total_lag_ms / self.processed, 1) if self.processed else 0.0,
+            "drops": self.frames.drops,
+            "faces": self.faces,
+            "checkins": self.checkins,
+            "finished": self.finished,
+        }
+
+
+class MultiCameraIngest:
+    def __init__(self, cameras, detector, embedder, recognize_fn,
+                 conf=0.5, match_threshold=0.5, on_checkin=None, schedule=None, realtime=None):
+        self.stop_event = threading.Event()
+        # schedule (ScheduleService) dùng chung: các camera tự tìm buổi học tra cùng một timeline
+        self.cameras = [CameraState(c, self.stop_event, schedule) for c in cameras]
+        self.detector = detector
+        self.embedder = embedder
+        self.recognize_fn = recognize_fn
+        self.conf = conf
+        self.match_threshold = match_threshold
+        self.on_checkin = on_checkin
+
+        # Như Pipeline: có camera live thì sink bỏ item cũ (không chặn inference của mọi camera),
+        # chỉ có file video thì backpressure để không mất check-in nào
+        if realtime is None:
+            realtime = not all(is_file_source(c.source) for c in cameras)
+        self.realtime = realtime
+        self.sink_queue = StageQueue(maxsize=len(self.cameras) * 2, drop_oldest=realtime)
+        self.detect_stats = StageStats("detect")
+        self.embed_stats = StageStats("embed")
+        self.batch_frames = 0
+        self.batch_faces = 0
+        self.started_at = None
+
+        self._inference_thread = threading.Thread(target=self._inference_loop, name="inference", daemon=True)
+        self._sink_thread = threading.Thread(target=self._sink_loop, name="checkin-sink", daemon=True)
+
+    # ==================== LIFECYCLE ====================
+
+    def start(self):
+        self.started_at = time.time()
+        for cam in self.cameras:
+            cam.capture.start()
+        self._inference_thread.start()
+        self._sink_thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        for cam in self.cameras:
+            cam.frames.close()
+        self.sink_queue.close()
+
+    def join(self, timeout=None):
+        self._inference_thread.join(timeout)
+        self._sink_thread.join(timeout)
+
+    @property
+    def running(self):
+        return self._inference_thread.is_alive() or self._sink_thread.is_alive()
+
+    # ==================== INFERENCE ====================
+
+    def _collect_frames(self):
+        """Lấy frame mới nhất (nếu có) của mỗi camera"""
+        batch = []
+        for cam in self.cameras:
+            if cam.finished:
+                continue
+            try:
+                batch.append((cam, cam.frames.get(timeout=0)))
+            except queue.Empty:
+                continue
+            except EndOfStream:
+                cam.finished = True
+        return batch
+
+    def _inference_loop(self):
+        try:
+            while not self.stop_event.is_set():
+                batch = self._collect_frames()
+                if not batch:
+                    if all(cam.finished for cam in self.cameras):
+                        break
+                    time.sleep(0.005)
+                    continue
+                self._process_batch(batch)
+        finally:
+            self.sink_queue.close()
+
+    def _process_batch(self, batch):
+        # 1. Một lần YOLO cho frame của tất cả camera
+        start = time.perf_counter()
+        results = self.detector([packet.frame for _, packet in batch], conf=self.conf, verbose=False)
+        self.detect_stats.record((time.perf_counter() - start) * 1000)
+
+        pending = []
+        for (cam, packet), result in zip(batch, results):
+            for box in result.boxes.xyxy:
+                x1, y1, x2, y2 = map(int, box)
+                if x2 > x1 and y2 > y1:
+                    packet.boxes.append((x1, y1, x2, y2))
+
+            packet.tracks = cam.tracker.update(packet.boxes)
+            for track in packet.tracks:
+                if cam.tracker.needs_embedding(track):
+                    pending.append((cam, packet, track))
+
+        # 2. Một lần FaceNet cho mọi khuôn mặt cần embed
+        if pending:
+            start = time.perf_counter()
+            crops = [p.frame[t.box[1]:t.box[3], t.box[0]:t.box[2]] for _, p, t in pending]
+            embeddings = embed_faces(self.embedder, crops)
+            self.embed_stats.record((time.perf_counter() - start) * 1000)
+
+            for (cam, _, track), emb in zip(pending, embeddings):
+                name, score = self.recognize_fn(emb.reshape(1, -1))
+                if score >= self.match_threshold and name != "Unknown":
+                    cam.tracker.mark_embedded(track, name, score)
+                else:
+                    cam.tracker.mark_embedded(track, None, score)
+
+        self.batch_frames += len(batch)
+        self.batch_faces += len(pending)
+
+        now = time.time()
+        for cam, packet in batch:
+            cam.processed += 1
+            cam.faces += len(packet.boxes)
+            cam.last_lag_ms = (now - packet.captured_at) * 1000
+            cam.total_lag_ms += cam.last_lag_ms
+            self.sink_queue.put((cam, packet))
+
+    # ==================== CHECK-IN SINK ====================
+
+    def _sink_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                cam, packet = self.sink_queue.get(timeout=0.1)
+            except queue.Empty:
+                for cam in self.cameras:
+                    cam.checkin.refresh()
+                continue
+            except EndOfStream:
+                break
+
+            try:
+                cam.checkin.refresh()
+                for ma_sv in cam.checkin.process(packet.tracks):
+                    cam.checkins += 1
+                    print(f"[{cam.config.camera_id}] [SUCCESS] Điểm danh: {ma_sv}")
+                    if self.on_checkin:
+                        self.on_checkin(cam.config, ma_sv)
+            except Exception as e:
+                print(f"⚠️ [{cam.config.camera_id}] Checkin error: {e}")
+
+    # ==================== STATS ====================
+
+    def stats(self):
+        elapsed = max(time.time() - (self.started_at or time.time()), 1e-6)
+        batches = self.detect_stats.count
+        return {
+            "cameras": {cam.config.camera_id: cam.stats(elapsed) for cam in self.cameras},
+            "shared": {
+                "batches": batches,
+                "avg_frames_per_batch": round(self.batch_frames / batches, 2) if batches else 0.0,
+                "avg_faces_embedded_per_batch": round(self.batch_faces / batches, 2) if batches else 0.0,
+                "detect": self.detect_stats.to_dict(),
+                "embed": self.embed_stats.to_dict(),
+                "realtime": self.realtime,
+                "sink_drops": self.sink_queue.drops,
+            },
+        }
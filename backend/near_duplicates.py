@@ -0,0 +1,60 @@
+"""
+Phát hiện ảnh training gần trùng lúc upload
+
+Ảnh chụp webcam liên tục thường gần như giống hệt nhau: tốn YOLO + FaceNet lúc
+training mà không thêm thông tin. Hai tầng so với ảnh đã có của sinh viên, cùng
+trên crop khuôn mặt của detector enrollment (pHash cả ảnh chủ yếu là phông nền:
+ảnh hai người khác nhau trước cùng một phông cũng khớp):
+    1. pHash 64 bit của crop: Hamming <= PHASH_MAX_DISTANCE
+    2. Embedding FaceNet (chỉ khi tầng 1 không khớp): cosine >= EMBEDDING_MIN_SIMILARITY
+
+Đo trên dataset_cropped: frame webcam liên tiếp 59% <= 6, ảnh khác của cùng người 0.5%,
+hai người khác nhau 0/1000 cặp. Ảnh không thấy mặt không bị kiểm tra.
+
+face_phash + embedding được lưu trong manifest (dataset_index/<MaSV>.json).
+"""
+
+import base64
+
+import numpy as np
+
+from recognition_cache import face_hash, hamming
+
+PHASH_MAX_DISTANCE = 6
+EMBEDDING_MIN_SIMILARITY = 0.97
+ACTIONS = ("skip", "flag", "off")   # skip: không lưu; flag: lưu nhưng đánh dấu, bỏ qua khi training
+
+def image_phash(face):
+    """pHash dạng hex của crop khuôn mặt (BGR / xám)"""
+    return f"{face_hash(face):016x}"
+
+def encode_embedding(embedding):
+    """Embedding đã chuẩn hoá L2 -> base64 float16 (1KB) để lưu trong manifest"""
+    return base64.b64encode(np.asarray(embedding, dtype=np.float16).tobytes()).decode("ascii")
+
+def decode_embedding(text):
+    return np.frombuffer(base64.b64decode(text), dtype=np.float16).astype(np.float32)
+
+def find_by_phash(images, phash):
+    """(filename, khoảng cách) của ảnh gần nhất theo pHash nếu đủ gần, ngược lại None"""
+    key = int(phash, 16)
+    best = None
+    for filename, entry in images.items():
+        if not entry.get("face_phash"):
+            continue
+        distance = hamming(key, int(entry["face_phash"], 16))
+        if distance <= PHASH_MAX_DISTANCE and (best is None or distance < best[1]):
+            best = (filename, distance)
+    return best
+
+def find_by_embedding(images, embedding):
+    """(filename, cosine) của ảnh có embedding gần nhất nếu đủ gần, ngược lại None"""
+    names = [f for f, e in images.items() if e.get("embedding")]
+    if not names or embedding is None:
+        return None
+    matrix = np.stack([decode_embedding(images[f]["embedding"]) for f in names])
+    scores = matrix @ embedding
+    best = int(np.argmax(scores))
+    if scores[best] >= EMBEDDING_MIN_SIMILARITY:
+        return names[best], float(scores[best])
+    return None
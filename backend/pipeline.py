@@ -0,0 +1,262 @@
+"""
+Pipeline nhiều luồng cho kiosk điểm danh
+
+    capture -> [latest frame] -> detect -> [queue] -> embed/match -> [queue] -> check-in sink
+
+Mỗi stage chạy trên một thread riêng, nối với nhau bằng queue có giới hạn.
+Camera live dùng chế độ latest-frame-wins (frame cũ bị bỏ, có đếm drop);
+nguồn là file video thì capture chờ stage sau để không bỏ frame nào,
+nhờ vậy có thể chạy headless để test.
+"""
+
+import os
+import queue
+import threading
+import time
+import cv2
+
+class EndOfStream(Exception):
+    """Stage phía trước đã kết thúc và queue đã rỗng"""
+
+
+class StageQueue:
+    """Queue giới hạn kích thước, có thể đóng.
+
+    drop_oldest=True: khi đầy thì bỏ item cũ nhất (latest-wins, đếm vào drops).
+    drop_oldest=False: producer chờ tới khi có chỗ (backpressure).
+    """
+
+    def __init__(self, maxsize=2, drop_oldest=True):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.drop_oldest = drop_oldest
+        self.closed = False
+        self.drops = 0
+
+    def put(self, item):
+        if not self.drop_oldest:
+            while not self.closed:
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+            return
+
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.drops += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=0.1):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            if self.closed and self._queue.empty():
+                raise EndOfStream()
+            raise
+
+    def close(self):
+        self.closed = True
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self.errors = 0
+
+    def record(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.last_ms = ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def to_dict(self, drops=0, backlog=0):
+        return {
+            "processed": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "last_ms": round(self.last_ms, 2),
+            "errors": self.errors,
+            "drops": drops,
+            "backlog": backlog,
+        }
+
+
+class FramePacket:
+    """Dữ liệu đi qua các stage cho một frame"""
+
+    def __init__(self, frame_id, frame, camera_id=None):
+        self.frame_id = frame_id
+        self.frame = frame
+        self.camera_id = camera_id
+        self.captured_at = time.time()
+        self.boxes = []
+        self.tracks = []
+        self.events = []
+
+
+def is_file_source(source):
+    return isinstance(source, str) and os.path.isfile(source)
+
+def open_source(source):
+    """Mở VideoCapture từ device index ("0"), URL RTSP/HTTP hoặc file video"""
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    return cv2.VideoCapture(source)
+
+
+class CaptureStage(threading.Thread):
+    def __init__(self, source, outbox, stop_event, camera_id=None):
+        super().__init__(name=f"capture-{camera_id}" if camera_id else "capture", daemon=True)
+        self.source = source
+        self.outbox = outbox
+        self.stop_event = stop_event
+        self.camera_id = camera_id
+        self.stats = StageStats("capture")
+
+    def run(self):
+        cap = open_source(self.source)
+        frame_id = 0
+        try:
+            while not self.stop_event.is_set():
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                self.stats.record((time.perf_counter() - start) * 1000)
+                frame_id += 1
+                self.outbox.put(FramePacket(frame_id, frame, self.camera_id))
+        finally:
+            cap.release()
+            self.outbox.close()
+
+
+class WorkerStage(threading.Thread):
+    """Lấy packet từ inbox, gọi fn(packet), đẩy kết quả sang outbox (nếu có)"""
+
+    def __init__(self, name, fn, inbox, outbox, stop_event):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop_event = stop_event
+        self.stats = StageStats(name)
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    packet = self.inbox.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                except EndOfStream:
+                    break
+
+                start = time.perf_counter()
+                try:
+                    result = self.fn(packet)
+                except Exception as e:
+                    self.stats.errors += 1
+                    print(f"⚠️ [{self.name}] {e}")
+                    continue
+                self.stats.record((time.perf_counter() - start) * 1000)
+
+                if result is not None and self.outbox is not None:
+                    self.outbox.put(result)
+        finally:
+            if self.outbox is not None:
+                self.outbox.close()
+
+
+class AttendancePipeline:
+    """Ghép capture -> detect -> embed/match -> sink.
+
+    detect_fn, embed_fn, sink_fn nhận FramePacket và trả về packet
+    (hoặc None để bỏ frame). Packet cuối cùng qua sink được lưu ở `latest`.
+    """
+
+    def __init__(self, source, detect_fn, embed_fn, sink_fn, queue_size=2, realtime=None):
+        if realtime is None:
+            realtime = not is_file_source(source)
+
+        self.source = source
+        self.realtime = realtime
+        self.stop_event = threading.Event()
+        self.latest = None
+        self.started_at = None
+
+        self.frames = StageQueue(maxsize=1, drop_oldest=realtime)
+        self.detected = StageQueue(maxsize=queue_size, drop_oldest=realtime)
+        self.matched = StageQueue(maxsize=queue_size, drop_oldest=realtime)
+
+        self._sink_fn = sink_fn
+        self.capture = CaptureStage(source, self.frames, self.stop_event)
+        self.stages = [
+            WorkerStage("detect", detect_fn, self.frames, self.detected, self.stop_event),
+            WorkerStage("embed", embed_fn, self.detected, self.matched, self.stop_event),
+            WorkerStage("sink", self._sink, self.matched, None, self.stop_event),
+        ]
+
+    def _sink(self, packet):
+        packet = self._sink_fn(packet)
+        if packet is not None:
+            self.latest = packet
+        return packet
+
+    def start(self):
+        self.started_at = time.time()
+        self.capture.start()
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        for q in (self.frames, self.detected, self.matched):
+            q.close()
+
+    def join(self, timeout=None):
+        self.capture.join(timeout)
+        for stage in self.stages:
+            stage.join(timeout)
+
+    @property
+    def running(self):
+        return any(stage.is_alive() for stage in self.stages)
+
+    def stats(self):
+        """Latency / drop của từng stage, drops tính ở queue đầu ra của stage"""
+        elapsed = max(time.time() - (self.started_at or time.time()), 1e-6)
+        outboxes = [self.frames, self.detected, self.matched, None]
+        result = {}
+        for stage, outbox in zip([self.capture] + self.stages, outboxes):
+            result[stage.stats.name] = stage.stats.to_dict(
+                drops=outbox.drops if outbox else 0,
+                backlog=outbox.qsize() if outbox else 0,
+            )
+        result["capture"]["fps"] = round(self.capture.stats.count / elapsed, 2)
+        result["sink"]["fps"] = round(self.stages[-1].stats.count / elapsed, 2)
+        if self.latest is not None:
+            result["sink"]["lag_ms"] = round((time.time() - self.latest.captured_at) * 1000, 1)
+        return result
+
+def format_stats(stats):
+    lines = []
+    for name, s in stats.items():
+        extra = f" fps={s['fps']}" if "fps" in s else ""
+        lines.append(f"  {name:<8} n={s['processed']:<6} avg={s['avg_ms']:>7.2f}ms "
+                     f"max={s['max_ms']:>7.2f}ms drops={s['drops']:<5} backlog={s['backlog']}{extra}")
+    return "\n".join(lines)
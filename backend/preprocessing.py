@@ -0,0 +1,79 @@
+"""
+Tiền xử lý khuôn mặt dùng chung cho nhận diện và training
+
+Chuẩn duy nhất: crop BGR (OpenCV) -> resize 160x160 -> RGB -> NCHW float32 / 255.
+Mọi entry point (main.py, app.py, training_module, scripts) đều đi qua module này
+để embedding lúc enroll và lúc nhận diện được tạo giống hệt nhau.
+"""
+
+import threading
+import cv2
+import numpy as np
+import torch
+
+FACE_SIZE = 160
+DEFAULT_MAX_BATCH = 32
+
+class FacePreprocessor:
+    """Gom N crop thành một batch tensor NCHW, tái sử dụng buffer cấp phát sẵn.
+
+    Tensor trả về là view của buffer nội bộ, chỉ hợp lệ tới lần gọi kế tiếp,
+    nên mỗi thread dùng một instance riêng (xem preprocess_faces).
+    """
+
+    def __init__(self, size=FACE_SIZE, max_batch=DEFAULT_MAX_BATCH):
+        self.size = size
+        self._allocate(max_batch)
+
+    def _allocate(self, max_batch):
+        self.max_batch = max_batch
+        self._pixels = np.empty((max_batch, self.size, self.size, 3), dtype=np.uint8)
+        self._pixels_t = torch.from_numpy(self._pixels)
+        self._batch = torch.empty((max_batch, 3, self.size, self.size), dtype=torch.float32)
+
+    def __call__(self, crops, bgr=True):
+        n = len(crops)
+        if n > self.max_batch:
+            self._allocate(max(n, self.max_batch * 2))
+
+        # Resize thẳng vào buffer uint8, không tạo array mới cho từng mặt
+        for i, crop in enumerate(crops):
+            cv2.resize(crop, (self.size, self.size), dst=self._pixels[i])
+
+        # NHWC uint8 -> NCHW float32, đảo kênh BGR -> RGB ngay khi copy
+        pixels = self._pixels_t[:n]
+        batch = self._batch[:n]
+        order = (2, 1, 0) if bgr else (0, 1, 2)
+        for dst_c, src_c in enumerate(order):
+            batch[:, dst_c].copy_(pixels[..., src_c])
+        batch.mul_(1.0 / 255.0)
+
+        return batch
+
+_local = threading.local()
+
+def get_preprocessor():
+    """FacePreprocessor riêng cho thread hiện tại"""
+    if not hasattr(_local, "preprocessor"):
+        _local.preprocessor = FacePreprocessor()
+    return _local.preprocessor
+
+def preprocess_faces(crops, bgr=True):
+    """N crop (ảnh OpenCV) -> tensor (N, 3, 160, 160) đã chuẩn hóa"""
+    return get_preprocessor()(crops, bgr=bgr)
+
+def embed_faces(model, crops, bgr=True, batch_size=DEFAULT_MAX_BATCH):
+    """Tính embedding cho danh sách crop theo batch, trả về np.ndarray (N, 512)"""
+    if len(crops) == 0:
+        return np.empty((0, 512), dtype=np.float32)
+    if hasattr(model, "embed_crops"):
+        # Proxy tới inference sidecar: gửi crop uint8, sidecar tự preprocess + gom batch
+        return model.embed_crops(crops, bgr=bgr)
+
+    outputs = []
+    for i in range(0, len(crops), batch_size):
+        batch = preprocess_faces(crops[i:i + batch_size], bgr=bgr)
+        with torch.no_grad():
+            outputs.append(model(batch).cpu().numpy())
+
+    return np.concatenate(outputs)
@@ -0,0 +1,102 @@
+"""
+Cache kết quả nhận diện theo perceptual hash của crop khuôn mặt
+
+Frontend auto-capture gửi liên tục các frame gần như giống hệt nhau khi sinh viên
+đứng yên. Crop mặt được băm (pHash 64 bit: DCT của ảnh xám 32x32, so với median);
+crop có Hamming distance <= max_distance với crop đã nhận diện trong cùng scope
+(thường là MaBuoi) dùng lại kết quả cũ, không chạy FaceNet.
+
+Mỗi scope là một LRU riêng (max_entries), entry hết hạn sau ttl giây.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+HASH_SIZE = 8
+HASH_INPUT = 32
+
+def face_hash(face):
+    """pHash 64 bit (int) của crop BGR / xám"""
+    gray = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY) if face.ndim == 3 else face
+    small = cv2.resize(gray, (HASH_INPUT, HASH_INPUT), interpolation=cv2.INTER_AREA)
+    dct = cv2.dct(small.astype(np.float32))[:HASH_SIZE, :HASH_SIZE]
+    bits = (dct > np.median(dct)).reshape(-1)
+    return int(np.packbits(bits).view(">u8")[0])
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class RecognitionCache:
+    def __init__(self, max_entries=256, ttl=10.0, max_distance=4, max_scopes=64):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.max_scopes = max_scopes
+        self._scopes = OrderedDict()        # scope -> OrderedDict(hash -> (expires_at, result))
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def get(self, scope, key):
+        """Kết quả đã cache cho crop gần giống `key` trong scope, None nếu không có"""
+        now = time.time()
+        with self._lock:
+            self.stats["lookups"] += 1
+            entries = self._scopes.get(scope)
+            if entries is not None:
+                self._scopes.move_to_end(scope)
+
+                expired = [h for h, (expires_at, _) in entries.items() if expires_at <= now]
+                for h in expired:
+                    del entries[h]
+                self.stats["expired"] += len(expired)
+
+                # Duyệt từ entry mới nhất, lấy entry đầu tiên đủ gần
+                for h in reversed(entries):
+                    if hamming(h, key) <= self.max_distance:
+                        entries.move_to_end(h)
+                        self.stats["hits"] += 1
+                        return entries[h][1]
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, scope, key, result):
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries is None:
+                entries = self._scopes[scope] = OrderedDict()
+                if len(self._scopes) > self.max_scopes:
+                    _, dropped = self._scopes.popitem(last=False)
+                    self.stats["evicted"] += len(dropped)
+            self._scopes.move_to_end(scope)
+
+            entries[key] = (time.time() + self.ttl, result)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def clear(self, scope=None):
+        """Xóa một scope, hoặc toàn bộ (vd sau khi face_db thay đổi)"""
+        with self._lock:
+            if scope is None:
+                self._scopes.clear()
+            else:
+                self._scopes.pop(scope, None)
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.stats["lookups"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "scopes": len(self._scopes),
+                "entries": sum(len(e) for e in self._scopes.values()),
+                "ttl": self.ttl,
+                "max_distance": self.max_distance,
+            }
@@ -0,0 +1,182 @@
+"""
+Lịch học trong bộ nhớ: tìm buổi học đang diễn ra bằng binary search
+
+Mỗi ngày được nạp một lần (BuoiHoc + LopHocPhan + MonHoc) thành timeline sắp
+theo giờ bắt đầu. Buổi học "đang diễn ra" giống get_current_active_session:
+GioBatDau trong [now - SESSION_DURATION_MINUTES, now + SESSION_EARLY_MINUTES],
+lấy buổi bắt đầu muộn nhất.
+
+Làm mới khi sang ngày mới, khi invalidate() (tạo buổi học qua API) hoặc khi
+dấu phiên bản của lịch trong DB đổi (kiểm tra mỗi `check_interval` giây, một
+truy vấn COUNT/CHECKSUM thay vì join đầy đủ). Thread nền (start()) nạp trước
+danh sách lớp của buổi sắp bắt đầu `prefetch_minutes` phút và gọi `on_prefetch`.
+"""
+
+import threading
+import time as systime
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+from database.attendance_service import (
+    SESSION_DURATION_MINUTES,
+    SESSION_EARLY_MINUTES,
+    get_class_roster,
+    get_schedule_version,
+    get_sessions_on
+)
+
+MAX_PREFETCHED_ROSTERS = 8
+ROSTER_TTL_SECONDS = 300        # đăng ký lớp mới (import, API) được thấy sau tối đa 5 phút
+
+class ScheduledSession:
+    def __init__(self, row):
+        self.ma_buoi, self.ma_lhp, self.ngay_hoc, self.gio_bat_dau, self.giang_vien, self.ten_mon = row
+        self.start = datetime.combine(self.ngay_hoc, self.gio_bat_dau)
+
+    def to_dict(self):
+        """Định dạng của /api/sessions/*"""
+        return {
+            "ma_buoi": self.ma_buoi,
+            "ma_lhp": self.ma_lhp,
+            "ngay_hoc": self.ngay_hoc.isoformat(),
+            "gio_bat_dau": self.gio_bat_dau.strftime("%H:%M:%S"),
+            "giang_vien": self.giang_vien,
+            "ten_mon": self.ten_mon
+        }
+
+    def to_session_dict(self):
+        """Định dạng của get_current_active_session / get_session (kiosk)"""
+        return {"MaBuoi": self.ma_buoi, "MaLHP": self.ma_lhp, "GioBatDau": self.gio_bat_dau}
+
+
+class DayTimeline:
+    def __init__(self, day, rows, version):
+        self.day = day
+        self.sessions = sorted((ScheduledSession(r) for r in rows if r[3] is not None), key=lambda s: s.start)
+        self.starts = [s.start for s in self.sessions]
+        self.version = version
+        self.checked_at = systime.time()
+
+
+class ScheduleService:
+    def __init__(self, check_interval=60, prefetch_minutes=5, max_days=31, on_prefetch=None):
+        self.check_interval = check_interval
+        self.prefetch_minutes = prefetch_minutes
+        self.max_days = max_days
+        self.on_prefetch = on_prefetch          # callback(ScheduledSession) khi nạp trước
+        self._days = {}
+        self._rosters = {}                      # MaBuoi -> (set MaSV, thời điểm nạp)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {"lookups": 0, "loads": 0, "version_checks": 0, "prefetched": 0}
+
+    # ---------- timeline ----------
+
+    def _load(self, day):
+        version = get_schedule_version(day)
+        timeline = DayTimeline(day, get_sessions_on(day), version)
+        with self._lock:
+            self.stats["loads"] += 1
+            self._days[day] = timeline
+            # Chỉ giữ hôm nay + các ngày được hỏi gần đây
+            while len(self._days) > self.max_days:
+                oldest = min((d for d in self._days if d != date.today()), key=lambda d: self._days[d].checked_at)
+                del self._days[oldest]
+        return timeline
+
+    def timeline(self, day=None):
+        day = day or date.today()
+        with self._lock:
+            timeline = self._days.get(day)
+
+        if timeline is None:
+            return self._load(day)
+
+        if systime.time() - timeline.checked_at > self.check_interval:
+            self.stats["version_checks"] += 1
+            if get_schedule_version(day) != timeline.version:
+                return self._load(day)
+            timeline.checked_at = systime.time()
+        return timeline
+
+    def invalidate(self, day=None):
+        """Gọi sau khi tạo / sửa buổi học; day=None xoá toàn bộ"""
+        with self._lock:
+            if day is None:
+                self._days.clear()
+            else:
+                self._days.pop(day, None)
+
+    # ---------- lookup ----------
+
+    def sessions_on(self, day=None):
+        return self.timeline(day).sessions
+
+    def active_session(self, now=None):
+        """Buổi học đang diễn ra (ScheduledSession) hoặc None"""
+        now = now or datetime.now()
+        timeline = self.timeline(now.date())
+        self.stats["lookups"] += 1
+
+        # Buổi bắt đầu muộn nhất trước now + EARLY, còn trong khoảng DURATION
+        i = bisect_right(timeline.starts, now + timedelta(minutes=SESSION_EARLY_MINUTES)) - 1
+        if i >= 0 and timeline.starts[i] >= now - timedelta(minutes=SESSION_DURATION_MINUTES):
+            return timeline.sessions[i]
+        return None
+
+    def next_session(self, now=None):
+        now = now or datetime.now()
+        timeline = self.timeline(now.date())
+        i = bisect_right(timeline.starts, now)
+        return timeline.sessions[i] if i < len(timeline.sessions) else None
+
+    # ---------- prefetch ----------
+
+    def roster(self, ma_buoi):
+        """Danh sách lớp đã nạp trước (set MaSV), None nếu chưa nạp hoặc quá ROSTER_TTL_SECONDS"""
+        with self._lock:
+            entry = self._rosters.get(ma_buoi)
+        if entry is None or systime.time() - entry[1] > ROSTER_TTL_SECONDS:
+            return None
+        return entry[0]
+
+    def prefetch(self, now=None):
+        """Nạp trước danh sách lớp của buổi sắp bắt đầu / đang diễn ra"""
+        now = now or datetime.now()
+        upcoming = [self.active_session(now), self.next_session(now)]
+        for session in upcoming:
+            if session is None or session.start - now > timedelta(minutes=self.prefetch_minutes):
+                continue
+            if self.roster(session.ma_buoi) is not None:
+                continue
+
+            roster = get_class_roster(session.ma_lhp)
+            with self._lock:
+                self._rosters.pop(session.ma_buoi, None)
+                self._rosters[session.ma_buoi] = (roster, systime.time())
+                # Chỉ giữ vài buổi gần nhất (dict giữ thứ tự chèn)
+                while len(self._rosters) > MAX_PREFETCHED_ROSTERS:
+                    del self._rosters[next(iter(self._rosters))]
+                self.stats["prefetched"] += 1
+            print(f"[schedule] prefetched roster {session.ma_lhp} (MaBuoi={session.ma_buoi}, {len(roster)} SV)")
+
+            if self.on_prefetch:
+                self.on_prefetch(session)
+
+    def start(self, interval=30):
+        """Thread nền: kiểm tra lịch + nạp trước mỗi `interval` giây"""
+        def loop():
+            while True:
+                try:
+                    self.prefetch()
+                except Exception as e:
+                    print(f"⚠️ Schedule prefetch error: {e}")
+                if self._stop.wait(interval):
+                    break
+
+        thread = threading.Thread(target=loop, name="schedule-prefetch", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,118 @@
+"""
+So sánh các FaceNet backend: độ lệch embedding (cosine) so với eager và latency
+Chạy: python scripts/benchmark_backends.py [--images 64] [--batch 8]
+Kết quả in ra bảng và lưu vào models/backend_report.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import BACKENDS, build_backend
+
+DATASET_PATH = "dataset_cropped"
+REPORT_PATH = "models/backend_report.json"
+
+parser = argparse.ArgumentParser(description="Benchmark FaceNet backends")
+parser.add_argument("--images", type=int, default=64)
+parser.add_argument("--batch", type=int, default=8)
+parser.add_argument("--repeat", type=int, default=5)
+parser.add_argument("--backends", nargs="*", default=list(BACKENDS))
+args = parser.parse_args()
+
+def load_samples(limit):
+    """Lấy tối đa `limit` ảnh crop 160x160 (RGB) từ dataset_cropped"""
+    faces = []
+    for person in sorted(os.listdir(DATASET_PATH)):
+        person_path = os.path.join(DATASET_PATH, person)
+        if not os.path.isdir(person_path):
+            continue
+        for img_name in sorted(os.listdir(person_path)):
+            img = cv2.imread(os.path.join(person_path, img_name))
+            if img is None:
+                continue
+            img = cv2.cvtColor(cv2.resize(img, (160, 160)), cv2.COLOR_BGR2RGB)
+            faces.append(img)
+            if len(faces) >= limit:
+                return faces
+    return faces
+
+def embed_all(backend, batch):
+    """Chạy toàn bộ ảnh qua backend, trả về embeddings và latency từng batch (ms)"""
+    embeddings, latencies = [], []
+    for i in range(0, len(batch), args.batch):
+        chunk = batch[i:i + args.batch]
+        start = time.perf_counter()
+        out = backend(chunk).cpu().numpy()
+        latencies.append((time.perf_counter() - start) * 1000)
+        embeddings.append(out)
+    return np.concatenate(embeddings), latencies
+
+if not os.path.exists(DATASET_PATH):
+    print("❌ Không tìm thấy thư mục dataset_cropped")
+    exit()
+
+faces = load_samples(args.images)
+print(f">>> Loaded {len(faces)} faces, batch={args.batch}, threads={torch.get_num_threads()}")
+
+batch = torch.from_numpy(np.stack(faces)).permute(0, 3, 1, 2).float() / 255.0
+
+reference = None
+report = {"images": len(faces), "batch": args.batch, "threads": torch.get_num_threads(), "backends": {}}
+
+for name in args.backends:
+    try:
+        backend = build_backend(name)
+    except Exception as e:
+        print(f"⚠️ {name}: skipped ({e})")
+        continue
+
+    embed_all(backend, batch[:args.batch])  # warmup
+
+    all_latencies = []
+    for _ in range(args.repeat):
+        embeddings, latencies = embed_all(backend, batch)
+        all_latencies.extend(latencies)
+
+    normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    if reference is None:
+        reference = normed
+
+    cosine = np.sum(normed * reference, axis=1)
+    drift = 1.0 - cosine
+    # Top-1 agreement: nearest neighbour của mỗi ảnh có giống eager không
+    nn_ref = np.argsort(-(reference @ reference.T), axis=1)[:, 1]
+    nn_cur = np.argsort(-(normed @ normed.T), axis=1)[:, 1]
+
+    report["backends"][name] = {
+        "latency_ms_p50": float(np.percentile(all_latencies, 50)),
+        "latency_ms_p95": float(np.percentile(all_latencies, 95)),
+        "ms_per_face": float(np.mean(all_latencies) / args.batch),
+        "cosine_drift_mean": float(drift.mean()),
+        "cosine_drift_max": float(drift.max()),
+        "top1_agreement": float(np.mean(nn_ref == nn_cur)),
+    }
+
+print("\n" + "=" * 78)
+print(f"{'backend':<12}{'p50 ms':>10}{'p95 ms':>10}{'ms/face':>10}{'drift mean':>13}{'drift max':>12}{'top1':>8}")
+print("=" * 78)
+for name, r in report["backends"].items():
+    print(f"{name:<12}{r['latency_ms_p50']:>10.2f}{r['latency_ms_p95']:>10.2f}{r['ms_per_face']:>10.2f}"
+          f"{r['cosine_drift_mean']:>13.6f}{r['cosine_drift_max']:>12.6f}{r['top1_agreement']:>8.2%}")
+
+os.makedirs("models", exist_ok=True)
+with open(REPORT_PATH, "w") as f:
+    json.dump(report, f, indent=2)
+
+print(f"\n🎉 DONE! Saved {REPORT_PATH}")
+
+
+#  python scripts/benchmark_backends.py
@@ -0,0 +1,93 @@
+"""
+Đo CPU của detection có / không có motion gate trên một clip đã ghi
+Chạy: python scripts/benchmark_motion_gate.py --video corridor.mp4 [--weights yolov8n-face.pt]
+Kết quả in ra bảng và lưu vào models/motion_gate_report.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import get_yolo
+from motion_gate import MotionGate
+
+REPORT_PATH = "models/motion_gate_report.json"
+
+parser = argparse.ArgumentParser(description="Benchmark motion-gated detection")
+parser.add_argument("--video", required=True)
+parser.add_argument("--weights", default="yolov8n-face.pt")
+parser.add_argument("--max-frames", type=int, default=0)
+args = parser.parse_args()
+
+yolo = get_yolo(args.weights)
+
+def run(gated):
+    cap = cv2.VideoCapture(args.video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    gate = MotionGate() if gated else None
+    frames = yolo_calls = yolo_pixels = 0
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    while True:
+        ret, frame = cap.read()
+        if not ret or (args.max_frames and frames >= args.max_frames):
+            break
+        frames += 1
+
+        if gate is None:
+            mode, roi = "full", None
+        else:
+            mode, roi = gate.check(frame)
+
+        if mode == "skip":
+            continue
+        if mode == "roi":
+            x1, y1, x2, y2 = roi
+            frame = frame[y1:y2, x1:x2]
+
+        yolo(frame, conf=0.5, verbose=False)
+        yolo_calls += 1
+        yolo_pixels += frame.shape[0] * frame.shape[1]
+
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    cap.release()
+
+    clip_seconds = frames / fps
+    return {
+        "frames": frames,
+        "yolo_calls": yolo_calls,
+        "yolo_megapixels": round(yolo_pixels / 1e6, 1),
+        "cpu_s": round(cpu, 2),
+        "wall_s": round(wall, 2),
+        # CPU-giây trên mỗi giây video = số core bị chiếm nếu chạy realtime
+        "cores_at_realtime": round(cpu / clip_seconds, 3) if clip_seconds else None,
+        "gate": gate.stats if gate else None,
+    }
+
+print(f">>> Video: {args.video}")
+report = {"video": args.video, "baseline": run(False), "gated": run(True)}
+
+print("\n" + "=" * 72)
+print(f"{'mode':<10}{'frames':>8}{'yolo':>8}{'MPix':>10}{'cpu s':>10}{'wall s':>10}{'cores@rt':>12}")
+print("=" * 72)
+for name in ("baseline", "gated"):
+    r = report[name]
+    print(f"{name:<10}{r['frames']:>8}{r['yolo_calls']:>8}{r['yolo_megapixels']:>10}"
+          f"{r['cpu_s']:>10}{r['wall_s']:>10}{r['cores_at_realtime']:>12}")
+print(f"\nGate: {report['gated']['gate']}")
+
+os.makedirs("models", exist_ok=True)
+with open(REPORT_PATH, "w") as f:
+    json.dump(report, f, indent=2)
+
+print(f"\n🎉 DONE! Saved {REPORT_PATH}")
+
+
+#  python scripts/benchmark_motion_gate.py --video corridor.mp4
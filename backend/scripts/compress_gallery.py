@@ -0,0 +1,199 @@
+"""
+Build gallery nén (PCA + PQ) từ models/face_db.pkl và báo cáo so với gallery flat float32:
+bộ nhớ, tốc độ quét, độ lệch kết quả nhận diện.
+
+Chạy:
+    python scripts/compress_gallery.py --dim 128 --subspaces 16 --save
+    python scripts/compress_gallery.py --dims 64 128 256 --synthetic 20000   # mô phỏng gallery toàn trường
+    python scripts/compress_gallery.py --queries dataset_cropped --images 200  # query là ảnh thật (FaceNet)
+
+Báo cáo in ra bảng và lưu vào models/gallery_report.json. --save ghi gallery của
+--dim vào models/gallery_pq/ (dùng với GALLERY_MODE=pq).
+"""
+
+import argparse
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compressed_gallery import CompressedGallery, gallery_rows
+
+FACE_DB_PATH = "models/face_db.pkl"
+OUTPUT_DIR = "models/gallery_pq"
+REPORT_PATH = "models/gallery_report.json"
+THRESHOLD = 0.65
+
+parser = argparse.ArgumentParser(description="Compressed gallery (PCA + PQ) build + report")
+parser.add_argument("--dim", type=int, default=128, help="Số chiều PCA của gallery được lưu")
+parser.add_argument("--dims", type=int, nargs="*", help="Các số chiều PCA để so sánh (mặc định: --dim)")
+parser.add_argument("--subspaces", type=int, default=16)
+parser.add_argument("--bits", type=int, default=8)
+parser.add_argument("--synthetic", type=int, default=0, help="Thêm N identity ngẫu nhiên để đo ở quy mô lớn")
+parser.add_argument("--queries", help="Thư mục dataset_cropped để lấy query thật (cần FaceNet)")
+parser.add_argument("--images", type=int, default=200, help="Số query tối đa")
+parser.add_argument("--noise", type=float, default=0.5, help="Độ nhiễu của query tổng hợp")
+parser.add_argument("--repeat", type=int, default=3)
+parser.add_argument("--save", action="store_true", help=f"Ghi gallery --dim vào {OUTPUT_DIR}")
+args = parser.parse_args()
+
+def load_gallery():
+    face_db = {}
+    if os.path.exists(FACE_DB_PATH):
+        with open(FACE_DB_PATH, "rb") as f:
+            face_db = pickle.load(f)
+    names, matrix = gallery_rows(face_db)
+
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        fake = rng.standard_normal((args.synthetic, 512)).astype(np.float32)
+        fake /= np.linalg.norm(fake, axis=1, keepdims=True)
+        names += [f"SYN{i:06d}" for i in range(args.synthetic)]
+        matrix = np.vstack([matrix, fake])
+    return names, matrix
+
+def real_queries(names):
+    """(embeddings, nhãn) từ ảnh crop của các identity có trong gallery"""
+    import cv2
+    from model_registry import get_facenet
+    from preprocessing import embed_faces
+
+    faces, labels = [], []
+    known = set(names)
+    for person in sorted(os.listdir(args.queries)):
+        folder = os.path.join(args.queries, person)
+        if person not in known or not os.path.isdir(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            img = cv2.imread(os.path.join(folder, filename))
+            if img is not None:
+                faces.append(img)
+                labels.append(person)
+            if len(faces) >= args.images:
+                break
+        if len(faces) >= args.images:
+            break
+    embeddings = embed_faces(get_facenet(), faces) if faces else np.zeros((0, 512), dtype=np.float32)
+    return embeddings, labels
+
+def synthetic_queries(names, matrix):
+    """Vector gallery + nhiễu Gauss (nhãn = identity gốc)"""
+    rng = np.random.default_rng(1)
+    idx = rng.choice(len(matrix), min(args.images, len(matrix)), replace=False)
+    noise = rng.standard_normal((len(idx), matrix.shape[1])).astype(np.float32)
+    noise *= args.noise / np.sqrt(matrix.shape[1])
+    queries = matrix[idx] + noise
+    return queries, [names[i] for i in idx]
+
+def flat_search(matrix, names, q):
+    scores = matrix @ (q / np.linalg.norm(q))
+    best = int(np.argmax(scores))
+    return names[best], float(scores[best])
+
+def timed(fn, queries):
+    """µs / query (tốt nhất trong --repeat lần) + kết quả của lần cuối"""
+    best = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        results = [fn(q) for q in queries]
+        elapsed = (time.perf_counter() - start) / max(len(queries), 1) * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 1), results
+
+def evaluate(gallery, matrix, names, queries, labels, flat_results):
+    def pq_search(rerank):
+        def search(q):
+            found = gallery.search(q, k=1, rerank=rerank)
+            return found[0] if found else (None, 0.0)
+        return search
+
+    row = {"footprint": gallery.footprint()}
+    for mode, rerank in (("adc", False), ("adc_rerank", True)):
+        us, results = timed(pq_search(rerank), queries)
+        agree = np.mean([r[0] == f[0] for r, f in zip(results, flat_results)])
+        recall = np.mean([r[0] == label for r, label in zip(results, labels)])
+        decision = np.mean([(r[1] >= THRESHOLD) == (f[1] >= THRESHOLD) for r, f in zip(results, flat_results)])
+        score_err = np.mean([abs(r[1] - f[1]) for r, f in zip(results, flat_results)])
+        row[mode] = {
+            "us_per_query": us,
+            "top1_agreement": round(float(agree), 4),
+            "recall_at_1": round(float(recall), 4),
+            "threshold_agreement": round(float(decision), 4),
+            "mean_abs_score_error": round(float(score_err), 4),
+        }
+    return row
+
+names, matrix = load_gallery()
+if len(matrix) < 2:
+    print("❌ Gallery cần ít nhất 2 vector (train thêm sinh viên hoặc dùng --synthetic)")
+    sys.exit(1)
+
+if args.queries:
+    queries, labels = real_queries(names)
+else:
+    queries, labels = synthetic_queries(names, matrix)
+if len(queries) == 0:
+    print("❌ Không có query nào")
+    sys.exit(1)
+
+print(f">>> Gallery: {len(names)} vectors, {len(queries)} queries "
+      f"({'ảnh thật' if args.queries else f'tổng hợp, noise={args.noise}'})")
+
+flat_us, flat_results = timed(lambda q: flat_search(matrix, names, q), queries)
+report = {
+    "vectors": len(names),
+    "queries": len(queries),
+    "query_source": "real" if args.queries else "synthetic",
+    "flat": {
+        "bytes": int(matrix.nbytes),
+        "us_per_query": flat_us,
+        "recall_at_1": round(float(np.mean([f[0] == label for f, label in zip(flat_results, labels)])), 4),
+    },
+    "pq": {},
+}
+
+for dim in args.dims or [args.dim]:
+    started = time.perf_counter()
+    gallery = CompressedGallery.train(names, matrix, dim=dim, subspaces=args.subspaces, bits=args.bits)
+    train_s = time.perf_counter() - started
+
+    # Đo rerank trên vector đọc qua memmap như lúc chạy thật
+    tmp = tempfile.mkdtemp()
+    try:
+        gallery.save(tmp)
+        gallery = CompressedGallery.load(tmp)
+        row = evaluate(gallery, matrix, names, queries, labels, flat_results)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    row["train_seconds"] = round(train_s, 2)
+    report["pq"][f"dim{dim}_m{args.subspaces}_b{args.bits}"] = row
+
+with open(REPORT_PATH, "w", encoding="utf-8") as f:
+    json.dump(report, f, indent=2, ensure_ascii=False)
+
+print(f"\n{'config':<20} {'memory':>12} {'ratio':>7} {'µs/query':>10} {'top1 agree':>11} {'recall@1':>9} {'|Δscore|':>9}")
+print(f"{'flat float32':<20} {report['flat']['bytes']:>12,} {1:>7.1f} {flat_us:>10} {'-':>11} "
+      f"{report['flat']['recall_at_1']:>9} {'-':>9}")
+for name, row in report["pq"].items():
+    memory = row["footprint"]["in_memory_bytes"]
+    for mode in ("adc", "adc_rerank"):
+        r = row[mode]
+        print(f"{name + ' ' + mode:<20} {memory:>12,} {report['flat']['bytes'] / memory:>7.1f} {r['us_per_query']:>10} "
+              f"{r['top1_agreement']:>11} {r['recall_at_1']:>9} {r['mean_abs_score_error']:>9}")
+print(f"\n✅ Report saved to {REPORT_PATH}")
+
+if args.save:
+    if args.synthetic:
+        print("⚠️ Không lưu gallery có identity tổng hợp (--synthetic)")
+    else:
+        gallery = CompressedGallery.train(names, matrix, dim=args.dim, subspaces=args.subspaces, bits=args.bits)
+        gallery.source_version = os.path.getmtime(FACE_DB_PATH)
+        gallery.save(OUTPUT_DIR)
+        print(f"✅ Saved compressed gallery to {OUTPUT_DIR} (GALLERY_MODE=pq)")
@@ -0,0 +1,36 @@
+"""
+Export FaceNet (TorchScript / ONNX) và YOLO (ONNX) cho các máy chạy CPU
+Chạy: python scripts/export_models.py [--facenet torchscript onnx] [--yolo]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import export_torchscript, export_onnx, export_yolo_onnx
+
+parser = argparse.ArgumentParser(description="Export inference backends")
+parser.add_argument("--facenet", nargs="*", default=["torchscript", "onnx"],
+                    choices=["torchscript", "onnx"])
+parser.add_argument("--yolo", action="store_true", help="Export YOLO sang ONNX")
+parser.add_argument("--yolo-weights", default=None)
+args = parser.parse_args()
+
+if "torchscript" in args.facenet:
+    print(">>> Exporting FaceNet -> TorchScript...")
+    print(f"    ✅ {export_torchscript()}")
+
+if "onnx" in args.facenet:
+    print(">>> Exporting FaceNet -> ONNX...")
+    print(f"    ✅ {export_onnx()}")
+
+if args.yolo:
+    print(">>> Exporting YOLO -> ONNX...")
+    print(f"    ✅ {export_yolo_onnx(args.yolo_weights)}")
+
+print("\n🎉 DONE! Chọn backend bằng biến môi trường FACENET_BACKEND")
+
+
+#  python scripts/export_models.py --yolo
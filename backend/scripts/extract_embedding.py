@@ -1,15 +1,19 @@
 import cv2
 import os
+import sys
 import pickle
-import torch
 import numpy as np
-from facenet_pytorch import InceptionResnetV1
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import get_facenet
+from preprocessing import embed_faces
 
 DATASET_PATH = "dataset_cropped"
 OUTPUT_PATH = "models/face_db.pkl"
 
 print(">>> Loading FaceNet model...")
-model = InceptionResnetV1(pretrained='vggface2').eval()
+model = get_facenet()
 
 database = {}
 
@@ -26,7 +30,7 @@ for person in persons:
         continue
 
     print(f"\n>>> Processing: {person}")
-    embeddings = []
+    faces = []
 
     images = os.listdir(person_path)
     print(f"    Images: {len(images)}")
@@ -39,20 +43,14 @@ for person in persons:
             print(f"    ⚠️ Cannot read {img_name}")
             continue
 
-        image = cv2.resize(image, (160, 160))
-        image = torch.from_numpy(image).permute(2,0,1).float()
-        image = image.unsqueeze(0) / 255.0
-
-        with torch.no_grad():
-            emb = model(image).numpy()
-
-        embeddings.append(emb)
+        faces.append(image)
 
-    if len(embeddings) == 0:
+    if len(faces) == 0:
         print(f"    ❌ No valid images for {person}")
         continue
 
-    database[person] = np.mean(embeddings, axis=0)
+    embeddings = embed_faces(model, faces)
+    database[person] = np.mean(embeddings, axis=0, keepdims=True)
     print(f"    ✅ Saved embedding for {person}")
 
 os.makedirs("models", exist_ok=True)
@@ -0,0 +1,52 @@
+"""
+Điểm danh từ video bài giảng đã ghi (offline, nhanh hơn thời gian thực)
+Chạy: python scripts/process_video.py --video lecture.mp4 --ma-buoi 12 [--workers 4] [--start "2026-01-26 07:00"]
+      [--weights yolov8n-face.pt]
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_attendance import FACE_WEIGHTS, VideoOptions, process_lecture_video
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline lecture-video attendance")
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--ma-buoi", type=int, required=True)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--start", default=None, help="Thời điểm bắt đầu ghi hình, YYYY-MM-DD HH:MM")
+    parser.add_argument("--min-hits", type=int, default=3)
+    parser.add_argument("--weights", default=FACE_WEIGHTS, help="YOLO weights detect mặt")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ phân tích, không ghi DiemDanh")
+    args = parser.parse_args()
+
+    video_start = datetime.strptime(args.start, "%Y-%m-%d %H:%M") if args.start else None
+    options = VideoOptions(min_hits=args.min_hits, weights=args.weights)
+
+    print(f">>> Processing {args.video} for MaBuoi={args.ma_buoi}")
+    result = process_lecture_video(args.video, args.ma_buoi, options, args.workers,
+                                   video_start=video_start, dry_run=args.dry_run)
+
+    if not result["success"]:
+        print(f"❌ {result['message']}")
+        exit(1)
+
+    stats = result["stats"]
+    print(f"    Duration: {stats['duration_s']}s, sampled {stats['sampled_frames']}/{stats['frames']} frames, "
+          f"{stats['faces']} faces, {stats['workers']} workers")
+    print(f"    Elapsed: {stats['elapsed_s']}s ({stats['speedup_vs_realtime']}x realtime)")
+    print(f"    ✅ Present: {len(result['present'])}, inserted: {len(result['inserted'])}")
+    if result["not_enrolled"]:
+        print(f"    ⚠️ Not enrolled: {', '.join(result['not_enrolled'])}")
+    if result["insufficient_evidence"]:
+        print(f"    ⚠️ Insufficient evidence: {', '.join(result['insufficient_evidence'])}")
+
+    print(json.dumps(result, indent=2, ensure_ascii=False, default=str))
+
+
+#  python scripts/process_video.py --video lecture.mp4 --ma-buoi 12
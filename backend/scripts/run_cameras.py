@@ -0,0 +1,70 @@
+"""
+Chạy điểm danh cho nhiều camera trong một process (dùng chung model)
+Chạy:
+    python scripts/run_cameras.py --config cameras.json
+    python scripts/run_cameras.py --source 0 --source rtsp://10.0.0.5/stream --source clip.mp4
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import get_facenet, get_yolo
+from multi_camera import CameraConfig, MultiCameraIngest, load_camera_config
+from schedule_service import ScheduleService
+from scripts.recognize import recognize
+
+parser = argparse.ArgumentParser(description="Multi-camera attendance ingest")
+parser.add_argument("--config", help="File JSON cấu hình camera")
+parser.add_argument("--source", action="append", default=[], help="Camera index / RTSP URL / file video")
+parser.add_argument("--weights", default="yolov8n-face.pt")
+parser.add_argument("--stats-interval", type=float, default=10)
+parser.add_argument("--stats-file", help="Ghi thống kê JSON ra file này mỗi lần in")
+args = parser.parse_args()
+
+cameras = load_camera_config(args.config) if args.config else []
+cameras += [CameraConfig(f"cam{i}", src) for i, src in enumerate(args.source, start=len(cameras))]
+
+if not cameras:
+    print("❌ Chưa có camera nào (--config hoặc --source)")
+    exit()
+
+print(f">>> Starting {len(cameras)} cameras")
+schedule = ScheduleService()
+schedule.start()
+ingest = MultiCameraIngest(cameras, get_yolo(args.weights), get_facenet(), recognize, schedule=schedule).start()
+
+def report():
+    stats = ingest.stats()
+    for camera_id, s in stats["cameras"].items():
+        print(f"  {camera_id:<12} capture={s['capture_fps']:>6.2f}fps processed={s['processed_fps']:>6.2f}fps "
+              f"lag={s['lag_ms']:>7.1f}ms drops={s['drops']:<6} faces={s['faces']:<6} checkins={s['checkins']}")
+    shared = stats["shared"]
+    print(f"  shared       batches={shared['batches']} frames/batch={shared['avg_frames_per_batch']} "
+          f"faces/batch={shared['avg_faces_embedded_per_batch']} "
+          f"detect={shared['detect']['avg_ms']}ms embed={shared['embed']['avg_ms']}ms")
+    if args.stats_file:
+        with open(args.stats_file, "w") as f:
+            json.dump(stats, f, indent=2)
+
+try:
+    last_report = time.time()
+    while ingest.running:
+        time.sleep(0.5)
+        if time.time() - last_report > args.stats_interval:
+            report()
+            last_report = time.time()
+except KeyboardInterrupt:
+    pass
+finally:
+    ingest.stop()
+    ingest.join(timeout=2)
+    print("=== FINAL STATS ===")
+    report()
+
+
+#  python scripts/run_cameras.py --config cameras.json
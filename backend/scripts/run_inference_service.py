@@ -0,0 +1,32 @@
+"""
+Chạy inference sidecar: YOLO + FaceNet nằm trong một process cho cả máy,
+API / kiosk / training gọi qua INFERENCE_SERVICE (xem inference_service.py)
+Chạy:
+    python scripts/run_inference_service.py
+    python scripts/run_inference_service.py --address 127.0.0.1:8765 --weights yolov8n.pt --weights yolov8n-face.pt
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_service import DEFAULT_ADDRESS, InferenceServer
+from model_registry import DEFAULT_YOLO_WEIGHTS, get_yolo
+from preprocessing import DEFAULT_MAX_BATCH
+
+parser = argparse.ArgumentParser(description="Inference sidecar (YOLO + FaceNet)")
+parser.add_argument("--address", default=DEFAULT_ADDRESS, help="Đường dẫn Unix socket hoặc host:port")
+parser.add_argument("--weights", action="append", default=[], help="YOLO weights nạp sẵn (mặc định YOLO_WEIGHTS)")
+parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH, help="Số mặt tối đa mỗi lô bulk")
+parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Thời gian chờ gom request mỗi vòng")
+args = parser.parse_args()
+
+server = InferenceServer(args.address, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+print(f"✅ FaceNet loaded ({server.facenet.name})")
+for weights in args.weights or [DEFAULT_YOLO_WEIGHTS]:
+    get_yolo(weights, remote=False)
+    print(f"✅ YOLO loaded ({weights})")
+
+server.serve_forever()
@@ -0,0 +1,127 @@
+"""
+Logic điểm danh theo buổi học cho kiosk / camera
+
+Dùng chung cho app.py (một camera) và multi_camera.py (nhiều camera):
+theo dõi buổi học hiện tại, cache trạng thái đăng ký lớp và
+tránh ghi điểm danh trùng.
+"""
+
+import time
+
+NOT_ENROLLED_RECHECK_SECONDS = 60   # "không thuộc lớp" được hỏi lại DB sau khoảng này
+
+from database.attendance_service import (
+    get_current_active_session,
+    get_session,
+    ghi_diem_danh_neu_chua_co,
+    is_student_enrolled
+)
+
+STATUS_OK = "ok"
+STATUS_WRONG_CLASS = "wrong_class"
+STATUS_UNKNOWN = "unknown"
+
+class SessionCheckin:
+    """Trạng thái điểm danh của một camera.
+
+    ma_buoi=None: tự tìm buổi học đang diễn ra (get_current_active_session,
+    hoặc tra timeline trong bộ nhớ nếu có `schedule` - ScheduleService),
+    ngược lại camera được gắn cố định với buổi học đó.
+    """
+
+    def __init__(self, ma_buoi=None, refresh_interval=5, label="", schedule=None):
+        self.ma_buoi = ma_buoi
+        self.refresh_interval = refresh_interval
+        self.label = label
+        self.schedule = schedule
+        self.current_session = None
+        self.checked_students = set()
+        self._last_check_time = 0
+        self._enrolled = set()      # MaSV chắc chắn thuộc lớp của buổi hiện tại
+        self._not_enrolled = {}     # MaSV -> thời điểm DB trả lời "không thuộc lớp"
+
+    def refresh(self):
+        """Cập nhật buổi học hiện tại, trả về True nếu chuyển phiên"""
+        if time.time() - self._last_check_time <= self.refresh_interval:
+            return False
+        self._last_check_time = time.time()
+
+        if self.ma_buoi is not None:
+            session_info = get_session(self.ma_buoi)
+        elif self.schedule is not None:
+            active = self.schedule.active_session()
+            session_info = active.to_session_dict() if active else None
+        else:
+            session_info = get_current_active_session()
+
+        if session_info == self.current_session:
+            return False
+
+        # Chuyển phiên: reset danh sách đã điểm danh và cache đăng ký lớp
+        self.current_session = session_info
+        self.checked_students.clear()
+        self._not_enrolled.clear()
+
+        # Danh sách lớp đã được schedule nạp trước -> sinh viên trong đó không cần hỏi DB.
+        # Chỉ dùng để xác nhận: sinh viên ngoài danh sách vẫn hỏi is_student_enrolled
+        # (có thể vừa được đăng ký sau lúc nạp trước)
+        roster = self.schedule.roster(session_info["MaBuoi"]) if self.schedule and session_info else None
+        self._enrolled = set(roster) if roster is not None else set()
+
+        prefix = f"[{self.label}] " if self.label else ""
+        if self.current_session:
+            print(f"{prefix}--> ĐANG HỌC: {self.current_session['MaLHP']} (ID: {self.current_session['MaBuoi']})")
+        else:
+            print(f"{prefix}--> HIỆN TẠI KHÔNG CÓ LỊCH HỌC")
+        return True
+
+    def _is_enrolled(self, ma_sv, ma_lhp):
+        if ma_sv in self._enrolled:
+            return True
+        checked_at = self._not_enrolled.get(ma_sv)
+        if checked_at is not None and time.time() - checked_at < NOT_ENROLLED_RECHECK_SECONDS:
+            return False
+
+        if is_student_enrolled(ma_sv, ma_lhp):
+            self._enrolled.add(ma_sv)
+            self._not_enrolled.pop(ma_sv, None)
+            return True
+        self._not_enrolled[ma_sv] = time.time()
+        return False
+
+    def process(self, tracks):
+        """Điểm danh cho các track đã nhận diện.
+
+        Gán track.status (ok / wrong_class / unknown) và trả về list MaSV
+        vừa được ghi điểm danh trong lần gọi này.
+        """
+        new_checkins = []
+
+        if not self.current_session:
+            return new_checkins
+
+        session = self.current_session
+        for track in tracks:
+            if not track.resolved:
+                track.status = STATUS_UNKNOWN
+                continue
+
+            ma_sv = track.identity
+
+            # 1. Check xem SV có thuộc lớp này không? (cache theo buổi học)
+            track.status = STATUS_OK if self._is_enrolled(ma_sv, session['MaLHP']) else STATUS_WRONG_CLASS
+
+            if track.status != STATUS_OK:
+                continue
+
+            # 2. Check đã điểm danh chưa? Kiểm tra + ghi trong một INSERT có khoá
+            # (cùng guard với API / batch, nên kiosk và API quét cùng lúc không ghi trùng)
+            if ma_sv in self.checked_students:
+                continue
+
+            result = ghi_diem_danh_neu_chua_co(ma_sv, session['MaBuoi'], session['GioBatDau'])
+            self.checked_students.add(ma_sv)
+            if result["success"]:
+                new_checkins.append(ma_sv)
+
+        return new_checkins
@@ -0,0 +1,86 @@
+"""
+Cache ngữ cảnh buổi học cho điểm danh một bước (nhận diện + check-in)
+
+Mỗi buổi học giữ: thông tin buổi, sinh viên đăng ký (kèm hồ sơ), tập đã điểm danh
+và gallery embedding chỉ gồm sinh viên của lớp. Nạp bằng một kết nối DB,
+hết hạn sau `ttl` giây hoặc khi face_db thay đổi.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from database.attendance_service import get_session_context
+
+def build_gallery(face_db, identities=None):
+    """(names, ma trận (N, 512) đã chuẩn hoá L2) từ face_db, có thể giới hạn theo identities"""
+    names = [n for n in face_db if identities is None or n in identities]
+    if not names:
+        return names, np.zeros((0, 512), dtype=np.float32)
+    matrix = np.vstack([np.asarray(face_db[n], dtype=np.float32).reshape(1, -1) for n in names])
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-10
+    return names, matrix
+
+def match_gallery(names, matrix, embedding, threshold):
+    """(identity hoặc None, cosine cao nhất)"""
+    if not names:
+        return None, 0.0
+    emb = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    scores = matrix @ (emb / (np.linalg.norm(emb) + 1e-10))
+    best = int(np.argmax(scores))
+    score = float(scores[best])
+    return (names[best] if score >= threshold else None), score
+
+
+class SessionContext:
+    def __init__(self, session, students, checked, face_db):
+        self.session = session
+        self.students = students            # MaSV -> student_info
+        self.checked = checked              # MaSV đã điểm danh
+        self.names, self.gallery = build_gallery(face_db, students)
+        self.loaded_at = time.time()
+
+
+class SessionRosterCache:
+    def __init__(self, ttl=60.0, on_load=None):
+        self.ttl = ttl
+        self.on_load = on_load              # callback(context) sau mỗi lần nạp từ DB
+        self._contexts = {}
+        self._lock = threading.Lock()
+        self._face_db_version = None
+        self.stats = {"hits": 0, "loads": 0}
+
+    def get(self, ma_buoi, face_db, face_db_version=None):
+        """SessionContext của buổi học, None nếu không tồn tại.
+
+        face_db_version (vd mtime của face_db.pkl) đổi -> gallery cũ không còn đúng, nạp lại.
+        """
+        with self._lock:
+            if face_db_version != self._face_db_version:
+                self._contexts.clear()
+                self._face_db_version = face_db_version
+
+            context = self._contexts.get(ma_buoi)
+            if context is not None and time.time() - context.loaded_at <= self.ttl:
+                self.stats["hits"] += 1
+                return context
+
+        data = get_session_context(ma_buoi)
+        if data is None:
+            return None
+        context = SessionContext(data["session"], data["students"], data["checked"], face_db)
+
+        with self._lock:
+            self.stats["loads"] += 1
+            self._contexts[ma_buoi] = context
+        if self.on_load:
+            self.on_load(context)
+        return context
+
+    def invalidate(self, ma_buoi=None):
+        with self._lock:
+            if ma_buoi is None:
+                self._contexts.clear()
+            else:
+                self._contexts.pop(ma_buoi, None)
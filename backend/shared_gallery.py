@@ -0,0 +1,194 @@
+"""
+Gallery toàn trường dùng chung giữa các worker uvicorn (uvicorn main:app --workers N)
+
+File trong SHARED_GALLERY_DIR (mặc định /dev/shm/smart_attendance, tức RAM, nếu có):
+    header          [generation, version face_db] float64 - mmap, đọc ở mỗi lần tìm
+    gen-<g>.npy     ma trận (N, 512) float32 đã chuẩn hoá - mọi worker np.load(mmap_mode="r")
+                    cùng một vùng page cache, không worker nào giữ bản sao riêng
+    gen-<g>.json    names theo thứ tự dòng
+
+Worker vừa train gọi publish(): ghi file của generation mới rồi mới tăng generation
+trong header, nên worker khác thấy ngay ở lần tìm kế tiếp và chỉ cần map file mới.
+
+SharedJobStore giữ trạng thái job nền (jobs/<job_id>.json) cùng thư mục, để request
+poll rơi vào worker nào cũng đọc được.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:     # Windows: chỉ khoá được trong process
+    fcntl = None
+
+DEFAULT_DIR = os.environ.get(
+    "SHARED_GALLERY_DIR",
+    "/dev/shm/smart_attendance" if os.path.isdir("/dev/shm") else "models/shared_gallery"
+)
+KEEP_GENERATIONS = 2    # worker đang map generation cũ vẫn đọc được trong lúc chuyển
+JOB_TTL_SECONDS = 24 * 3600
+
+class SharedGallery:
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+        header = os.path.join(directory, "header")
+        with self.locked():
+            if not os.path.exists(header) or os.path.getsize(header) != 16:
+                np.zeros(2, dtype=np.float64).tofile(header)
+        self._header = np.memmap(header, dtype=np.float64, mode="r+", shape=(2,))
+
+        self._generation = None
+        self.names = []
+        self.matrix = np.zeros((0, 512), dtype=np.float32)
+        self.stats = {"publishes": 0, "attaches": 0}
+
+    @property
+    def generation(self):
+        """Generation mới nhất đã publish (0 = chưa có)"""
+        return int(self._header[0])
+
+    @property
+    def source_version(self):
+        """Version (mtime face_db.pkl) của generation mới nhất"""
+        return float(self._header[1]) if self.generation else None
+
+    def _path(self, generation, ext):
+        return os.path.join(self.directory, f"gen-{generation}.{ext}")
+
+    @contextmanager
+    def locked(self):
+        """Khoá giữa các worker (flock trên file lock) cho các thao tác ghi"""
+        with open(os.path.join(self.directory, "lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ---------- đọc ----------
+
+    def _attach(self, generation):
+        if generation == 0:
+            names, matrix = [], np.zeros((0, 512), dtype=np.float32)
+        else:
+            matrix = np.load(self._path(generation, "npy"), mmap_mode="r")
+            with open(self._path(generation, "json"), encoding="utf-8") as f:
+                names = json.load(f)
+        self.names, self.matrix, self._generation = names, matrix, generation
+        self.stats["attaches"] += 1
+
+    def current(self):
+        """(names, matrix, generation) mới nhất, map lại khi worker khác đã publish"""
+        generation = self.generation
+        if generation != self._generation:
+            with self._lock:
+                try:
+                    self._attach(generation)
+                except FileNotFoundError:
+                    # Bị dọn vì có thêm generation mới ngay sau đó
+                    self._attach(self.generation)
+        return self.names, self.matrix, self._generation
+
+    # ---------- ghi ----------
+
+    def _write(self, path, write):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+
+    def _publish(self, names, matrix, source_version):
+        generation = self.generation + 1
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self._write(self._path(generation, "npy"), lambda f: np.save(f, matrix))
+        self._write(self._path(generation, "json"), lambda f: f.write(json.dumps(list(names)).encode("utf-8")))
+
+        # Version trước, generation sau: worker thấy generation mới thì file đã đủ
+        self._header[1] = source_version if source_version is not None else 0.0
+        self._header[0] = generation
+        self._header.flush()
+        self.stats["publishes"] += 1
+
+        for old in range(max(1, generation - 10), generation - KEEP_GENERATIONS + 1):
+            for ext in ("npy", "json"):
+                try:
+                    os.remove(self._path(old, ext))
+                except OSError:     # không có / Windows còn đang map
+                    pass
+        return generation
+
+    def publish(self, names, matrix, source_version=None):
+        """Đưa gallery mới cho mọi worker, trả về generation mới"""
+        with self._lock, self.locked():
+            return self._publish(names, matrix, source_version)
+
+    def sync(self, load, source_version):
+        """Publish lại nếu face_db.pkl trên đĩa khác bản đã publish (worker đầu tiên khởi động,
+        train bằng script ngoài API). load() -> (names, matrix). True nếu đã publish."""
+        source_version = source_version or 0.0     # chưa có face_db.pkl
+        if self.generation and self.source_version == source_version:
+            return False
+        with self._lock, self.locked():
+            if self.generation and self.source_version == source_version:
+                return False    # worker khác vừa publish
+            self._publish(*load(), source_version)
+            return True
+
+    def metrics(self):
+        return {
+            **self.stats,
+            "directory": self.directory,
+            "generation": self.generation,
+            "attached_generation": self._generation,
+            "vectors": len(self.names),
+        }
+
+
+class SharedJobStore:
+    """Trạng thái job nền dùng chung giữa các worker: mỗi job một file JSON,
+    ghi trong locked() của gallery rồi os.replace nên worker khác không đọc phải file dở"""
+
+    def __init__(self, gallery, ttl_seconds=JOB_TTL_SECONDS):
+        self.gallery = gallery
+        self.directory = os.path.join(gallery.directory, "jobs")
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def save(self, job):
+        data = json.dumps(job, ensure_ascii=False, default=str).encode("utf-8")
+        with self.gallery.locked():
+            self.gallery._write(self._path(job["job_id"]), lambda f: f.write(data))
+            self._expire()
+
+    def get(self, job_id):
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,80 @@
+"""
+Cache hồ sơ sinh viên (SinhVien) trong process
+
+Hồ sơ gần như không đổi, nên đường nhận diện không cần đọc DB mỗi lần khớp:
+nạp hàng loạt lúc khởi động (preload) hoặc theo danh sách lớp của buổi học
+(put_many), giới hạn bằng LRU, xoá khi sinh viên được thêm / sửa (invalidate).
+"""
+
+import threading
+from collections import OrderedDict
+
+from database.student_repo import get_students
+
+class StudentProfileCache:
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "loaded": 0, "evicted": 0}
+
+    def preload(self):
+        """Nạp tối đa max_entries hồ sơ bằng một truy vấn, trả về số hồ sơ đã nạp"""
+        profiles = get_students(limit=self.max_entries)
+        self.put_many(profiles)
+        return len(profiles)
+
+    def put_many(self, profiles):
+        with self._lock:
+            for profile in profiles:
+                self._profiles[profile["ma_sv"]] = profile
+                self._profiles.move_to_end(profile["ma_sv"])
+                self.stats["loaded"] += 1
+            self._evict()
+
+    def _evict(self):
+        while len(self._profiles) > self.max_entries:
+            self._profiles.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def get(self, ma_sv):
+        """Hồ sơ của một sinh viên, đọc DB khi chưa có trong cache; None nếu không tồn tại"""
+        return self.get_many([ma_sv]).get(ma_sv)
+
+    def get_many(self, ma_svs):
+        """dict MaSV -> hồ sơ; các MaSV chưa có được nạp bằng một truy vấn"""
+        found = {}
+        missing = []
+        with self._lock:
+            for ma_sv in ma_svs:
+                profile = self._profiles.get(ma_sv)
+                if profile is None:
+                    missing.append(ma_sv)
+                    continue
+                self._profiles.move_to_end(ma_sv)
+                found[ma_sv] = profile
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(missing)
+
+        if missing:
+            loaded = get_students(missing)
+            self.put_many(loaded)
+            found.update((p["ma_sv"], p) for p in loaded)
+        return found
+
+    def invalidate(self, ma_sv=None):
+        with self._lock:
+            if ma_sv is None:
+                self._profiles.clear()
+            else:
+                self._profiles.pop(ma_sv, None)
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "entries": len(self._profiles),
+                "max_entries": self.max_entries,
+            }
@@ -0,0 +1,157 @@
+"""
+Import hàng loạt sinh viên + đăng ký lớp (DangKyHoc) từ file CSV / JSON
+
+File được đọc theo từng lô CHUNK_ROWS dòng (CSV và JSON Lines đọc dạng stream,
+JSON mảng được nạp một lần). Mỗi lô được kiểm tra bằng pandas trên cả cột
+(không lặp từng dòng), rồi ghi bằng fast_executemany trong một transaction
+(import_students_chunk). Dòng lỗi được báo lại kèm số dòng, không làm hỏng cả lô.
+
+Cột (không phân biệt hoa thường, chấp nhận cả tên cột DB): ma_sv, ho_ten,
+ngay_sinh (YYYY-MM-DD hoặc DD/MM/YYYY), gioi_tinh, lop, khoa, email,
+trang_thai, ma_lhp (một hoặc nhiều mã, cách nhau bởi ';' hoặc ',').
+Dòng không có ho_ten chỉ thêm đăng ký lớp cho sinh viên đã có; MaSV lặp lại
+ở nhiều dòng -> hồ sơ lấy từ dòng đầu, các dòng sau chỉ thêm đăng ký.
+"""
+
+import json
+import re
+import time
+
+import pandas as pd
+
+from database.student_repo import get_class_ids, import_students_chunk
+
+CHUNK_ROWS = 2000
+MAX_REPORTED_ERRORS = 1000
+
+STUDENT_FIELDS = ["ma_sv", "ho_ten", "ngay_sinh", "gioi_tinh", "lop", "khoa", "email", "trang_thai"]
+MAX_LENGTHS = {"ma_sv": 20, "ho_ten": 100, "gioi_tinh": 10, "lop": 50, "khoa": 100, "email": 100, "trang_thai": 20}
+GENDERS = {"Nam", "Nữ", "Khác"}
+DEFAULT_STATUS = "Đang học"
+EMAIL_PATTERN = r"[^@\s]+@[^@\s]+\.[^@\s]+"
+
+# "MaSV", "ma_sv", "Ma SV" -> "ma_sv"
+COLUMN_ALIASES = {re.sub(r"[^a-z]", "", f): f for f in STUDENT_FIELDS + ["ma_lhp"]}
+
+def detect_format(filename, fmt=None):
+    fmt = (fmt or (filename or "").rsplit(".", 1)[-1]).lower()
+    if fmt in ("jsonl", "ndjson"):
+        return "jsonl"
+    if fmt in ("csv", "json"):
+        return fmt
+    return None
+
+def _normalize(df):
+    df = df.rename(columns=lambda c: COLUMN_ALIASES.get(re.sub(r"[^a-z]", "", str(c).lower()), c))
+    for col in STUDENT_FIELDS + ["ma_lhp"]:
+        if col not in df.columns:
+            df[col] = ""
+    df = df[STUDENT_FIELDS + ["ma_lhp"]]
+    return df.fillna("").astype(str).apply(lambda s: s.str.strip())
+
+def read_chunks(fileobj, fmt):
+    """Sinh DataFrame (cột chuẩn hoá, kiểu str) cho từng lô"""
+    if fmt == "csv":
+        reader = pd.read_csv(fileobj, dtype=str, keep_default_na=False,
+                             encoding="utf-8-sig", chunksize=CHUNK_ROWS)
+    elif fmt == "jsonl":
+        reader = pd.read_json(fileobj, lines=True, dtype=False,
+                              encoding="utf-8-sig", chunksize=CHUNK_ROWS)
+    else:
+        items = json.loads(fileobj.read())
+        if isinstance(items, dict):
+            items = items.get("students", [])
+        reader = (pd.DataFrame(items[i:i + CHUNK_ROWS]) for i in range(0, len(items), CHUNK_ROWS))
+
+    for df in reader:
+        yield _normalize(df)
+
+def validate_chunk(df, class_ids):
+    """Trả về (Series lỗi theo dòng - "" nếu hợp lệ, Series ngày sinh đã parse)"""
+    errors = pd.Series("", index=df.index)
+
+    def flag(mask, message):
+        nonlocal errors
+        errors = errors.mask(mask, errors + message + "; ")
+
+    flag(df["ma_sv"] == "", "thiếu ma_sv")
+    flag(df["ma_sv"].str.contains(r"\s", regex=True), "ma_sv có khoảng trắng")
+    for col, limit in MAX_LENGTHS.items():
+        flag(df[col].str.len() > limit, f"{col} dài quá {limit} ký tự")
+
+    iso = pd.to_datetime(df["ngay_sinh"], format="%Y-%m-%d", errors="coerce")
+    dmy = pd.to_datetime(df["ngay_sinh"], format="%d/%m/%Y", errors="coerce")
+    ngay_sinh = iso.fillna(dmy)
+    flag((df["ngay_sinh"] != "") & ngay_sinh.isna(), "ngay_sinh không hợp lệ")
+
+    flag((df["gioi_tinh"] != "") & ~df["gioi_tinh"].isin(GENDERS), "gioi_tinh không hợp lệ")
+    flag((df["email"] != "") & ~df["email"].str.fullmatch(EMAIL_PATTERN), "email không hợp lệ")
+    flag((df["ho_ten"] == "") & (df["ma_lhp"] == ""), "thiếu ho_ten và ma_lhp")
+
+    classes = df["ma_lhp"].str.split(r"[;,]").explode().str.strip()
+    classes = classes[classes != ""]
+    unknown = classes[~classes.isin(class_ids)]
+    if len(unknown):
+        bad = unknown.groupby(level=0).agg(", ".join)
+        errors = errors + ("ma_lhp không tồn tại: " + bad + "; ").reindex(df.index, fill_value="")
+
+    return errors.str.rstrip("; "), ngay_sinh
+
+def import_students(fileobj, fmt):
+    """Import cả file; trả về tổng kết + danh sách lỗi theo dòng (1 = dòng dữ liệu đầu tiên)"""
+    started = time.perf_counter()
+    class_ids = get_class_ids()
+    summary = {"rows": 0, "students_created": 0, "students_existing": 0,
+               "enrollments_created": 0, "enrollments_existing": 0, "failed": 0}
+    errors = []
+    created_ids = []
+
+    def report(row, ma_sv, message):
+        summary["failed"] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": row, "ma_sv": ma_sv, "error": message})
+
+    offset = 0
+    for df in read_chunks(fileobj, fmt):
+        df.index = pd.RangeIndex(offset + 1, offset + 1 + len(df))
+        offset += len(df)
+        summary["rows"] += len(df)
+
+        row_errors, ngay_sinh = validate_chunk(df, class_ids)
+        for row in row_errors[row_errors != ""].index:
+            report(int(row), df.at[row, "ma_sv"], row_errors[row])
+
+        valid = df[row_errors == ""]
+        profiles = valid[valid["ho_ten"] != ""].drop_duplicates("ma_sv")
+        students = list(zip(
+            profiles["ma_sv"], profiles["ho_ten"],
+            [d.date() if pd.notna(d) else None for d in ngay_sinh[profiles.index]],
+            *(profiles[c].where(profiles[c] != "", None) for c in ["gioi_tinh", "lop", "khoa", "email"]),
+            profiles["trang_thai"].where(profiles["trang_thai"] != "", DEFAULT_STATUS)
+        ))
+
+        pairs = valid["ma_lhp"].str.split(r"[;,]").explode().str.strip()
+        pairs = pairs[pairs != ""]
+        enrollment_rows = {}
+        for row, ma_lhp in pairs.items():
+            enrollment_rows.setdefault((valid.at[row, "ma_sv"], ma_lhp), int(row))
+
+        result = import_students_chunk(students, list(enrollment_rows))
+
+        student_rows = dict(zip(profiles["ma_sv"], profiles.index))
+        for key, message in result["errors"].items():
+            if isinstance(key, tuple):
+                report(enrollment_rows[key], key[0], f"{key[1]}: {message}")
+            else:
+                report(int(student_rows[key]), key, message)
+
+        summary["students_created"] += len(result["created"])
+        summary["students_existing"] += len(result["existing"])
+        summary["enrollments_created"] += len(result["enrolled"])
+        summary["enrollments_existing"] += len(result["already_enrolled"])
+        created_ids += result["created"]
+
+    elapsed = time.perf_counter() - started
+    summary["seconds"] = round(elapsed, 2)
+    summary["rows_per_minute"] = int(summary["rows"] / elapsed * 60) if elapsed > 0 else summary["rows"]
+    return {"summary": summary, "errors": errors, "created": created_ids}
@@ -0,0 +1,98 @@
+"""
+Thumbnail ảnh training cho lưới ảnh ở trang StudentTraining
+
+Thumbnail (JPEG, cạnh dài tối đa `max_side`) được tạo nền bằng thread pool ngay
+khi ảnh được lưu; request tới trước khi xong thì chờ đúng job đó thay vì tạo lại.
+Tên file thumbnail cố định theo tên ảnh gốc - ảnh gốc không bao giờ bị ghi đè
+cùng tên (xem store_training_image), nên không cần so mtime.
+"""
+
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+class ThumbnailStore:
+    def __init__(self, root="dataset_thumbs", max_side=256, quality=85, workers=2):
+        self.root = root
+        self.max_side = max_side
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        self._pending = {}      # đường dẫn thumbnail -> Future
+        self._ready = set()     # đường dẫn thumbnail đã có trên đĩa (tránh stat lặp lại)
+        self._lock = threading.Lock()
+        self.stats = {"generated": 0, "failed": 0, "waited": 0}
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, ma_sv, filename):
+        return os.path.join(self.root, ma_sv, filename + ".jpg")
+
+    def _render(self, source, dest):
+        img = cv2.imread(source, cv2.IMREAD_COLOR)
+        if img is None:
+            self.stats["failed"] += 1
+            return None
+
+        h, w = img.shape[:2]
+        scale = self.max_side / max(h, w)
+        if scale < 1:
+            img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+        # Ghi file tạm rồi rename để request khác không đọc phải file ghi dở
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + ".tmp.jpg"
+        cv2.imwrite(tmp, img, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        os.replace(tmp, dest)
+
+        with self._lock:
+            self._ready.add(dest)
+            self._pending.pop(dest, None)
+            self.stats["generated"] += 1
+        return dest
+
+    def schedule(self, ma_sv, filename, source):
+        """Tạo thumbnail nền (không chặn request upload)"""
+        dest = self.path(ma_sv, filename)
+        with self._lock:
+            future = self._pending.get(dest)
+            if future is None:
+                future = self.executor.submit(self._render, source, dest)
+                self._pending[dest] = future
+        return future
+
+    def get(self, ma_sv, filename, source):
+        """Đường dẫn thumbnail, tạo (hoặc chờ job nền) nếu chưa có; None nếu ảnh hỏng"""
+        dest = self.path(ma_sv, filename)
+        with self._lock:
+            if dest in self._ready:
+                return dest
+        if os.path.exists(dest):
+            with self._lock:
+                self._ready.add(dest)
+            return dest
+
+        self.stats["waited"] += 1
+        return self.schedule(ma_sv, filename, source).result()
+
+    def remove(self, ma_sv, filename=None):
+        """Xoá thumbnail của một ảnh, hoặc của cả sinh viên khi filename=None"""
+        if filename is None:
+            prefix = os.path.join(self.root, ma_sv) + os.sep
+            with self._lock:
+                self._ready = {p for p in self._ready if not p.startswith(prefix)}
+                self._pending = {p: f for p, f in self._pending.items() if not p.startswith(prefix)}
+            shutil.rmtree(os.path.join(self.root, ma_sv), ignore_errors=True)
+            return
+
+        dest = self.path(ma_sv, filename)
+        with self._lock:
+            self._ready.discard(dest)
+            self._pending.pop(dest, None)
+        if os.path.exists(dest):
+            os.remove(dest)
+
+    def metrics(self):
+        with self._lock:
+            return {**self.stats, "pending": len(self._pending), "ready": len(self._ready)}
@@ -3,18 +3,45 @@ Module quản lý training và face data
 """
 
 import os
+import re
 import cv2
 import numpy as np
 import pickle
-import torch
-from facenet_pytorch import InceptionResnetV1
-from ultralytics import YOLO
+import hashlib
+import json
+import threading
+import zipfile
 from datetime import datetime
 import shutil
 
-# Load models
-facenet_model = InceptionResnetV1(pretrained='vggface2').eval()
-yolo_model = YOLO("yolov8n.pt")
+from model_registry import get_facenet, get_yolo
+from preprocessing import embed_faces
+from detection import get_detector, expand_box
+from face_quality import score_faces
+from thumbnails import ThumbnailStore
+from near_duplicates import (
+    encode_embedding,
+    find_by_embedding,
+    find_by_phash,
+    image_phash
+)
+
+# Load models (dùng chung instance với main.py qua registry; qua inference sidecar
+# thì xếp hàng "bulk", nhường kiosk / nhận diện)
+facenet_model = get_facenet(priority="bulk")
+yolo_model = get_yolo(priority="bulk")
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MA_SV_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,20}$")
+NEAR_DUPLICATE_ACTION = os.environ.get("NEAR_DUPLICATE_ACTION", "flag")   # skip / flag / off
+
+def sniff_image_ext(data: bytes):
+    """Đuôi file theo magic bytes (chỉ JPEG / PNG được lưu nguyên bản)"""
+    if data[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    return None
 
 class FaceTrainingManager:
     def __init__(self):
@@ -24,67 +51,299 @@ class FaceTrainingManager:
         os.makedirs(self.base_dir, exist_ok=True)
         os.makedirs(self.cropped_dir, exist_ok=True)
         os.makedirs("models", exist_ok=True)
+        self.index_dir = "dataset_index"
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.thumbnails = ThumbnailStore()
+        self._manifests = {}        # MaSV -> manifest ảnh của dataset_raw/<MaSV>
+        self._lock = threading.Lock()
     
-    def save_training_image(self, ma_sv: str, image_bytes: bytes, filename: str = None):
-        """Lưu ảnh training cho sinh viên"""
+    # ---------- manifest ----------
+    # dataset_index/<MaSV>.json: {"dir_mtime": ns, "images": {filename: {size, mtime, sha256,
+    # face_phash?, embedding?, near_duplicate_of?}}} - face_phash / embedding chỉ có với ảnh upload qua API
+    # Cập nhật khi upload / xoá qua manager; thư mục bị sửa từ ngoài (mtime đổi) thì
+    # dựng lại, chỉ hash file mới. Liệt kê ảnh chỉ tốn một stat thư mục.
+    
+    def _manifest_path(self, ma_sv: str):
+        return os.path.join(self.index_dir, f"{ma_sv}.json")
+    
+    def _write_manifest(self, ma_sv: str, manifest: dict):
+        path = self._manifest_path(ma_sv)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+    
+    def _manifest(self, ma_sv: str):
+        """Manifest của sinh viên (gọi khi giữ _lock)"""
         student_dir = os.path.join(self.base_dir, ma_sv)
-        os.makedirs(student_dir, exist_ok=True)
-        
-        if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"img_{timestamp}.jpg"
+        try:
+            dir_mtime = os.stat(student_dir).st_mtime_ns
+        except FileNotFoundError:
+            return {"dir_mtime": None, "images": {}}
         
-        filepath = os.path.join(student_dir, filename)
-        
-        # Decode và save
-        nparr = np.frombuffer(image_bytes, np.uint8)
+        manifest = self._manifests.get(ma_sv)
+        if manifest is None and os.path.exists(self._manifest_path(ma_sv)):
+            try:
+                with open(self._manifest_path(ma_sv), "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except ValueError:
+                manifest = None
+        if manifest is not None and manifest["dir_mtime"] == dir_mtime:
+            self._manifests[ma_sv] = manifest
+            return manifest
+        
+        old = manifest["images"] if manifest else {}
+        images = {}
+        for filename in os.listdir(student_dir):
+            if not filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+                continue
+            filepath = os.path.join(student_dir, filename)
+            st = os.stat(filepath)
+            entry = old.get(filename)
+            if entry is None or entry["size"] != st.st_size or entry["mtime"] != st.st_mtime_ns:
+                with open(filepath, "rb") as f:
+                    data = f.read()
+                entry = {"size": st.st_size, "mtime": st.st_mtime_ns,
+                         "sha256": hashlib.sha256(data).hexdigest()}
+            images[filename] = entry
+        
+        manifest = {"dir_mtime": dir_mtime, "images": images}
+        self._manifests[ma_sv] = manifest
+        self._write_manifest(ma_sv, manifest)
+        return manifest
+    
+    def _touch_manifest(self, ma_sv: str, manifest: dict):
+        """Ghi lại manifest sau khi chính manager thêm / xoá file (gọi khi giữ _lock)"""
+        manifest["dir_mtime"] = os.stat(os.path.join(self.base_dir, ma_sv)).st_mtime_ns
+        self._manifests[ma_sv] = manifest
+        self._write_manifest(ma_sv, manifest)
+    
+    def get_image_path(self, ma_sv: str, filename: str):
+        """Đường dẫn ảnh nếu filename có trong manifest (chặn luôn path traversal)"""
+        with self._lock:
+            if filename in self._manifest(ma_sv)["images"]:
+                return os.path.join(self.base_dir, ma_sv, filename)
+        return None
+    
+    def get_thumbnail_path(self, ma_sv: str, filename: str):
+        source = self.get_image_path(ma_sv, filename)
+        return self.thumbnails.get(ma_sv, filename, source) if source else None
+    
+    def _face_crop(self, nparr):
+        """Crop mặt chính trong ảnh (margin 20 như lúc crop training), None nếu không thấy mặt"""
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        boxes = get_detector("enrollment", yolo_model).detect(img)
+        if not boxes:
+            return None
+        x1, y1, x2, y2 = expand_box(boxes[0], img.shape, 20)
+        return img[y1:y2, x1:x2]
+    
+    def _face_embedding(self, face):
+        """Embedding (đã chuẩn hoá L2) của crop khuôn mặt"""
+        embedding = embed_faces(facenet_model, [face])[0]
+        return embedding / max(np.linalg.norm(embedding), 1e-12)
+    
+    def _find_duplicate(self, images: dict, digest: str, phash=None, embedding=None):
+        """(status, filename ảnh đã có) nếu trùng / gần trùng, ngược lại None"""
+        for existing, entry in images.items():
+            if entry["sha256"] == digest:
+                return "duplicate", existing
+        
+        # Chỉ so với ảnh không bị đánh dấu gần trùng (ảnh "đại diện")
+        originals = {f: e for f, e in images.items() if not e.get("near_duplicate_of")}
+        match = (find_by_phash(originals, phash) if phash else None) or \
+            (find_by_embedding(originals, embedding) if embedding is not None else None)
+        return ("near_duplicate", match[0]) if match else None
+    
+    def store_training_image(self, ma_sv: str, image_bytes: bytes, filename: str = None,
+                             near_duplicates: str = None):
+        """Lưu ảnh training, trả về (status, filepath hoặc thông báo lỗi).
+        
+        status: saved / duplicate / near_duplicate / invalid. JPEG / PNG được ghi nguyên
+        bytes gốc (không decode + encode lại); file trùng nội dung (sha256) không ghi lần hai.
+        near_duplicates (mặc định NEAR_DUPLICATE_ACTION = flag): skip -> ảnh gần trùng ảnh
+        đã có không được lưu; flag -> vẫn lưu nhưng đánh dấu near_duplicate_of, training bỏ qua;
+        off -> không kiểm tra.
+        """
+        action = near_duplicates or NEAR_DUPLICATE_ACTION
+        
+        # Decode ở 1/8 độ phân giải chỉ để kiểm tra ảnh hợp lệ (rẻ hơn nhiều so với decode đầy đủ)
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        if cv2.imdecode(nparr, cv2.IMREAD_REDUCED_GRAYSCALE_8) is None:
+            return "invalid", "Invalid image"
+        
+        ext = sniff_image_ext(image_bytes)
+        if ext is None:
+            # Định dạng khác (bmp, webp...): chuyển sang JPEG để pipeline training đọc được
+            ok, encoded = cv2.imencode(".jpg", cv2.imdecode(nparr, cv2.IMREAD_COLOR))
+            if not ok:
+                return "invalid", "Invalid image"
+            image_bytes, ext = encoded.tobytes(), ".jpg"
+        
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        student_dir = os.path.join(self.base_dir, ma_sv)
+        check = action != "off"
+        
+        # sha256 trong lock; detect + pHash crop mặt, rồi FaceNet chỉ khi pHash không khớp, ngoài lock
+        with self._lock:
+            match = self._find_duplicate(self._manifest(ma_sv)["images"], digest)
+        phash = embedding = None
+        if match is None and check:
+            face = self._face_crop(nparr)
+            if face is not None:
+                phash = image_phash(face)
+                with self._lock:
+                    match = self._find_duplicate(self._manifest(ma_sv)["images"], digest, phash)
+                if match is None:
+                    embedding = self._face_embedding(face)
+        
+        with self._lock:
+            manifest = self._manifest(ma_sv)
+            images = manifest["images"]
+            if match is None:
+                match = self._find_duplicate(images, digest, phash, embedding)
+            if match and (match[0] == "duplicate" or action == "skip"):
+                return match[0], os.path.join(student_dir, match[1])
+            
+            if filename is None:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                filename = f"img_{timestamp}"
+            stem = re.sub(r"[^\w.-]", "_", os.path.splitext(os.path.basename(filename))[0]) or "img"
+            filename = stem + ext
+            if filename in images:
+                filename = f"{stem}_{digest[:8]}{ext}"
+            
+            os.makedirs(student_dir, exist_ok=True)
+            filepath = os.path.join(student_dir, filename)
+            with open(filepath, "wb") as f:
+                f.write(image_bytes)
+            
+            st = os.stat(filepath)
+            entry = {"size": st.st_size, "mtime": st.st_mtime_ns, "sha256": digest}
+            if phash is not None:
+                entry["face_phash"] = phash
+            if embedding is not None:
+                entry["embedding"] = encode_embedding(embedding)
+            if match:
+                entry["near_duplicate_of"] = match[1]
+            images[filename] = entry
+            self._touch_manifest(ma_sv, manifest)
+        
+        self.thumbnails.schedule(ma_sv, filename, filepath)
+        return "saved", filepath
+    
+    def save_training_image(self, ma_sv: str, image_bytes: bytes, filename: str = None):
+        """Lưu ảnh training cho sinh viên (ảnh trùng trả về file đã có)"""
+        status, result = self.store_training_image(ma_sv, image_bytes, filename)
+        if status == "invalid":
+            return None, result
+        return result, None
+    
+    def import_zip(self, zip_path: str, ma_sv: str = None, known_students=None, near_duplicates: str = None):
+        """Nhập ảnh training từ file ZIP đã lưu trên đĩa.
+        
+        Cấu trúc: <MaSV>/<ảnh> cho nhiều sinh viên, hoặc ảnh nằm phẳng khi truyền ma_sv.
+        Mỗi entry được đọc riêng (tối đa MAX_IMAGE_BYTES) nên bộ nhớ không phụ thuộc
+        kích thước archive. known_students: callable(list MaSV) -> set MaSV có trong DB.
+        """
+        summary = {"entries": 0, "saved": 0, "duplicate": 0, "near_duplicate": 0, "skipped": 0}
+        new_files = {}      # MaSV -> [filename đã lưu]
+        errors = []
         
-        if img is None:
-            return None, "Invalid image"
+        with zipfile.ZipFile(zip_path) as zf:
+            entries = []
+            for info in zf.infolist():
+                parts = [p for p in info.filename.replace("\\", "/").split("/") if p]
+                if info.is_dir() or not parts or parts[0] == "__MACOSX" or parts[-1].startswith("."):
+                    continue
+                owner = ma_sv if ma_sv else (parts[-2] if len(parts) >= 2 else None)
+                entries.append((info, owner, parts[-1]))
+            
+            owners = {owner for _, owner, _ in entries if owner and MA_SV_PATTERN.match(owner)}
+            known = known_students(sorted(owners)) if known_students else owners
+            
+            for info, owner, name in entries:
+                summary["entries"] += 1
+                error = None
+                if owner is None:
+                    error = "Không xác định được MaSV (cần thư mục <MaSV>/ hoặc tham số ma_sv)"
+                elif owner not in known:
+                    error = f"Sinh viên {owner} không tồn tại"
+                elif info.file_size > MAX_IMAGE_BYTES:
+                    error = f"Ảnh lớn hơn {MAX_IMAGE_BYTES // (1024 * 1024)}MB"
+                
+                if error is None:
+                    # Đọc giới hạn: header ZIP có thể khai sai kích thước
+                    with zf.open(info) as f:
+                        data = f.read(MAX_IMAGE_BYTES + 1)
+                    if len(data) > MAX_IMAGE_BYTES:
+                        error = f"Ảnh lớn hơn {MAX_IMAGE_BYTES // (1024 * 1024)}MB"
+                    else:
+                        status, result = self.store_training_image(owner, data, name, near_duplicates)
+                        if status == "invalid":
+                            error = result
+                        else:
+                            summary[status] += 1
+                            if status == "saved":
+                                new_files.setdefault(owner, []).append(os.path.basename(result))
+                
+                if error:
+                    summary["skipped"] += 1
+                    errors.append({"entry": info.filename, "ma_sv": owner, "error": error})
         
-        cv2.imwrite(filepath, img)
-        return filepath, None
+        return {"summary": summary, "new_files": new_files, "errors": errors}
     
     def get_training_images(self, ma_sv: str):
         """Lấy danh sách ảnh training của sinh viên"""
         student_dir = os.path.join(self.base_dir, ma_sv)
         
-        if not os.path.exists(student_dir):
-            return []
-        
-        images = []
-        for filename in os.listdir(student_dir):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                filepath = os.path.join(student_dir, filename)
-                images.append({
+        with self._lock:
+            images = self._manifest(ma_sv)["images"]
+            return [
+                {
                     "filename": filename,
-                    "path": filepath,
-                    "size": os.path.getsize(filepath)
-                })
-        
-        return images
+                    "path": os.path.join(student_dir, filename),
+                    "size": entry["size"],
+                    "mtime": entry["mtime"] // 1_000_000_000,
+                    "near_duplicate_of": entry.get("near_duplicate_of")
+                }
+                for filename, entry in sorted(images.items())
+            ]
     
     def delete_training_image(self, ma_sv: str, filename: str):
         """Xóa ảnh training"""
-        filepath = os.path.join(self.base_dir, ma_sv, filename)
-        
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            return True
-        return False
+        with self._lock:
+            manifest = self._manifest(ma_sv)
+            if filename not in manifest["images"]:
+                return False
+            
+            os.remove(os.path.join(self.base_dir, ma_sv, filename))
+            del manifest["images"][filename]
+            # Ảnh gần trùng với ảnh vừa xoá trở thành ảnh bình thường
+            for entry in manifest["images"].values():
+                if entry.get("near_duplicate_of") == filename:
+                    del entry["near_duplicate_of"]
+            self._touch_manifest(ma_sv, manifest)
+        
+        self.thumbnails.remove(ma_sv, filename)
+        return True
     
     def delete_all_training_images(self, ma_sv: str):
         """Xóa tất cả ảnh training của sinh viên"""
         student_dir = os.path.join(self.base_dir, ma_sv)
         
+        with self._lock:
+            self._manifests.pop(ma_sv, None)
+            if os.path.exists(self._manifest_path(ma_sv)):
+                os.remove(self._manifest_path(ma_sv))
+        self.thumbnails.remove(ma_sv)
+        
         if os.path.exists(student_dir):
             shutil.rmtree(student_dir)
             return True
         return False
     
-    def crop_faces_for_student(self, ma_sv: str):
-        """Crop faces cho một sinh viên"""
+    def crop_faces_for_student(self, ma_sv: str, filenames=None):
+        """Crop faces cho một sinh viên (filenames: chỉ crop các ảnh này - training tăng dần)"""
         input_dir = os.path.join(self.base_dir, ma_sv)
         output_dir = os.path.join(self.cropped_dir, ma_sv)
         
@@ -96,8 +355,12 @@ class FaceTrainingManager:
         cropped_count = 0
         errors = []
         
-        for filename in os.listdir(input_dir):
-            if not filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+        # Ảnh bị đánh dấu gần trùng không thêm thông tin -> không tốn YOLO / FaceNet
+        with self._lock:
+            flagged = {f for f, e in self._manifest(ma_sv)["images"].items() if e.get("near_duplicate_of")}
+        
+        for filename in (filenames if filenames is not None else os.listdir(input_dir)):
+            if not filename.lower().endswith(('.jpg', '.jpeg', '.png')) or filename in flagged:
                 continue
             
             img_path = os.path.join(input_dir, filename)
@@ -109,25 +372,23 @@ class FaceTrainingManager:
             
             # Detect face with YOLO
             try:
-                results = yolo_model(img, verbose=False)
+                boxes = get_detector("enrollment", yolo_model).detect(img)
                 
-                if len(results[0].boxes) == 0:
+                if not boxes:
                     errors.append(f"No face detected in {filename}")
                     continue
                 
-                # Crop first detected face
-                box = results[0].boxes.xyxy[0].cpu().numpy()
-                x1, y1, x2, y2 = map(int, box)
-                
-                # Add margin
-                h, w = img.shape[:2]
-                margin = 20
-                x1 = max(0, x1 - margin)
-                y1 = max(0, y1 - margin)
-                x2 = min(w, x2 + margin)
-                y2 = min(h, y2 + margin)
+                # Crop first detected face (add margin)
+                x1, y1, x2, y2 = expand_box(boxes[0], img.shape, 20)
                 
                 face = img[y1:y2, x1:x2]
+                
+                # Quality gate: không đưa crop mờ / tối / nghiêng vào embedding trung bình
+                quality = score_faces([face])[0]
+                if not quality.ok:
+                    errors.append(f"{filename}: {quality.message} ({quality.reason})")
+                    continue
+                
                 face_resized = cv2.resize(face, (160, 160))
                 
                 output_path = os.path.join(output_dir, filename)
@@ -146,7 +407,7 @@ class FaceTrainingManager:
         if not os.path.exists(cropped_dir):
             return None, "No cropped faces found. Run crop first."
         
-        embeddings = []
+        faces = []
         
         for filename in os.listdir(cropped_dir):
             if not filename.lower().endswith(('.jpg', '.jpeg', '.png')):
@@ -158,25 +419,16 @@ class FaceTrainingManager:
             if img is None:
                 continue
             
-            # Convert BGR to RGB
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img_resized = cv2.resize(img_rgb, (160, 160))
-            
-            # Convert to tensor
-            img_tensor = torch.from_numpy(img_resized).permute(2, 0, 1).float()
-            img_tensor = img_tensor.unsqueeze(0) / 255.0
-            
-            # Extract embedding
-            with torch.no_grad():
-                emb = facenet_model(img_tensor).cpu().numpy()
-            
-            embeddings.append(emb)
+            faces.append(img)
         
-        if len(embeddings) == 0:
+        if len(faces) == 0:
             return None, "No valid embeddings extracted"
         
-        # Average all embeddings
-        avg_embedding = np.mean(embeddings, axis=0)
+        # Extract embeddings theo batch
+        embeddings = embed_faces(facenet_model, faces)
+        
+        # Average all embeddings (giữ shape (1, 512) như face_db.pkl cũ)
+        avg_embedding = np.mean(embeddings, axis=0, keepdims=True)
         
         return avg_embedding, None
     
@@ -203,20 +455,82 @@ class FaceTrainingManager:
             }
         
         # Step 3: Update face database
-        face_db = {}
-        if os.path.exists(self.model_path):
-            with open(self.model_path, "rb") as f:
-                face_db = pickle.load(f)
+        face_db = self.update_face_database({ma_sv: embedding})
         
-        face_db[ma_sv] = embedding
+        return {
+            "success": True,
+            "message": "Training completed successfully",
+            "cropped_count": cropped_count,
+            "embedding_shape": embedding.shape,
+            "total_identities": len(face_db)
+        }
+    
+    def update_face_database(self, embeddings: dict):
+        """Ghi embedding mới của nhiều sinh viên vào face_db.pkl trong một lần ghi"""
+        with self._lock:
+            face_db = {}
+            if os.path.exists(self.model_path):
+                with open(self.model_path, "rb") as f:
+                    face_db = pickle.load(f)
+            
+            face_db.update(embeddings)
+            
+            with open(self.model_path, "wb") as f:
+                pickle.dump(face_db, f)
+        return face_db
+    
+    def train_students(self, new_files: dict):
+        """Training tăng dần sau upload hàng loạt: new_files = MaSV -> [ảnh mới].
+        
+        Chỉ detect + crop ảnh mới (crop cũ giữ nguyên), embedding tính lại từ toàn bộ
+        crop của sinh viên, face_db.pkl được ghi một lần cho cả lô.
+        """
+        embeddings = {}
+        results = {}
+        for ma_sv, filenames in new_files.items():
+            cropped_count, crop_errors = self.crop_faces_for_student(ma_sv, filenames)
+            embedding, emb_error = self.extract_embeddings_for_student(ma_sv)
+            if embedding is None:
+                results[ma_sv] = {"success": False, "message": emb_error, "errors": crop_errors}
+                continue
+            embeddings[ma_sv] = embedding
+            results[ma_sv] = {"success": True, "cropped_count": cropped_count, "errors": crop_errors}
         
-        with open(self.model_path, "wb") as f:
-            pickle.dump(face_db, f)
+        if embeddings:
+            self.update_face_database(embeddings)
+        return results
+    
+    def enroll_faces(self, ma_sv: str, faces, contexts, prefix: str = "video"):
+        """Training từ các crop đã chọn sẵn (vd từ video): ghi ảnh vào dataset_raw +
+        dataset_cropped rồi cập nhật embedding, không chạy lại detector."""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_dir = os.path.join(self.cropped_dir, ma_sv)
+        os.makedirs(output_dir, exist_ok=True)
+        
+        saved = 0
+        for i, (face, context) in enumerate(zip(faces, contexts)):
+            ok, encoded = cv2.imencode(".jpg", context, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            if not ok:
+                continue
+            # Crop đã được chọn đa dạng theo embedding -> không kiểm tra gần trùng lần nữa
+            status, filepath = self.store_training_image(ma_sv, encoded.tobytes(), f"{prefix}_{timestamp}_{i}", "off")
+            if status != "saved":
+                continue
+            cv2.imwrite(os.path.join(output_dir, os.path.basename(filepath)), cv2.resize(face, (160, 160)))
+            saved += 1
+        
+        if saved == 0:
+            return {"success": False, "message": "No faces could be saved"}
         
+        embedding, emb_error = self.extract_embeddings_for_student(ma_sv)
+        if embedding is None:
+            return {"success": False, "message": emb_error, "cropped_count": saved}
+        
+        face_db = self.update_face_database({ma_sv: embedding})
         return {
             "success": True,
             "message": "Training completed successfully",
-            "cropped_count": cropped_count,
+            "cropped_count": saved,
             "embedding_shape": embedding.shape,
             "total_identities": len(face_db)
         }
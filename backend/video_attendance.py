@@ -0,0 +1,278 @@
+"""
+Điểm danh offline từ video bài giảng đã ghi
+
+    - Lấy mẫu frame thích ứng: đoạn tĩnh thì giãn bước nhảy, có thay đổi thì dày lại
+      (frame bị bỏ chỉ grab(), không decode); đoạn tĩnh vẫn có keyframe mỗi max_stride
+      frame vì sinh viên ngồi yên cũng phải được đếm đủ min_hits
+    - Detect bằng detector "video" (detection.get_detector: weights mặt, imgsz, conf)
+      + quality gate như các entry point khác
+    - Chia video thành các đoạn, mỗi worker process xử lý một đoạn với batch YOLO + FaceNet
+    - Gom bằng chứng theo từng identity trên toàn video
+    - Ghi một lô DiemDanh (NguonQuet = 'Video') cho sinh viên thuộc lớp của buổi học
+"""
+
+import multiprocessing
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+NGUON_QUET_VIDEO = "Video"
+FACE_DB_PATH = "models/face_db.pkl"
+FACE_WEIGHTS = "yolov8n-face.pt"     # như kiosk / run_cameras; yolov8n.pt (COCO) detect cả người, bàn ghế
+
+class VideoOptions:
+    def __init__(self, min_stride=5, max_stride=60, diff_threshold=4.0,
+                 detect_batch=8, match_threshold=0.65,
+                 min_hits=3, min_face_size=40, weights=FACE_WEIGHTS):
+        self.min_stride = min_stride            # bước nhảy (frame) khi có chuyển động
+        self.max_stride = max_stride            # bước nhảy tối đa ở đoạn tĩnh = chu kỳ keyframe
+        self.diff_threshold = diff_threshold    # mean abs diff (0-255) trên ảnh thu nhỏ
+        self.detect_batch = detect_batch        # conf: DETECT_CONF["video"] / env DETECT_CONF_VIDEO
+        self.match_threshold = match_threshold
+        self.min_hits = min_hits                # số lần khớp tối thiểu để công nhận có mặt
+        self.min_face_size = min_face_size
+        self.weights = weights
+
+# ==================== SAMPLING ====================
+
+def _thumbnail(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+def sample_frames(cap, start, end, options):
+    """Sinh (frame_index, frame) trong [start, end) với bước nhảy thích ứng,
+    ít nhất một frame mỗi max_stride frame kể cả khi video tĩnh"""
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    index = start
+    stride = options.min_stride
+    last_thumb = None
+    last_yield = None
+
+    while index < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        thumb = _thumbnail(frame)
+        if last_thumb is None or np.abs(thumb - last_thumb).mean() >= options.diff_threshold:
+            stride = options.min_stride
+            last_yield = index
+            yield index, frame
+        else:
+            stride = min(stride * 2, options.max_stride)
+            if index - last_yield >= options.max_stride:
+                # Keyframe định kỳ ở đoạn tĩnh
+                last_yield = index
+                yield index, frame
+        last_thumb = thumb
+
+        # Bỏ qua frame ở giữa bằng grab() (không decode), không vượt quá keyframe kế tiếp
+        skip = min(stride, end - index, last_yield + options.max_stride - index) - 1
+        for _ in range(skip):
+            if not cap.grab():
+                return
+        index += skip + 1
+
+# ==================== WORKER ====================
+
+_worker = {}
+
+def _init_worker(options, threads):
+    import torch
+    from detection import get_detector
+    from model_registry import get_facenet, get_yolo
+
+    torch.set_num_threads(threads)
+    _worker["detector"] = get_detector("video", get_yolo(options.weights, priority="bulk"))
+    _worker["facenet"] = get_facenet(priority="bulk")
+    _worker["gallery"] = load_gallery()
+
+def load_gallery(path=FACE_DB_PATH):
+    """face_db.pkl -> (names, ma trận embedding đã chuẩn hóa L2)"""
+    if not os.path.exists(path):
+        return [], np.empty((0, 512), dtype=np.float32)
+
+    with open(path, "rb") as f:
+        face_db = pickle.load(f)
+
+    names = list(face_db.keys())
+    matrix = np.stack([np.asarray(face_db[n], dtype=np.float32).reshape(-1) for n in names]) \
+        if names else np.empty((0, 512), dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return names, matrix
+
+def _detect_and_match(frames, options, evidence, fps):
+    from face_quality import QualityThresholds, score_faces
+    from preprocessing import embed_faces
+
+    detector, facenet = _worker["detector"], _worker["facenet"]
+    names, gallery = _worker["gallery"]
+
+    crops, timestamps = [], []
+    for (index, frame), boxes in zip(frames, detector.detect_batch([f for _, f in frames])):
+        for x1, y1, x2, y2 in boxes:
+            crops.append(frame[y1:y2, x1:x2])
+            timestamps.append(index / fps)
+
+    # Quality gate: bỏ crop quá nhỏ / mờ / quá tối / quá sáng trước FaceNet
+    qualities = score_faces(crops, QualityThresholds(min_size=options.min_face_size))
+    keep = [i for i, q in enumerate(qualities) if q.ok]
+    crops, timestamps = [crops[i] for i in keep], [timestamps[i] for i in keep]
+
+    if not crops or not names:
+        return len(crops)
+
+    embeddings = embed_faces(facenet, crops)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    scores = embeddings @ gallery.T
+    best = scores.argmax(axis=1)
+
+    for i, j in enumerate(best):
+        score = float(scores[i, j])
+        if score < options.match_threshold:
+            continue
+        ts = timestamps[i]
+        e = evidence.setdefault(names[j], {"hits": 0, "best_score": 0.0, "first_seen": ts, "last_seen": ts})
+        e["hits"] += 1
+        e["best_score"] = max(e["best_score"], score)
+        e["first_seen"] = min(e["first_seen"], ts)
+        e["last_seen"] = max(e["last_seen"], ts)
+
+    return len(crops)
+
+def _process_segment(path, start, end, options):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+
+    evidence = {}
+    sampled = faces = 0
+    batch = []
+
+    for index, frame in sample_frames(cap, start, end, options):
+        sampled += 1
+        batch.append((index, frame))
+        if len(batch) >= options.detect_batch:
+            faces += _detect_and_match(batch, options, evidence, fps)
+            batch = []
+
+    if batch:
+        faces += _detect_and_match(batch, options, evidence, fps)
+
+    cap.release()
+    return {"evidence": evidence, "sampled": sampled, "faces": faces}
+
+# ==================== AGGREGATE ====================
+
+def merge_evidence(parts):
+    merged = {}
+    for part in parts:
+        for ma_sv, e in part.items():
+            m = merged.get(ma_sv)
+            if m is None:
+                merged[ma_sv] = dict(e)
+                continue
+            m["hits"] += e["hits"]
+            m["best_score"] = max(m["best_score"], e["best_score"])
+            m["first_seen"] = min(m["first_seen"], e["first_seen"])
+            m["last_seen"] = max(m["last_seen"], e["last_seen"])
+    return merged
+
+def analyze_video(path, options=None, workers=None):
+    """Chạy nhận diện trên toàn video, trả về bằng chứng theo identity + thống kê"""
+    options = options or VideoOptions()
+    workers = workers or max(1, min(4, (os.cpu_count() or 2) // 2))
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+
+    if total_frames <= 0:
+        raise ValueError("Video has no frames")
+
+    workers = min(workers, max(1, total_frames // (options.max_stride * 4)))
+    bounds = np.linspace(0, total_frames, workers + 1).astype(int)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    started = time.time()
+    # spawn: fork từ process FastAPI (torch / OpenMP đã khởi tạo, nhiều thread nền) dễ deadlock,
+    # _init_worker tự nạp model + gallery cho mỗi worker
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options, threads),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(_process_segment, path, int(bounds[i]), int(bounds[i + 1]), options)
+            for i in range(workers)
+        ]
+        results = [f.result() for f in futures]
+    elapsed = time.time() - started
+
+    duration = total_frames / fps
+    return {
+        "evidence": merge_evidence([r["evidence"] for r in results]),
+        "stats": {
+            "frames": total_frames,
+            "duration_s": round(duration, 1),
+            "sampled_frames": sum(r["sampled"] for r in results),
+            "faces": sum(r["faces"] for r in results),
+            "workers": workers,
+            "elapsed_s": round(elapsed, 1),
+            "speedup_vs_realtime": round(duration / elapsed, 2) if elapsed > 0 else None,
+        },
+    }
+
+def process_lecture_video(path, ma_buoi, options=None, workers=None, video_start=None, dry_run=False):
+    """Điểm danh cho buổi học `ma_buoi` từ file video.
+
+    video_start: thời điểm bắt đầu ghi hình (datetime). Nếu có, ThoiGianQuet là
+    thời điểm xuất hiện đầu tiên và trạng thái được tính theo giờ bắt đầu buổi học;
+    nếu không, ghi 'Có mặt' với thời gian xử lý.
+    """
+    from database.attendance_service import get_class_roster, get_session, ghi_diem_danh_batch
+
+    options = options or VideoOptions()
+    session = get_session(ma_buoi)
+    if session is None:
+        return {"success": False, "message": "Không tìm thấy buổi học"}
+
+    analysis = analyze_video(path, options, workers)
+    roster = get_class_roster(session["MaLHP"])
+
+    present, not_enrolled, weak = [], [], []
+    records = []
+    for ma_sv, e in sorted(analysis["evidence"].items()):
+        if e["hits"] < options.min_hits:
+            weak.append(ma_sv)
+            continue
+        if ma_sv not in roster:
+            not_enrolled.append(ma_sv)
+            continue
+
+        if video_start is not None:
+            thoi_gian = video_start + timedelta(seconds=e["first_seen"])
+            trang_thai = "Đúng giờ" if thoi_gian.time() <= session["GioBatDau"] else "Trễ"
+        else:
+            thoi_gian = datetime.now()
+            trang_thai = "Có mặt"
+
+        present.append({"ma_sv": ma_sv, "trang_thai": trang_thai, **e})
+        records.append((ma_sv, thoi_gian, trang_thai))
+
+    inserted = [] if dry_run else ghi_diem_danh_batch(ma_buoi, records, NGUON_QUET_VIDEO)
+
+    return {
+        "success": True,
+        "ma_buoi": ma_buoi,
+        "present": present,
+        "inserted": inserted,
+        "already_checked_in": [r[0] for r in records if r[0] not in inserted] if not dry_run else [],
+        "not_enrolled": not_enrolled,
+        "insufficient_evidence": weak,
+        "stats": analysis["stats"],
+    }
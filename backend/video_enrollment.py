@@ -0,0 +1,121 @@
+"""
+Đăng ký khuôn mặt từ một đoạn video ngắn (thay cho upload 5+ ảnh rời)
+
+    - Decode dạng stream với lấy mẫu thích ứng (sample_frames): frame gần giống
+      frame trước bị bỏ bằng grab(), không chạy YOLO trên frame thừa
+    - Mỗi frame lấy mẫu: detect một mặt chính, crop, lọc theo face_quality
+    - Embed toàn bộ ứng viên trong một batch FaceNet, bỏ crop không cùng người
+    - Chọn tối đa `max_faces` crop đa dạng góc mặt: farthest-point theo khoảng cách
+      cosine giữa embedding, ưu tiên crop chất lượng cao
+"""
+
+import cv2
+import numpy as np
+
+from detection import get_detector, expand_box
+from face_quality import score_faces
+from preprocessing import embed_faces
+from video_attendance import VideoOptions, sample_frames
+
+MAX_CLIP_SECONDS = 15
+MAX_CANDIDATES = 48
+CROP_MARGIN = 20                # giống crop_faces_for_student
+CONSISTENCY_THRESHOLD = 0.5     # cosine tối thiểu với embedding trung bình (loại người khác lọt khung)
+MIN_DIVERSITY = 0.05            # khoảng cách cosine tối thiểu tới các crop đã chọn
+
+class EnrollmentOptions:
+    def __init__(self, max_faces=8, min_faces=3, max_seconds=MAX_CLIP_SECONDS):
+        self.max_faces = max_faces
+        self.min_faces = min_faces
+        self.max_seconds = max_seconds
+        # Lấy mẫu dày hơn video bài giảng: clip ngắn, người quay đầu chậm
+        self.sampling = VideoOptions(min_stride=2, max_stride=12, diff_threshold=2.0)
+
+
+def collect_candidates(path, yolo_model, options):
+    """Duyệt clip, trả về (list (face, context, quality), số frame đã lấy mẫu, tổng số frame)"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or int(fps * options.max_seconds)
+    end = min(total, int(fps * options.max_seconds))
+
+    detector = get_detector("enrollment", yolo_model)
+    candidates = []
+    sampled = 0
+
+    try:
+        for _, frame in sample_frames(cap, 0, end, options.sampling):
+            sampled += 1
+            boxes = detector.detect(frame)
+            if not boxes:
+                continue
+
+            x1, y1, x2, y2 = expand_box(boxes[0], frame.shape, CROP_MARGIN)
+            face = frame[y1:y2, x1:x2]
+            quality = score_faces([face])[0]
+            if not quality.ok:
+                continue
+
+            # Ảnh gốc lưu vào dataset_raw: vùng rộng quanh mặt thay vì cả frame (bộ nhớ nhỏ, vẫn crop lại được)
+            half = max(x2 - x1, y2 - y1) // 2
+            cx1, cy1, cx2, cy2 = expand_box((x1, y1, x2, y2), frame.shape, half)
+            candidates.append((face.copy(), frame[cy1:cy2, cx1:cx2].copy(), quality))
+
+            # Giữ MAX_CANDIDATES crop tốt nhất
+            if len(candidates) > MAX_CANDIDATES:
+                candidates.remove(min(candidates, key=lambda c: c[2].score))
+    finally:
+        cap.release()
+
+    return candidates, sampled, end
+
+def select_diverse(embeddings, scores, max_faces):
+    """Index các crop được chọn: bắt đầu từ crop tốt nhất, mỗi bước lấy crop xa
+    nhất (cosine) so với tập đã chọn, nhân trọng số chất lượng."""
+    selected = [int(np.argmax(scores))]
+    min_dist = 1.0 - embeddings @ embeddings[selected[0]]
+
+    while len(selected) < max_faces:
+        gain = min_dist * (0.5 + 0.5 * scores)
+        gain[selected] = -1
+        best = int(np.argmax(gain))
+        if min_dist[best] < MIN_DIVERSITY:
+            break
+        selected.append(best)
+        min_dist = np.minimum(min_dist, 1.0 - embeddings @ embeddings[best])
+
+    return selected
+
+def select_enrollment_faces(path, yolo_model, facenet_model, options=None):
+    """Trả về dict: faces (crop), contexts (ảnh rộng), qualities, stats"""
+    options = options or EnrollmentOptions()
+    candidates, sampled, frames = collect_candidates(path, yolo_model, options)
+    stats = {"frames": frames, "sampled": sampled, "candidates": len(candidates)}
+
+    if not candidates:
+        return {"faces": [], "contexts": [], "qualities": [], "stats": stats}
+
+    faces = [c[0] for c in candidates]
+    embeddings = embed_faces(facenet_model, faces)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    scores = np.array([c[2].score for c in candidates], dtype=np.float32)
+
+    # Loại crop không cùng người với đa số (người đi ngang qua khung hình)
+    center = embeddings.mean(axis=0)
+    center /= max(np.linalg.norm(center), 1e-12)
+    consistent = np.flatnonzero(embeddings @ center >= CONSISTENCY_THRESHOLD)
+    stats["inconsistent"] = len(candidates) - len(consistent)
+
+    chosen = []
+    if len(consistent):
+        chosen = consistent[select_diverse(embeddings[consistent], scores[consistent], options.max_faces)]
+    stats["selected"] = len(chosen)
+
+    return {
+        "faces": [faces[i] for i in chosen],
+        "contexts": [candidates[i][1] for i in chosen],
+        "qualities": [candidates[i][2] for i in chosen],
+        "stats": stats
+    }
@@ -35,11 +35,14 @@ import {
   Verified as VerifiedIcon,
 } from '@mui/icons-material';
 import axios from 'axios';
+import { CameraWebSocket } from '../services/api';
 
 const API_URL = 'http://localhost:8000';
 
 function EnhancedAttendanceCamera() {
   const webcamRef = useRef(null);
+  const socketRef = useRef(null);
+  const frameIdRef = useRef(0);
   const [isCapturing, setIsCapturing] = useState(false);
   const [sessions, setSessions] = useState([]);
   const [selectedSession, setSelectedSession] = useState('');
@@ -60,17 +63,55 @@ function EnhancedAttendanceCamera() {
     fetchTodaySessions();
   }, []);
 
+  // Feed SSE: snapshot khi kết nối, sau đó mỗi lượt điểm danh là một event
   useEffect(() => {
-    if (selectedSession) {
-      fetchSessionAttendance();
-    }
+    if (!selectedSession) return undefined;
+
+    const source = new EventSource(`${API_URL}/api/attendance/session/${selectedSession}/stream`);
+    source.addEventListener('snapshot', (e) => setRecentAttendance(JSON.parse(e.data)));
+    source.addEventListener('checkin', (e) => {
+      const record = JSON.parse(e.data);
+      setRecentAttendance((prev) => (
+        prev.some(r => r.ma_diem_danh === record.ma_diem_danh) ? prev : [record, ...prev]
+      ));
+    });
+    source.onerror = () => console.error('Attendance feed disconnected, retrying...');
+
+    return () => source.close();
   }, [selectedSession]);
 
+  useEffect(() => {
+    setSessionStats({
+      total: recentAttendance.length,
+      onTime: recentAttendance.filter(r => r.trang_thai === 'Đúng giờ').length,
+      late: recentAttendance.filter(r => r.trang_thai === 'Trễ').length,
+    });
+  }, [recentAttendance]);
+
+  // Kênh WebSocket nhị phân: nhận diện + điểm danh trên cùng kết nối
+  useEffect(() => {
+    if (!isCapturing) return undefined;
+
+    const socket = new CameraWebSocket(handleSocketEvent, (err) => console.error('WebSocket error:', err));
+    socket.connect();
+    socketRef.current = socket;
+
+    return () => {
+      socket.disconnect();
+      socketRef.current = null;
+    };
+  }, [isCapturing]);
+
   useEffect(() => {
     let intervalId;
     if (isCapturing && autoCapture) {
       intervalId = setInterval(() => {
-        captureAndRecognize();
+        // Ưu tiên WebSocket, fallback HTTP khi chưa kết nối được
+        if (socketRef.current?.isConnected()) {
+          sendFrameOverSocket();
+        } else {
+          captureAndRecognize();
+        }
       }, captureInterval);
     }
     return () => {
@@ -90,25 +131,31 @@ function EnhancedAttendanceCamera() {
     }
   };
 
-  const fetchSessionAttendance = async () => {
-    try {
-      const response = await axios.get(`${API_URL}/api/attendance/session/${selectedSession}`);
-      setRecentAttendance(response.data);
-      
-      // Calculate stats
-      const onTime = response.data.filter(r => r.trang_thai === 'Đúng giờ').length;
-      const late = response.data.filter(r => r.trang_thai === 'Trễ').length;
-      
-      setSessionStats({
-        total: response.data.length,
-        onTime: onTime,
-        late: late,
-      });
-    } catch (err) {
-      console.error('Error fetching attendance:', err);
+  const handleSocketEvent = (event) => {
+    if (event.type === 'recognition') {
+      setRecognitionResult(event);
+    } else if (event.type === 'checkin') {
+      if (event.success) {
+        setSuccess(`✅ ${event.ho_ten} - ${event.trang_thai}`);
+        setTimeout(() => setSuccess(null), 3000);
+      } else {
+        setError(event.message);
+      }
     }
   };
 
+  const sendFrameOverSocket = () => {
+    const canvas = webcamRef.current?.getCanvas();
+    if (!canvas) return;
+
+    // JPEG trực tiếp từ canvas, không qua base64
+    canvas.toBlob((blob) => {
+      if (!blob || !socketRef.current) return;
+      frameIdRef.current += 1;
+      socketRef.current.sendFrame(blob, selectedSession, frameIdRef.current);
+    }, 'image/jpeg', 0.9);
+  };
+
   const captureAndRecognize = async () => {
     const imageSrc = webcamRef.current?.getScreenshot();
     if (!imageSrc) return;
@@ -121,54 +168,37 @@ function EnhancedAttendanceCamera() {
       const blob = await fetch(imageSrc).then(r => r.blob());
       const file = new File([blob], 'capture.jpg', { type: 'image/jpeg' });
 
-      // Call recognition API
       const formData = new FormData();
       formData.append('file', file);
 
-      const response = await axios.post(`${API_URL}/api/recognize`, formData);
-      const result = response.data;
-
-      setRecognitionResult(result);
-
-      // If recognized successfully, auto check-in
-      if (result.success && selectedSession) {
-        try {
-          const checkinResponse = await axios.post(
-            `${API_URL}/api/attendance/checkin`,
-            null,
-            {
-              params: {
-                ma_sv: result.student_info.ma_sv,
-                ma_buoi: selectedSession,
-              },
-            }
-          );
-
-          if (checkinResponse.data.success) {
-            setSuccess(`✅ ${result.student_info.ho_ten} - ${checkinResponse.data.trang_thai}`);
-            fetchSessionAttendance();
-            
-            // Clear success after 3s
-            setTimeout(() => setSuccess(null), 3000);
-          } else {
-            setError(checkinResponse.data.message);
-          }
-        } catch (err) {
-          if (err.response?.data?.detail) {
-            // Already checked in - silent fail
-            console.log('Already checked in');
-          } else {
-            setError('Lỗi khi điểm danh');
-          }
-        }
-      } else if (!result.success) {
-        // Show why recognition failed
-        if (result.confidence > 0) {
+      if (selectedSession) {
+        // Nhận diện + điểm danh trong một request
+        formData.append('ma_buoi', selectedSession);
+        const response = await axios.post(`${API_URL}/api/attendance/recognize-checkin`, formData);
+        const result = response.data;
+
+        setRecognitionResult(result);
+
+        if (result.status === 'checked_in') {
+          setSuccess(`✅ ${result.student_info.ho_ten} - ${result.trang_thai}`);
+          setTimeout(() => setSuccess(null), 3000);
+        } else if (result.status === 'already_checked_in') {
+          // Already checked in - silent
+          console.log('Already checked in');
+        } else if (result.status === 'wrong_class' || result.status === 'rejected') {
+          setError(result.message);
+          setTimeout(() => setError(null), 2000);
+        } else if (result.confidence > 0) {
           setError(`Độ tin cậy thấp (${(result.confidence * 100).toFixed(1)}%). Hãy đưa mặt gần camera hơn.`);
+          setTimeout(() => setError(null), 2000);
         } else {
           setError('Không phát hiện khuôn mặt. Hãy nhìn thẳng vào camera.');
+          setTimeout(() => setError(null), 2000);
         }
-        setTimeout(() => setError(null), 2000);
+      } else {
+        // Chỉ nhận diện (chưa chọn buổi học)
+        const response = await axios.post(`${API_URL}/api/recognize`, formData);
+        setRecognitionResult(response.data);
       }
     } catch (err) {
       console.error('Recognition error:', err);
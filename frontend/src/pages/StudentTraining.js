@@ -41,6 +41,7 @@ import {
   Close as CloseIcon,
   Info as InfoIcon,
   PhotoCamera as PhotoIcon,
+  Videocam as VideoIcon,
 } from '@mui/icons-material';
 import axios from 'axios';
 
@@ -68,6 +69,7 @@ function StudentTraining() {
   const navigate = useNavigate();
   const webcamRef = useRef(null);
   const fileInputRef = useRef(null);
+  const videoInputRef = useRef(null);
   
   // States
   const [student, setStudent] = useState(null);
@@ -158,7 +160,14 @@ function StudentTraining() {
       const formData = new FormData();
       formData.append('file', file);
 
-      await axios.post(`${API_URL}/api/training/upload-image/${maSV}`, formData);
+      const response = await axios.post(`${API_URL}/api/training/upload-image/${maSV}`, formData);
+      
+      // Ảnh gần giống ảnh trước -> server bỏ qua, nhắc đổi góc mặt
+      if (response.data.status !== 'saved') {
+        setSuccess('Ảnh gần giống ảnh đã chụp, hãy đổi góc mặt hoặc biểu cảm');
+        setTimeout(() => setSuccess(null), 1000);
+        return;
+      }
       
       setCaptureCount(prev => prev + 1);
       setSuccess(`Đã chụp ảnh thứ ${captureCount + 1}!`);
@@ -185,6 +194,7 @@ function StudentTraining() {
     setError(null);
     
     let uploadedCount = 0;
+    let duplicateCount = 0;
     let errorCount = 0;
 
     try {
@@ -192,8 +202,12 @@ function StudentTraining() {
         try {
           const formData = new FormData();
           formData.append('file', file);
-          await axios.post(`${API_URL}/api/training/upload-image/${maSV}`, formData);
-          uploadedCount++;
+          const response = await axios.post(`${API_URL}/api/training/upload-image/${maSV}`, formData);
+          if (response.data.status === 'saved') {
+            uploadedCount++;
+          } else {
+            duplicateCount++;
+          }
         } catch (err) {
           errorCount++;
           console.error(`Error uploading ${file.name}:`, err);
@@ -201,9 +215,12 @@ function StudentTraining() {
       }
       
       if (uploadedCount > 0) {
-        setSuccess(`Đã upload ${uploadedCount}/${files.length} ảnh thành công!`);
+        setSuccess(`Đã upload ${uploadedCount}/${files.length} ảnh thành công!` +
+          (duplicateCount > 0 ? ` (bỏ qua ${duplicateCount} ảnh trùng / gần trùng)` : ''));
         await fetchTrainingImages();
         await fetchTrainingStatus();
+      } else if (duplicateCount > 0) {
+        setSuccess(`Tất cả ${duplicateCount} ảnh đều trùng / gần trùng ảnh đã có`);
       }
       
       if (errorCount > 0) {
@@ -216,6 +233,36 @@ function StudentTraining() {
     }
   };
 
+  // Đăng ký bằng clip vài giây: server tự chọn các khuôn mặt đa dạng góc và huấn luyện luôn
+  const handleVideoEnroll = async (event) => {
+    const file = event.target.files?.[0];
+    if (!file) return;
+
+    setLoading(true);
+    setError(null);
+    setActiveStep(2);
+
+    try {
+      const formData = new FormData();
+      formData.append('file', file);
+      const response = await axios.post(`${API_URL}/api/training/enroll-video/${maSV}`, formData);
+
+      setSuccess(`✅ Đăng ký bằng video thành công! 
+          - Đã chọn ${response.data.cropped_count} khuôn mặt từ ${response.data.stats.sampled} frame
+          - Tổng ${response.data.total_identities} sinh viên trong hệ thống`);
+      setActiveStep(3);
+      await fetchTrainingImages();
+      await fetchTrainingStatus();
+    } catch (err) {
+      setError(err.response?.data?.detail || 'Lỗi khi xử lý video');
+      setActiveStep(images.length > 0 ? 1 : 0);
+      console.error('Video enrollment error:', err);
+    } finally {
+      setLoading(false);
+      event.target.value = ''; // Reset input
+    }
+  };
+
   const handleDeleteImage = async (filename) => {
     if (!window.confirm('Bạn có chắc muốn xóa ảnh này?')) return;
 
@@ -484,6 +531,27 @@ function StudentTraining() {
           />
         </Grid>
 
+        <Grid item xs={12} sm={6} md={3}>
+          <Button
+            fullWidth
+            variant="outlined"
+            startIcon={<VideoIcon />}
+            onClick={() => videoInputRef.current?.click()}
+            size="large"
+            disabled={loading}
+          >
+            Đăng ký bằng video
+          </Button>
+          <input
+            ref={videoInputRef}
+            type="file"
+            accept="video/*"
+            capture="user"
+            hidden
+            onChange={handleVideoEnroll}
+          />
+        </Grid>
+
         <Grid item xs={12} sm={6} md={3}>
           <Button
             fullWidth
@@ -633,10 +701,10 @@ function StudentTraining() {
             </Box>
           ) : (
             <ImageList cols={4} gap={12}>
-              {images.map((img, index) => (
-                <ImageListItem key={index}>
+              {images.map((img) => (
+                <ImageListItem key={img.filename}>
                   <img
-                    src={`${API_URL}/api/training/image/${maSV}/${img.filename}`}
+                    src={`${API_URL}/api/training/thumbnail/${maSV}/${img.filename}`}
                     alt={img.filename}
                     loading="lazy"
                     style={{ 
@@ -38,6 +38,19 @@ export const studentAPI = {
   update: (maSV, studentData) => apiClient.put(`/students/${maSV}`, studentData),
   
   delete: (maSV) => apiClient.delete(`/students/${maSV}`),
+
+  // Import hàng loạt sinh viên + đăng ký lớp (CSV / JSON / JSON Lines)
+  importFile: (file) => {
+    const formData = new FormData();
+    formData.append('file', file);
+
+    return apiClient.post('/students/import', formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+      timeout: 0,
+    });
+  },
 };
 
 // ==================== FACE RECOGNITION ====================
@@ -86,6 +99,23 @@ export const trainingAPI = {
     });
   },
   
+  // ZIP ảnh cho một hoặc nhiều sinh viên (<MaSV>/<ảnh>), xử lý bằng job nền
+  uploadZip: (zipFile, { maSV = null, train = false } = {}) => {
+    const formData = new FormData();
+    formData.append('file', zipFile);
+    if (maSV) formData.append('ma_sv', maSV);
+    formData.append('train', train);
+    
+    return apiClient.post('/training/upload-zip', formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+      timeout: 0,
+    });
+  },
+  
+  getZipJob: (jobId) => apiClient.get(`/training/upload-zip/jobs/${jobId}`),
+  
   getImages: (maSV) => apiClient.get(`/training/images/${maSV}`),
   
   getImage: (maSV, filename) => 
@@ -118,6 +148,13 @@ export const attendanceAPI = {
     params: { ma_sv: maSV, ma_buoi: maBuoi },
   }),
   
+  // students: [{ ma_sv, trang_thai?, thoi_gian_quet? }]
+  checkinBatch: (maBuoi, students, nguonQuet) => apiClient.post('/attendance/checkin/batch', {
+    ma_buoi: maBuoi,
+    students,
+    ...(nguonQuet ? { nguon_quet: nguonQuet } : {}),
+  }),
+  
   getSessionAttendance: (maBuoi) => 
     apiClient.get(`/attendance/session/${maBuoi}`),
   
@@ -215,7 +252,9 @@ export class CameraWebSocket {
   
   connect() {
     const wsUrl = API_BASE_URL.replace('http', 'ws').replace('/api', '');
+    this.closedByUser = false;
     this.ws = new WebSocket(`${wsUrl}/ws/camera`);
+    this.ws.binaryType = 'arraybuffer';
     
     this.ws.onopen = () => {
       console.log('WebSocket connected');
@@ -246,7 +285,7 @@ export class CameraWebSocket {
       if (this.onClose) this.onClose();
       
       // Auto reconnect
-      if (this.reconnectAttempts < this.maxReconnectAttempts) {
+      if (!this.closedByUser && this.reconnectAttempts < this.maxReconnectAttempts) {
         this.reconnectAttempts++;
         console.log(`Reconnecting... Attempt ${this.reconnectAttempts}`);
         setTimeout(() => this.connect(), this.reconnectDelay * this.reconnectAttempts);
@@ -254,10 +293,18 @@ export class CameraWebSocket {
     };
   }
   
-  sendFrame(base64Frame) {
+  // Gửi frame nhị phân: header 8 byte (MaBuoi, frameId - uint32 big-endian) + JPEG.
+  // Server chỉ xử lý frame mới nhất, frame cũ đang chờ bị bỏ khi server bận.
+  async sendFrame(jpegBlob, maBuoi = 0, frameId = 0) {
     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
       try {
-        this.ws.send(JSON.stringify({ frame: base64Frame }));
+        const jpeg = new Uint8Array(await jpegBlob.arrayBuffer());
+        const message = new Uint8Array(8 + jpeg.length);
+        const header = new DataView(message.buffer);
+        header.setUint32(0, maBuoi || 0);
+        header.setUint32(4, frameId >>> 0);
+        message.set(jpeg, 8);
+        this.ws.send(message.buffer);
       } catch (err) {
         console.error('WebSocket send error:', err);
       }
@@ -265,6 +312,7 @@ export class CameraWebSocket {
   }
   
   disconnect() {
+    this.closedByUser = true;
     if (this.ws) {
       this.ws.close();
       this.ws = null;